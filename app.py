@@ -1,34 +1,110 @@
 
+import hashlib
+import hmac
+import json
 import logging
 import os
+import random
+import threading
+import time
+from collections import OrderedDict
 import numpy as np
 import math
-from datetime import datetime
+from datetime import datetime, timezone
 from flask import Flask, request, render_template, jsonify, send_file, Response, current_app, Blueprint, redirect, url_for, flash
 from auth_db import SessionAuth, User
+from werkzeug.http import is_resource_modified
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from sqlalchemy import select, and_, text
+from sqlalchemy import select, func, and_, or_, tuple_
 from sqlalchemy.orm import joinedload
-from sqlalchemy.dialects import mysql  # For SQL logging
+from sqlalchemy.dialects import mysql  # For sampled SQL logging
 from models import (
     SessionLocal,
-    StarCatalog,
     Frame,
     Astrometry,
     CalFrameQuality,
     FrameQuality,
+    wcs_cache,
 )
-from mywcs import create_simple_wcs
-from astropy.wcs import NoConvergence
-from astropy.io import fits
-from astropy.io import fits as afits
+from mywcs import simple_tan_on_ccd, stack_wcs_pars, batch_on_ccd, batch_on_ccd_grid
+from fieldcache import FieldCentreCache
+import footprints
+import framepaths
+from searchcache import get_search_cache
+from metrics import REGISTRY, StageTimer, timed
+from lcbin import (
+    MAX_POINTS_FAST,
+    bin_lightcurve,
+    lightcurve_series_names,
+    read_lightcurve_columns,
+    read_lightcurve_window,
+)
+from diskcache import DiskCache
+from fitscutout import MAX_CUTOUT_PIX, max_cutout_arcmin, read_cutout, size_to_pixels
+from fitsstamps import stream_cube, stream_zip
+from fitsstream import open_for_stream, stream_fits, tee
+from framefiles import FITS_ROOT, SUB_ROOT, frame_candidates, frame_dir   # RED / SUB layout
+from fitsthumbs import (
+    MAX_THUMB_SIZE,
+    THUMB_SIZE,
+    cached_thumbnail,
+    render_thumbnail,
+    thumb_cache,
+)
+from lcexport import stream_archive
+from lcpaths import canonical_gaia_id, lightcurve_paths
+from lcpyramid import pyramid_cache, read_pyramid_window
+from lcpack import MIMETYPE as LC_MIMETYPE, lightcurve_columns, pack_columns
+from periodograms import cached_periodogram, periodogram_cache, preferred_series
 from io import StringIO, BytesIO
 import csv
 from astropy.table import Table
 
-# Base directory where  RED FITS sub-folders live
-FITS_ROOT = "/nfs/php2/ar3/P/HP1/REDUCTION/RED"
-SUB_ROOT = "/nfs/php2/ar3/P/HP1/REDUCTION/SUB"
+# Local copies of served .fz frames (what serve_fits streams), LRU by bytes
+FITS_CACHE_DIR   = os.environ.get(
+    "HATPI_FITS_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "fits"))
+FITS_CACHE_BYTES = int(os.environ.get("HATPI_FITS_CACHE_BYTES", str(20 * 1024**3)))
+fits_cache = DiskCache(FITS_CACHE_DIR, FITS_CACHE_BYTES, ".fits")
+
+# Default side of /fits/.../cutout when no size is given (arcmin)
+CUTOUT_SIZE_ARCMIN = float(os.environ.get("HATPI_CUTOUT_SIZE_ARCMIN", "10"))
+
+# Shared secret for the /admin/* maintenance hooks (unset → hooks disabled)
+ADMIN_TOKEN = os.environ.get("HATPI_ADMIN_TOKEN")
+
+# Star-catalog field centres, cached per worker (seconds)
+field_cache = FieldCentreCache(ttl=float(os.environ.get("HATPI_FIELD_CACHE_TTL", "3600")))
+
+# Max (IHUID, FNUM) pairs per IN (...) when querying via the footprint index
+FOOTPRINT_CHUNK = 5000
+
+# Candidate rows fetched + WCS-checked per step of a coordinate search
+SEARCH_CHUNK = int(os.environ.get("HATPI_SEARCH_CHUNK", "2000"))
+
+# Fraction of searches whose SQL is compiled with literal binds and logged
+SQL_DEBUG_SAMPLE = float(os.environ.get("HATPI_SQL_DEBUG_SAMPLE", "0"))
+
+# Larger results are streamed but not put in the search cache
+SEARCH_CACHE_MAX_ROWS = int(os.environ.get("HATPI_SEARCH_CACHE_MAX_ROWS", "100000"))
+
+# Max positions per /api/data/batch request
+BATCH_MAX_TARGETS = int(os.environ.get("HATPI_BATCH_MAX_TARGETS", "10000"))
+
+# Max Gaia IDs per /api/lightcurves/export request, and its file-read threads
+EXPORT_MAX_IDS      = int(os.environ.get("HATPI_EXPORT_MAX_IDS", "1000"))
+EXPORT_READ_THREADS = int(os.environ.get("HATPI_EXPORT_READ_THREADS", "4"))
+
+# /api/data/stamps: max frames per request, stamp side limits (pixels) and
+# the NFS read threads cutting stamps
+STAMP_MAX_FRAMES  = int(os.environ.get("HATPI_STAMP_MAX_FRAMES", "5000"))
+STAMP_DEFAULT_PIX = 32
+STAMP_MAX_PIX     = 256
+STAMP_READ_THREADS = int(os.environ.get("HATPI_STAMP_READ_THREADS", "8"))
+
+# Lazily evaluated /data result sets kept per worker for page clicks
+SEARCH_PAGE_CACHE_SIZE = int(os.environ.get("HATPI_SEARCH_PAGE_CACHE_SIZE", "64"))
+SEARCH_PAGE_TTL        = float(os.environ.get("HATPI_SEARCH_PAGE_TTL", "600"))
 
 app = Flask(__name__)
 
@@ -142,19 +218,6 @@ def paginate(seq, page, per_page):
     return seq[start:start + per_page], total_pages, page
 
 
-def query_lightcurve_path(gaia_id: str):
-    session = SessionLocal()
-    try:
-        sql = text("""
-            SELECT path_to_file
-            FROM   HPLC.stitched_lightcurve_files
-            WHERE  Gaia_DR2_ID = :gid
-            LIMIT  1
-        """)
-        return session.execute(sql, {"gid": gaia_id}).scalar()   # None if not found
-    finally:
-        session.close()
-
 # --------------------------------------------------------------------------
 #  Return (path, data_dict, meta_dict)
 #
@@ -170,157 +233,47 @@ def query_lightcurve_path(gaia_id: str):
 #
 #  “fast” is median-binned to ~ ≤ max_points_fast points; “full” is untouched.
 # --------------------------------------------------------------------------
-def load_lightcurve_arrays(
+def load_lightcurve_columns(
         gaia_id: str,
-        max_points_fast: int = 5000,
+        max_points_fast: int = MAX_POINTS_FAST,
         min_period: float = 0.1,        # d   ❶ LS lower bound
-        max_period: float = 20.0        # d   ❷ LS upper bound
+        max_period: float = 20.0,       # d   ❷ LS upper bound
+        samples_per_peak: int = 5
     ):
     """
-    Returns (path, data_dict, meta_dict)
-
-      • data_dict = {
-          "fast": {"time": [...], "series": {FITMAG0: [...], …}},
-          "full": {"time": [...], "series": {...}}
-        }
-
-      • meta_dict = {
-          "fast": {ERR0:[...], FLAG0:[...], HA:[...], Z:[...],
-                   FRAMEKEY:[...], PERIODOGRAM:{freq:[...], power:[...]},
-                   DEFAULT_PERIOD:<float>},
-          "full": {...   same keys   ...}
-        }
+    Returns (path, columns, periodogram):
+      • columns     = {"fast": (time, series, meta), "full": (time, series, meta)}
+                      as NumPy arrays ({} if the file has no time axis)
+      • periodogram = (freq, power, best_period), or None without series
+    path is None when the Gaia ID has no readable lightcurve.
     """
-    import os
-    import numpy as np
-    from astropy.io import fits
-    from astropy.timeseries import LombScargle
-    from sqlalchemy import text
-
     # ── locate stitched FITS -----------------------------------------------
-    session = SessionLocal()
-    path = session.execute(
-        text("""SELECT path_to_file
-                FROM   HPLC.stitched_lightcurve_files
-                WHERE  Gaia_DR2_ID = :gid
-                LIMIT  1"""),
-        {"gid": gaia_id}
-    ).scalar()
-    session.close()
-
+    path = lightcurve_paths.get(gaia_id)
     if path is None or not os.path.isfile(path):
-        return None, {}, {}
-
-    # ── open FITS and pull columns -----------------------------------------
-    with fits.open(path, memmap=False) as hdul:
-        tab   = hdul[1].data
-        names = [n.upper() for n in tab.names]
-
-        # --- time axis -----------------------------------------------------
-        time_col = next((c for c in ("TIME", "BTJD", "JD") if c in names), None)
-        if time_col is None:
-            return path, {}, {}
-
-        time_full = tab[time_col].astype(float).tolist()
-
-        # --- build full-resolution series & meta --------------------------
-        series_full, meta_full = {}, {}
-
-        for base in ("FITMAG", "EPD", "TFA"):
-            for i in range(3):
-                mag_key = f"{base}{i}"
-                if mag_key in names:
-                    series_full[mag_key] = tab[mag_key].astype(float).tolist()
-
-                    err_key  = f"ERR{i}"
-                    flag_key = f"FLAG{i}"
-                    meta_full[err_key]  = (tab[err_key ].astype(float).tolist()
-                                           if err_key  in names else None)
-                    meta_full[flag_key] = (tab[flag_key].astype(int  ).tolist()
-                                           if flag_key in names else None)
-
-        for col in ("HA", "Z", "FRAMEKEY"):
-            if col in names:
-                meta_full[col] = tab[col].tolist()
-
-    # ── helper: numeric median-bin -----------------------------------------
-    def median_bin(arr, step):
-        return [float(np.median(arr[i:i+step]))
-                for i in range(0, len(arr), step)]
-
-    # ── create FAST (binned) copies ----------------------------------------
-    if len(time_full) > max_points_fast:
-        step = int(np.ceil(len(time_full) / max_points_fast))
-        time_fast   = [float(np.mean(time_full[i:i+step]))
-                       for i in range(0, len(time_full), step)]
-        series_fast = {k: median_bin(v, step) for k, v in series_full.items()}
-
-        meta_fast = {}
-        for k, arr in meta_full.items():
-            if arr is None:
-                meta_fast[k] = None
-                continue
-            try:
-                float(arr[0])
-                meta_fast[k] = median_bin(arr, step)
-            except Exception:
-                meta_fast[k] = arr
-    else:
-        time_fast   = time_full
-        series_fast = series_full
-        meta_fast   = meta_full
-
-    # ── Lomb-Scargle on FAST data ------------------------------------------
-    if series_fast:
-        # choose trend-filtered if present, else first series
-        pref_key = "TFA0" if "TFA0" in series_fast else next(iter(series_fast))
-        t_arr = np.asarray(time_fast)
-        y_arr = np.asarray(series_fast[pref_key])
-
-        ls = LombScargle(t_arr, y_arr, nterms=1, fit_mean=True)
-        freq, power = ls.autopower(method="fast",
-                                   minimum_frequency=1/max_period,
-                                   maximum_frequency=1/min_period,
-                                   samples_per_peak=5)
-
-        per_dict = {"freq": freq.tolist(), "power": power.tolist()}
-        best_period = float(1 / freq[np.argmax(power)])
-
-        meta_fast["PERIODOGRAM"]   = per_dict
-        meta_fast["DEFAULT_PERIOD"] = best_period
-        meta_full["PERIODOGRAM"]   = per_dict      # reuse same LS for full
-        meta_full["DEFAULT_PERIOD"] = best_period
-
-    # ── package -------------------------------------------------------------
-    data = {
-        "fast": {"time": time_fast,  "series": series_fast},
-        "full": {"time": time_full,  "series": series_full}
-    }
-    meta = {
-        "fast": meta_fast,
-        "full": meta_full
-    }
-    return path, data, meta
+        return None, {}, None
 
+    # ── open FITS and pull columns (kept as arrays) ---------------------
+    columns = read_lightcurve_columns(path)
+    if columns is None:                      # no time axis
+        return path, {}, None
+    time_full, series_full, meta_full = columns
 
+    # ── create FAST (binned) copies, one vectorized pass per column ---------
+    time_fast, series_fast, meta_fast = bin_lightcurve(
+        time_full, series_full, meta_full, max_points_fast)
 
-# -----------------------------------------------------------------------------
-# Utility: check if a world coordinate is on the CCD via WCS
-# -----------------------------------------------------------------------------
-def check_coordinate_on_ccd(ra_deg, dec_deg, wcs, margin=0, extent=(0, 2048, 0, 2048)):
-    """Return True if (ra_deg, dec_deg) maps inside the CCD bounds."""
-    try:
-        xpix, ypix = wcs.all_world2pix(ra_deg, dec_deg, 1)
-    except NoConvergence:
-        return False
+    # ── Lomb-Scargle on FAST data (on-disk cache per file + LS setup) ------
+    periodogram = None
+    if series_fast:
+        pref_key = preferred_series(series_fast)
+        periodogram = cached_periodogram(      # keyed like precompute_periodograms
+            canonical_gaia_id(gaia_id), path, time_fast, series_fast[pref_key], max_points_fast,
+            min_period=min_period, max_period=max_period,
+            samples_per_peak=samples_per_peak)
 
-    if np.isnan(xpix) or np.isnan(ypix):
-        return False
+    return path, {"fast": (time_fast, series_fast, meta_fast),
+                  "full": (time_full, series_full, meta_full)}, periodogram
 
-    return (
-        (extent[0] - margin) < xpix < (extent[1] + margin)
-        and (extent[2] - margin) < ypix < (extent[3] + margin)
-    )
 
 # -----------------------------------------------------------------------------
 # Stage 1: find candidate fields via simple WCS projection
@@ -330,120 +283,399 @@ def query_fields_by_coordinate(ra_deg, dec_deg, margin=100, extent=(0, 2048, 0,
     """
     Returns a list of StarCatalog.OBJECT names whose approximate TAN
     projection might contain (ra_deg, dec_deg).
+    Field centres come from the per-worker field_cache, not the DB.
     """
-    session = SessionLocal()
-    try:
-        stmt = (
-            select(StarCatalog.OBJECT, StarCatalog.RA, StarCatalog.DEC)
-            .group_by(StarCatalog.OBJECT)
-        )
-        rows = session.execute(stmt).all()
-    finally:
-        session.close()
+    names, cat_ra, cat_dec = field_cache.get()
+    if len(names) == 0:
+        return []
 
-    fields = []
-    for obj_name, cat_ra, cat_dec in rows:
-        w_approx = create_simple_wcs((cat_ra, cat_dec), crpix=crpix, pixsize=pixsize)
-        if check_coordinate_on_ccd(ra_deg, dec_deg, w_approx, margin=margin):
-            fields.append(obj_name)
-    return fields
+    # One batched TAN projection over every field centre instead of
+    # building an astropy WCS per field.
+    on_ccd = simple_tan_on_ccd(ra_deg, dec_deg, cat_ra, cat_dec, margin=margin,
+                               extent=extent, crpix=crpix, pixsize=pixsize)
+    return names[on_ccd].tolist()
 
 # -----------------------------------------------------------------------------
 # Stage 2: full database query + on-CCD filtering
 # -----------------------------------------------------------------------------
+def _frame_rows_to_matches(rows, ra_deg, dec_deg):
+    """Batched on-CCD check over (Frame, sky_bg, moondist, sunelev) rows."""
+    pars = [fr.astrometry.wcs_pars for fr, *_ in rows]
+    solved = [i for i, p in enumerate(pars) if p is not None]
+    on_ccd = np.zeros(len(rows), dtype=bool)
+    if solved:
+        stacked = stack_wcs_pars([pars[i] for i in solved])
+        on_ccd[solved] = batch_on_ccd(ra_deg, dec_deg, stacked, margin=0)
+
+    return [_frame_match_dict(*row) for row, hit in zip(rows, on_ccd) if hit]
+
+
+def _frame_match_dict(fr, sky_bg, moondist, sunelev):
+    """Result dict for one matched frame row."""
+    return {
+        "IHUID":        fr.IHUID,
+        "FNUM":         fr.FNUM,
+        "OBJECT":       fr.OBJECT,
+        "IMAGETYP":     (fr.IMAGETYP or "").lower(),
+        "datetime_obs": fr.datetime_obs.isoformat() if fr.datetime_obs else None,
+        "EXPTIME":      fr.EXPTIME,
+        "relpath":      fr.relpath,
+        "sky_bg":       sky_bg,
+        "moondist":     moondist,
+        "sunelev":      sunelev,
+    }
+
+
+def _frame_stmt(date_min=None, date_max=None, date_type="datetime"):
+    """
+    Frame ⟶ Astrometry ⟶ CalFrameQuality & FrameQuality select for solved
+    frames, with the date filter applied; callers add the frame scope.
+    """
+    stmt = (
+        select(
+            Frame,
+            CalFrameQuality.calframe_median.label("sky_bg"),
+            FrameQuality.MOONDIST.label("moondist"),
+            FrameQuality.SUNELEV.label("sunelev"),
+        )
+        .options(joinedload(Frame.astrometry))
+        .join(Frame.astrometry)
+        .outerjoin(
+            CalFrameQuality,
+            and_(
+                Frame.IHUID == CalFrameQuality.IHUID,
+                Frame.FNUM == CalFrameQuality.FNUM,
+            ),
+        )
+        .outerjoin(
+            FrameQuality,
+            and_(
+                Frame.IHUID == FrameQuality.IHUID,
+                Frame.FNUM == FrameQuality.FNUM,
+            ),
+        )
+        .where(Astrometry.exit_code == 0)
+    )
+
+    # Date filters
+    app.logger.info(f"Date filter inputs => type={date_type}, min={date_min}, max={date_max}")
+    if date_type == "datetime":
+        if date_min is not None:
+            stmt = stmt.where(Frame.datetime_obs >= date_min)
+        if date_max is not None:
+            stmt = stmt.where(Frame.datetime_obs <= date_max)
+    elif date_type == "JD":
+        if date_min is not None:
+            jdmin = date_min - 2400000
+            stmt = stmt.where(Frame.JD >= jdmin)
+        if date_max is not None:
+            jdmax = date_max - 2400000
+            stmt = stmt.where(Frame.JD <= jdmax)
+    return stmt
+
+
+def iter_frames_by_coordinate(ra_deg, dec_deg,
+                              date_min=None, date_max=None,
+                              date_type="datetime",
+                              margin=100, extent=(0, 2048, 0, 2048),
+                              chunk_size=None):
+    """
+    Generator form of query_frames_by_coordinate: yields lists of matched
+    frame dicts, one list per chunk of `chunk_size` candidate rows, in
+    (IHUID, FNUM) order.
+
+    Each chunk is its own keyset query ((IHUID, FNUM) > last row) in a
+    short-lived session, so a partly consumed generator holds no DB
+    connection and can be resumed later.
+    """
+    chunk_size = chunk_size or SEARCH_CHUNK
+    timer = StageTimer("search", ra=ra_deg, dec=dec_deg, date_type=date_type)
+    try:
+        with timer.stage("field_shortlist"):
+            fields = query_fields_by_coordinate(ra_deg, dec_deg, margin=margin, extent=extent)
+        app.logger.info(f"Candidate fields: {fields}")
+
+        # Which frames to pull: with a footprint index, the indexed frames whose
+        # cap covers the point (plus indexed frames without a cap) and every
+        # frame of candidate fields that changed since the index was updated;
+        # otherwise every frame of the candidate fields.
+        with timer.stage("footprint_lookup"):
+            if footprints.index_available():
+                stale, uncapped = footprints.coverage(fields)
+                pairs = footprints.lookup_frames(ra_deg, dec_deg, skip_fields=stale) + uncapped
+                scopes = [tuple_(Frame.IHUID, Frame.FNUM).in_(pairs[i:i + FOOTPRINT_CHUNK])
+                          for i in range(0, len(pairs), FOOTPRINT_CHUNK)]
+                if stale:
+                    scopes.append(Frame.OBJECT.in_(stale))
+                timer.count("indexed_candidates", len(pairs))
+                timer.count("stale_fields", len(stale))
+            else:
+                scopes = [Frame.OBJECT.in_(fields)] if fields else []
+        timer.count("fields", len(fields))
+
+        if not scopes:
+            return
+
+        stmt = _frame_stmt(date_min=date_min, date_max=date_max, date_type=date_type)
+        stmt = stmt.order_by(Frame.IHUID, Frame.FNUM).limit(chunk_size)
+        sample_sql = SQL_DEBUG_SAMPLE > 0 and random.random() < SQL_DEBUG_SAMPLE
+
+        for scope in scopes:
+            last = None
+            while True:
+                chunk_stmt = stmt.where(scope)
+                if last is not None:
+                    chunk_stmt = chunk_stmt.where(or_(
+                        Frame.IHUID > last[0],
+                        and_(Frame.IHUID == last[0], Frame.FNUM > last[1]),
+                    ))
+                if sample_sql:
+                    # Full SQL text is expensive to build – only for sampled searches
+                    compiled = chunk_stmt.compile(dialect=mysql.dialect(),
+                                                  compile_kwargs={"literal_binds": True})
+                    app.logger.info(f"SQL Query (sampled):\n{compiled}")
+                    sample_sql = False
+
+                with timer.stage("db_fetch"):
+                    session = SessionLocal()
+                    try:
+                        rows = session.execute(chunk_stmt).all()
+                    finally:
+                        session.close()
+                if not rows:
+                    break
+
+                with timer.stage("wcs_filter"):
+                    matched = _frame_rows_to_matches(rows, ra_deg, dec_deg)
+                timer.count("candidate_rows", len(rows))
+                timer.count("matched_rows", len(matched))
+                yield matched
+
+                if len(rows) < chunk_size:
+                    break
+                last = (rows[-1][0].IHUID, rows[-1][0].FNUM)
+    finally:
+        # runs on exhaustion and when a partly consumed search is dropped
+        timer.finish()
+
+
 def query_frames_by_coordinate(ra_deg, dec_deg,
                                date_min=None, date_max=None,
                                date_type="datetime",
                                margin=100, extent=(0, 2048, 0, 2048)):
     """
-    1) Use query_fields_by_coordinate to shortlist fields.
+    1) Use query_fields_by_coordinate to shortlist fields
+       (and the footprint index, when built, to shortlist frames).
     2) Query Frame ⟶ Astrometry ⟶ CalFrameQuality & FrameQuality for sky_bg, moondist, sunelev.
-    3) Do precise on-CCD check using full WCS.
+    3) Do precise on-CCD check using full WCS (batched TAN+SIP, see mywcs).
     Returns a list of dicts with all needed attributes.
+    Results are served from / stored in the shared search cache.
     """
-    fields = query_fields_by_coordinate(ra_deg, dec_deg, margin=margin, extent=extent)
-    app.logger.info(f"Candidate fields: {fields}")
-    if not fields:
-        return []
+    return list(iter_search_results(ra_deg, dec_deg,
+                                    date_min=date_min, date_max=date_max,
+                                    date_type=date_type,
+                                    margin=margin, extent=extent))
 
+
+def iter_search_results(ra_deg, dec_deg,
+                        date_min=None, date_max=None,
+                        date_type="datetime",
+                        margin=100, extent=(0, 2048, 0, 2048)):
+    """
+    Yield matched frame dicts one at a time, as each chunk passes the
+    on-CCD check.  Served from the search cache on a hit; on a miss the
+    result is cached afterwards unless it grew past SEARCH_CACHE_MAX_ROWS
+    (so streaming a huge result never holds it all in memory).
+    """
+    cache = get_search_cache()
+    key = _search_cache_key(cache, ra_deg, dec_deg, date_type, date_min, date_max,
+                            margin, extent)
+    cached = cache.get(key)
+    if cached is not None:
+        app.logger.info(f"Search cache hit: {len(cached)} frames")
+        yield from cached
+        return
+
+    kept = []
+    for chunk in iter_frames_by_coordinate(ra_deg, dec_deg,
+                                           date_min=date_min, date_max=date_max,
+                                           date_type=date_type,
+                                           margin=margin, extent=extent):
+        if kept is not None:
+            kept.extend(chunk)
+            if len(kept) > SEARCH_CACHE_MAX_ROWS:
+                kept = None
+        yield from chunk
+    if kept is not None:
+        cache.set(key, kept, _search_cache_fields(ra_deg, dec_deg, kept))
+
+
+def _ingest_marker(fields):
+    """
+    [frames, solved frames, highest FNUM] of the given fields – changes
+    whenever frames of those fields are ingested or solved.
+    """
+    if not fields:
+        return [0, 0, 0]
     session = SessionLocal()
     try:
-        stmt = (
-            select(
-                Frame,
-                CalFrameQuality.calframe_median.label("sky_bg"),
-                FrameQuality.MOONDIST.label("moondist"),
-                FrameQuality.SUNELEV.label("sunelev"),
-            )
-            .options(joinedload(Frame.astrometry))
-            .join(Frame.astrometry)
-            .outerjoin(
-                CalFrameQuality,
-                and_(
-                    Frame.IHUID == CalFrameQuality.IHUID,
-                    Frame.FNUM == CalFrameQuality.FNUM,
-                ),
-            )
-            .outerjoin(
-                FrameQuality,
-                and_(
-                    Frame.IHUID == FrameQuality.IHUID,
-                    Frame.FNUM == FrameQuality.FNUM,
-                ),
-            )
-            .where(Frame.OBJECT.in_(fields))
-            .where(Astrometry.exit_code == 0)
-        )
-
-        # Date filters
-        app.logger.info(f"Date filter inputs => type={date_type}, min={date_min}, max={date_max}")
-        if date_type == "datetime":
-            if date_min is not None:
-                stmt = stmt.where(Frame.datetime_obs >= date_min)
-            if date_max is not None:
-                stmt = stmt.where(Frame.datetime_obs <= date_max)
-        elif date_type == "JD":
-            if date_min is not None:
-                jdmin = date_min - 2400000
-                stmt = stmt.where(Frame.JD >= jdmin)
-            if date_max is not None:
-                jdmax = date_max - 2400000
-                stmt = stmt.where(Frame.JD <= jdmax)
-
-        # Log SQL for debugging
-        compiled = stmt.compile(dialect=mysql.dialect(), compile_kwargs={"literal_binds": True})
-        app.logger.info(f"SQL Query:\n{compiled}")
-
-        rows = session.execute(stmt).all()
+        n, solved, top = session.execute(
+            select(func.count(), func.count(Astrometry.CRVAL1), func.max(Frame.FNUM))
+            .select_from(Frame)
+            .outerjoin(Astrometry, (Astrometry.IHUID == Frame.IHUID)
+                                   & (Astrometry.FNUM == Frame.FNUM))
+            .where(Frame.OBJECT.in_(sorted(fields)))
+        ).one()
     finally:
         session.close()
+    return [n, solved, top]
+
 
-    app.logger.info(f"Found {len(rows)} rows before on-CCD filtering.")
+def _search_cache_key(cache, ra_deg, dec_deg, date_type, date_min, date_max,
+                      margin=100, extent=(0, 2048, 0, 2048)):
+    """
+    Search cache key, including the ingest state of the candidate fields:
+    a search stored before new frames of its fields arrived is a miss,
+    without waiting for the TTL or an explicit invalidation.
+    """
+    marker = (_ingest_marker(query_fields_by_coordinate(ra_deg, dec_deg))
+              if cache.backend is not None else None)
+    return cache.key(ra_deg, dec_deg, date_type, date_min, date_max,
+                     extra=(margin, list(extent), marker))
+
+
+def _search_cache_fields(ra_deg, dec_deg, matched):
+    """Fields whose new frames could change this search's result."""
+    fields = set(query_fields_by_coordinate(ra_deg, dec_deg))
+    fields.update(f["OBJECT"] for f in matched if f.get("OBJECT"))
+    return fields
 
-    # Final on-CCD check + build result dicts
-    matched = []
-    for fr, sky_bg, moondist, sunelev in rows:
-        w = fr.astrometry.wcs_transform
-        if w is None:
+
+# -----------------------------------------------------------------------------
+# Many targets at once: one DB query per field, vectorized on-CCD checks
+# -----------------------------------------------------------------------------
+def query_frames_for_targets(ra_arr, dec_arr,
+                             date_min=None, date_max=None,
+                             date_type="datetime",
+                             margin=100, extent=(0, 2048, 0, 2048)):
+    """
+    Cone search for many positions.  Targets are grouped by candidate
+    field; each field is fetched once and every (target, frame) pair of
+    the group is checked in one batched WCS pass.
+    Returns a list of (target_index, frame_dict), sorted by target.
+    """
+    ra_arr  = np.asarray(ra_arr, dtype=float)
+    dec_arr = np.asarray(dec_arr, dtype=float)
+    names, cat_ra, cat_dec = field_cache.get()
+    if len(names) == 0 or ra_arr.size == 0:
+        return []
+
+    # (targets × fields) shortlist in one broadcasted projection
+    in_field = simple_tan_on_ccd(ra_arr[:, None], dec_arr[:, None],
+                                 cat_ra[None, :], cat_dec[None, :],
+                                 margin=margin, extent=extent)
+    base = _frame_stmt(date_min=date_min, date_max=date_max, date_type=date_type)
+
+    results = []
+    for j in np.flatnonzero(in_field.any(axis=0)):
+        targets = np.flatnonzero(in_field[:, j])
+        session = SessionLocal()
+        try:
+            rows = session.execute(base.where(Frame.OBJECT == names[j])).all()
+        finally:
+            session.close()
+
+        pars = [fr.astrometry.wcs_pars for fr, *_ in rows]
+        solved = [i for i, p in enumerate(pars) if p is not None]
+        if not solved:
             continue
-        if check_coordinate_on_ccd(ra_deg, dec_deg, w, margin=0):
-            matched.append({
-                "IHUID":        fr.IHUID,
-                "FNUM":         fr.FNUM,
-                "OBJECT":       fr.OBJECT,
-                "IMAGETYP":     (fr.IMAGETYP or "").lower(),
-                "datetime_obs": fr.datetime_obs.isoformat() if fr.datetime_obs else None,
-                "EXPTIME":      fr.EXPTIME,
-                "relpath":      fr.relpath,
-                "sky_bg":       sky_bg,
-                "moondist":     moondist,
-                "sunelev":      sunelev,
-            })
-    app.logger.info(f"Out of those, {len(matched)} frames are actually on the CCD.")
-    return matched
+        grid = batch_on_ccd_grid(ra_arr[targets], dec_arr[targets],
+                                 stack_wcs_pars([pars[i] for i in solved]))
+        for ti, fi in zip(*np.nonzero(grid)):
+            results.append((int(targets[ti]), _frame_match_dict(*rows[solved[fi]])))
+        app.logger.info(f"[batch] field {names[j]}: {len(targets)} targets × "
+                        f"{len(solved)} frames → {int(grid.sum())} matches")
 
+    results.sort(key=lambda r: (r[0], r[1]["IHUID"], r[1]["FNUM"]))
+    return results
 
 
+# -----------------------------------------------------------------------------
+# Lazy, cached result sets for the paginated /data view
+# -----------------------------------------------------------------------------
+class LazySearch:
+    """
+    Object / twilight frames of one search, evaluated chunk by chunk only
+    as far as the requested pages need.  `complete` is False while more
+    candidates remain, i.e. the totals are lower bounds.
+    """
+
+    def __init__(self, chunks, on_complete=None):
+        self._chunks  = chunks
+        self._on_complete = on_complete
+        self._lock    = threading.Lock()
+        self.frames   = []           # every match, in query order
+        self.object   = []
+        self.twilight = []
+        self.complete = False
+        self.created  = time.monotonic()
+
+    def fill(self, need_obj, need_twl):
+        """Evaluate until both lists reach the given lengths (or run out)."""
+        with self._lock:
+            while (not self.complete
+                   and (len(self.object) < need_obj or len(self.twilight) < need_twl)):
+                try:
+                    chunk = next(self._chunks)
+                except StopIteration:
+                    self.complete = True
+                    if self._on_complete is not None:
+                        self._on_complete(self.frames)
+                    break
+                self.frames.extend(chunk)
+                for f in chunk:
+                    kind = f.get("IMAGETYP", "").lower()
+                    if kind == "object":
+                        self.object.append(f)
+                    elif kind == "twilight":
+                        self.twilight.append(f)
+        return self.object, self.twilight, self.complete
+
+
+_search_pages = OrderedDict()       # search key -> LazySearch (LRU)
+_search_pages_lock = threading.Lock()
+
+
+def _new_lazy_search(ra, dec, date_min, date_max, date_type):
+    """Start from the shared search cache when it has the full result."""
+    cache = get_search_cache()
+    key = _search_cache_key(cache, ra, dec, date_type, date_min, date_max)
+    cached = cache.get(key)
+    if cached is not None:
+        return LazySearch(iter([cached]))
+
+    def store(frames):
+        cache.set(key, frames, _search_cache_fields(ra, dec, frames))
+
+    return LazySearch(iter_frames_by_coordinate(
+        ra, dec, date_min=date_min, date_max=date_max, date_type=date_type),
+        on_complete=store)
+
+
+def paged_search(ra, dec, date_min, date_max, date_type):
+    """LazySearch for these inputs, reused across page clicks in this worker."""
+    key = (round(ra, 6), round(dec, 6), date_type, date_min, date_max)
+    now = time.monotonic()
+    with _search_pages_lock:
+        search = _search_pages.get(key)
+        if search is not None and now - search.created <= SEARCH_PAGE_TTL:
+            _search_pages.move_to_end(key)
+            return search
+        search = _new_lazy_search(ra, dec, date_min, date_max, date_type)
+        _search_pages[key] = search
+        while len(_search_pages) > SEARCH_PAGE_CACHE_SIZE:
+            _search_pages.popitem(last=False)
+        return search
 
 
 # -----------------------------------------------------------------------------
@@ -498,9 +730,12 @@ def _run_search(active_page: str, show_upcoming: bool, show_policy: bool):
                 show_policy=show_policy
             )
 
-        lc_path, lc_data, lc_meta = load_lightcurve_arrays(gaia_id)
+        # only the series names here; the arrays come from /api/lightcurve
+        lc_path = lightcurve_paths.get(gaia_id)
+        lc_series = (lightcurve_series_names(lc_path)
+                     if lc_path and os.path.isfile(lc_path) else [])
 
-        if lc_path is None or not lc_data:
+        if not lc_series:
             return render_template(
                 "lightcurves.html",
                 message="No light curve found for that GAIA ID.",
@@ -509,12 +744,12 @@ def _run_search(active_page: str, show_upcoming: bool, show_policy: bool):
                 show_policy=show_policy
             )
 
-        # success → send data lists to template
+        # success → page fetches the binary columns itself
         return render_template(
             "lightcurves.html",
             lightcurve_path=lc_path,
-            lc_data=lc_data,
-            lc_meta=lc_meta,
+            gaia_id=gaia_id,
+            lc_series=lc_series,
             active_page=active_page,
             show_upcoming=show_upcoming,
             show_policy=show_policy
@@ -564,19 +799,19 @@ def _run_search(active_page: str, show_upcoming: bool, show_policy: bool):
         except ValueError:
             pass  # ignore bad dates → treat as no limit
 
-        # 3.  DB query
-        all_frames = query_frames_by_coordinate(
-            ra, dec, date_min=dmin, date_max=dmax, date_type=dt_type
-        )
-
-        # 4.  Split + paginate
-        obj_list = [f for f in all_frames if f.get("IMAGETYP", "").lower() == "object"]
-        twl_list = [f for f in all_frames if f.get("IMAGETYP", "").lower() == "twilight"]
-
+        # 3.  Lazy DB query: evaluate only as far as the current pages of both
+        #     cards need (one row past each, so "Next" knows whether there is
+        #     more) – the cards are switched client-side without a request.
         PER_PAGE = 50
-        page_obj = int(request.form.get("page_obj", "1") or 1)
-        page_twl = int(request.form.get("page_twl", "1") or 1)
+        view     = request.form.get("view", "object")
+        page_obj = max(1, int(request.form.get("page_obj", "1") or 1))
+        page_twl = max(1, int(request.form.get("page_twl", "1") or 1))
 
+        search = paged_search(ra, dec, dmin, dmax, dt_type)
+        obj_list, twl_list, totals_exact = search.fill(page_obj * PER_PAGE + 1,
+                                                       page_twl * PER_PAGE + 1)
+
+        # 4.  Paginate
         obj_page, obj_pages, page_obj = paginate(obj_list, page_obj, PER_PAGE)
         twl_page, twl_pages, page_twl = paginate(twl_list, page_twl, PER_PAGE)
 
@@ -593,22 +828,24 @@ def _run_search(active_page: str, show_upcoming: bool, show_policy: bool):
                 show_policy=show_policy
             )
 
-        return render_template(
-            "lightcurves.html",
-            object_frames=obj_page,
-            twilight_frames=twl_page,
-            object_total=len(obj_list),
-            twilight_total=len(twl_list),
-            page_obj=page_obj,   total_pages_obj=obj_pages,
-            page_twl=page_twl,   total_pages_twl=twl_pages,
-            current_view=request.form.get("view", "object"),
-            ra=ra_str, dec=dec_str,
-            date_type=dt_type,
-            date_min_input=dmin_in, date_max_input=dmax_in,
-            active_page=active_page,
-            show_upcoming=show_upcoming,
-            show_policy=show_policy
-        )
+        with timed("render", view="frames"):
+            return render_template(
+                "lightcurves.html",
+                object_frames=obj_page,
+                twilight_frames=twl_page,
+                object_total=len(obj_list),
+                twilight_total=len(twl_list),
+                totals_exact=totals_exact,
+                page_obj=page_obj,   total_pages_obj=obj_pages,
+                page_twl=page_twl,   total_pages_twl=twl_pages,
+                current_view=view,
+                ra=ra_str, dec=dec_str,
+                date_type=dt_type,
+                date_min_input=dmin_in, date_max_input=dmax_in,
+                active_page=active_page,
+                show_upcoming=show_upcoming,
+                show_policy=show_policy
+            )
 
     # ======================================================================
     # GET  → empty sidebar (both views)
@@ -642,116 +879,499 @@ def lightcurves_page():
 
 
 
+# -----------------------------------------------------------------------------
+# Lightcurve columns as typed arrays (lcpack container)
+# -----------------------------------------------------------------------------
+@app.route("/api/lightcurve/<string:gaia_id>")
+def lightcurve_data(gaia_id: str):
+    """
+    Binary lightcurve for the viewer.
+      ?res=fast (default) → binned columns + periodogram + DEFAULT_PERIOD
+      ?res=full           → every point (fetched by the page on zoom only)
+    """
+    if not current_user.is_authenticated:          # same gate as the page
+        return jsonify({"error": "Login required"}), 401
+
+    res = request.args.get("res", "fast").lower()
+    if res not in ("fast", "full"):
+        return jsonify({"error": "res must be 'fast' or 'full'"}), 400
+
+    path, columns, periodogram = load_lightcurve_columns(gaia_id.strip())
+    if not columns:
+        return jsonify({"error": "No light curve found for that GAIA ID."}), 404
+
+    with timed("render", view="lightcurve", res=res):
+        cols, attrs = lightcurve_columns(*columns[res],
+                                         periodogram if res == "fast" else None)
+        body = pack_columns(cols, attrs)
+    return Response(body, mimetype=LC_MIMETYPE,
+                    headers={"Cache-Control": "private, max-age=300"})
+
+
+
+@app.route("/api/lightcurve/<string:gaia_id>/window")
+def lightcurve_window(gaia_id: str):
+    """
+    Full-resolution rows inside a time window (what the viewer fetches on zoom).
+      ?tmin=&tmax=       time range in the file's time units (either may be omitted)
+      ?series=TFA0,EPD0  subset of series (default: all); their ERR/FLAG follow
+      ?max_points=N      serve the finest pyramid level with <= N points in the
+                         window (attrs.level; 0 = full resolution)
+    Same lcpack container as /api/lightcurve, read through a memory map.
+    """
+    if not current_user.is_authenticated:
+        return jsonify({"error": "Login required"}), 401
+
+    try:
+        tmin = float(request.args["tmin"]) if request.args.get("tmin") else None
+        tmax = float(request.args["tmax"]) if request.args.get("tmax") else None
+        max_points = int(request.args["max_points"]) if request.args.get("max_points") else None
+    except ValueError:
+        return jsonify({"error": "tmin/tmax/max_points must be numbers"}), 400
+    series_keys = [k.strip().upper() for k in request.args.get("series", "").split(",")
+                   if k.strip()] or None
+
+    path = lightcurve_paths.get(gaia_id)
+    if path is None or not os.path.isfile(path):
+        return jsonify({"error": "No light curve found for that GAIA ID."}), 404
+
+    level = 0
+    with timed("read", view="lightcurve_window"):
+        if max_points:
+            level, columns = read_pyramid_window(path, tmin, tmax, series_keys,
+                                                 max(1, max_points))
+        else:
+            columns = read_lightcurve_window(path, tmin, tmax, series_keys)
+    if columns is None:
+        return jsonify({"error": "Light curve has no time column."}), 404
+
+    cols, attrs = lightcurve_columns(*columns)
+    attrs["tmin"], attrs["tmax"], attrs["level"] = tmin, tmax, level
+    return Response(pack_columns(cols, attrs), mimetype=LC_MIMETYPE,
+                    headers={"Cache-Control": "private, max-age=300"})
+
+
+
 # -----------------------------------------------------------------------------
 # Serve FITS files for JS9 viewer
 # -----------------------------------------------------------------------------
-@app.route("/fits/<string:kind>/<int:ihuid>/<int:fnum>")
-def serve_fits(kind: str, ihuid: int, fnum: int):
+def frame_file(kind, frame):
     """
-    Stream a FITS file to JS9.
+    Locate the RED / SUB file of a Frame row by probing:
       kind='red' →  …/RED/.../<base>-red.fits[.fz]
       kind='sub' →  …/SUB/.../<base>-sub.fits[.fz]
+    Returns (fullpath, fname), or (None, None) if neither file exists.
+    """
+    root_dir = FITS_ROOT if kind == "red" else SUB_ROOT
+    dirpath  = frame_dir(root_dir, frame.date_dir, frame.IHUID)
+
+    candidates = frame_candidates(kind, frame.frame_name)
+    for fname in candidates:
+        fullpath = os.path.join(dirpath, fname)
+        app.logger.debug("[frame_file] checking %s", fullpath)
+        if os.path.isfile(fullpath):
+            return fullpath, fname
+
+    app.logger.error("[frame_file] none of %s in %s", candidates, dirpath)
+    return None, None
+
+
+def find_frame_file(kind, ihuid, fnum):
+    """
+    Path of a frame's RED / SUB file for the /fits routes: from the
+    resolved-path index (one stat, no Frame query), else Frame lookup +
+    frame_file() probing for frames the index does not know yet or whose
+    indexed file has gone.
+    Returns (fullpath, fname, stat), or (None, (message, status), None).
     """
     kind = kind.lower().strip()
     if kind not in ("red", "sub"):
-        current_app.logger.error("[serve_fits] invalid kind=%s", kind)
-        return "Invalid FITS type", 404
+        current_app.logger.error("[find_frame_file] invalid kind=%s", kind)
+        return None, ("Invalid FITS type", 404), None
 
-    suffix   = f"-{kind}"                  # "-red" or "-sub"
-    root_dir = FITS_ROOT if kind == "red" else SUB_ROOT
-
-    current_app.logger.info(
-        "[serve_fits] kind=%s ihuid=%d fnum=%d root=%s",
-        kind, ihuid, fnum, root_dir
-    )
+    fullpath = framepaths.lookup(kind, ihuid, fnum)
+    if fullpath is not None:
+        try:
+            return fullpath, os.path.basename(fullpath), os.stat(fullpath)
+        except OSError:
+            current_app.logger.warning("[find_frame_file] stale index entry %s", fullpath)
 
-    # 1) Frame lookup ----------------------------------------------------
     session = SessionLocal()
     frame = session.query(Frame).filter_by(IHUID=ihuid, FNUM=fnum).one_or_none()
     session.close()
     if frame is None:
-        current_app.logger.error("[serve_fits] No Frame %d/%d", ihuid, fnum)
-        return "Frame not found", 404
-
-    # 2) Derive the base filename ---------------------------------------
-    base = (frame.frame_name or "").strip()
-    # strip compression + .fits
-    for ext in (".fits", ".fz"):
-        if base.lower().endswith(ext):
-            base = base[:-len(ext)]
-    # strip any existing "-red" or "-sub"
-    if base.lower().endswith("-red"):
-        base = base[:-4]
-    if base.lower().endswith("-sub"):
-        base = base[:-4]
-
-    date_dir = (frame.date_dir or "").strip()
-    ihu_dir  = f"ihu{frame.IHUID:02d}"
-    dirpath  = os.path.join(root_dir, date_dir, ihu_dir)
-
-    current_app.logger.info("[serve_fits] searching %s", dirpath)
-
-    # 3) Candidate filenames --------------------------------------------
-    candidates = [f"{base}{suffix}.fits.fz", f"{base}{suffix}.fits"]
+        current_app.logger.error("[find_frame_file] No Frame %d/%d", ihuid, fnum)
+        return None, ("Frame not found", 404), None
 
-    for fname in candidates:
-        fullpath = os.path.join(dirpath, fname)
-        current_app.logger.debug("[serve_fits] checking %s", fullpath)
+    fullpath, fname = frame_file(kind, frame)
+    try:
+        st = os.stat(fullpath) if fullpath is not None else None
+    except OSError:
+        st = None
+    if st is None:
+        return None, ("FITS file not found", 404), None
+    current_app.logger.info("[find_frame_file] found %s", fullpath)
+    return fullpath, fname, st
 
-        if not os.path.isfile(fullpath):
-            continue
 
-        current_app.logger.info("[serve_fits] found %s", fullpath)
+@app.route("/fits/<string:kind>/<int:ihuid>/<int:fnum>")
+def serve_fits(kind: str, ihuid: int, fnum: int):
+    """
+    Stream a FITS file to JS9 (see find_frame_file for the layout).
 
-        # 4) On-the-fly decompression for .fz ----------------------------
-        if fullpath.lower().endswith(".fz"):
+    Every answer carries a strong ETag and Last-Modified of the source
+    file, so repeat loads are a 304; plain files and cached .fz output
+    also honour Range / If-Range (see fits_etag).
+    """
+    kind = kind.lower().strip()
+    current_app.logger.info("[serve_fits] kind=%s ihuid=%d fnum=%d", kind, ihuid, fnum)
+
+    fullpath, fname, st = find_frame_file(kind, ihuid, fnum)
+    if fullpath is None:
+        return fname
+
+    etag = fits_etag(fullpath, st)
+    mtime = datetime.fromtimestamp(st.st_mtime, timezone.utc)
+    if not is_resource_modified(request.environ, etag=etag, last_modified=mtime):
+        rv = Response(status=304)
+        rv.set_etag(etag)
+        rv.cache_control.no_cache = True
+        return rv
+
+    # .fz – local cache, else stream writeto() output ----------------------
+    if fullpath.lower().endswith(".fz"):
+        out_name  = fname[:-3]
+        cache_key = json.dumps(["fits", kind, ihuid, fnum, st.st_mtime_ns, st.st_size])
+
+        cached = fits_cache.lookup(cache_key)
+        if cached is None and request.range is not None:
+            # a resumed / partial download: materialise the entry, then range it
+            current_app.logger.info("[serve_fits] caching %s for a range request", fullpath)
             try:
-                with afits.open(fullpath, ignore_missing_end=True, memmap=False) as hdul:
-                    buf = BytesIO()
-                    hdul.writeto(buf, overwrite=True)
-                    buf.seek(0)
-                    current_app.logger.info(
-                        "[serve_fits] decompressed to %d bytes", buf.getbuffer().nbytes
-                    )
-                    return Response(
-                        buf.getvalue(),
-                        mimetype="application/fits",
-                        headers={"Content-Disposition": f'inline; filename="{fname[:-3]}"'}
-                    )
+                hdul = open_for_stream(fullpath)
+                try:
+                    cached = fits_cache.store(cache_key, hdul.writeto)
+                finally:
+                    hdul.close()
             except Exception as exc:
                 current_app.logger.exception("[serve_fits] decompress error")
                 return f"Error reading FITS: {exc}", 500
 
-        # 5) Plain .fits – stream directly -------------------------------
-        return send_file(fullpath, mimetype="application/fits")
+        if cached is not None:
+            current_app.logger.info("[serve_fits] cache hit %s", cached)
+            try:
+                return send_file(cached, mimetype="application/fits",
+                                 download_name=out_name, as_attachment=False,
+                                 etag=etag, last_modified=mtime, conditional=True)
+            except FileNotFoundError:
+                # evicted since the lookup – stream it like a miss
+                current_app.logger.info("[serve_fits] %s evicted, streaming", cached)
+
+        try:
+            hdul = open_for_stream(fullpath)
+        except Exception as exc:
+            current_app.logger.exception("[serve_fits] decompress error")
+            return f"Error reading FITS: {exc}", 500
+        current_app.logger.info("[serve_fits] streaming %s", fullpath)
+        rv = Response(
+            tee(stream_fits(hdul), fits_cache.writer(cache_key)),
+            mimetype="application/fits",
+            headers={"Content-Disposition": f'inline; filename="{out_name}"',
+                     "Accept-Ranges": "bytes"}
+        )
+        rv.set_etag(etag)
+        rv.last_modified = mtime
+        rv.cache_control.no_cache = True
+        # a HEAD or a client gone before the first chunk never starts the
+        # generator, so its finally never closes the file
+        rv.call_on_close(hdul.close)
+        return rv
+
+    # Plain .fits – stream directly -----------------------------------------
+    return send_file(fullpath, mimetype="application/fits",
+                     etag=etag, last_modified=mtime, conditional=True)
 
-    # 6) Nothing matched -------------------------------------------------
-    current_app.logger.error("[serve_fits] none of %s in %s", candidates, dirpath)
-    return "FITS file not found", 404
 
+def fits_etag(path, st):
+    """
+    Strong validator of what /fits serves for a source file: source path +
+    mtime (+ size).  A cached .fz entry holds exactly the bytes a stream
+    would send, so hits and misses share it.
+    """
+    return hashlib.sha1(f"{path}:{st.st_mtime_ns}:{st.st_size}".encode()).hexdigest()
 
 
 # -----------------------------------------------------------------------------
-# Programmatic API endpoint (JSON / CSV / VOTable)
+# FITS cutouts around a sky position
 # -----------------------------------------------------------------------------
-@app.route('/api/data', methods=['POST'])
-def data_api():
-    fmt = request.args.get('format', 'json').lower()
-    if not request.is_json:
-        return jsonify({"error": "Request must be JSON"}), 400
-    data = request.get_json()
+@app.route("/fits/<string:kind>/<int:ihuid>/<int:fnum>/cutout")
+def serve_fits_cutout(kind: str, ihuid: int, fnum: int):
+    """
+    ?ra=<deg>&dec=<deg>&size=<arcmin> (or &size_pix=<pixels>) →
+    FITS with only that box of the frame and its shifted WCS.
+    """
+    try:
+        ra  = float(request.args["ra"])
+        dec = float(request.args["dec"])
+        size_arcmin = float(request.args.get("size", CUTOUT_SIZE_ARCMIN))
+        size_pix = request.args.get("size_pix", type=int)
+    except (KeyError, ValueError):
+        return "ra and dec (degrees) are required; size is in arcmin", 400
+    if not (math.isfinite(ra) and abs(dec) <= 90):
+        return "ra and dec must be finite degrees, |dec| <= 90", 400
+    if not (math.isfinite(size_arcmin) and size_arcmin > 0):
+        return "size must be a positive number of arcmin", 400
 
-    # Validate RA/DEC
+    session = SessionLocal()
     try:
-        ra = float(data.get('ra', '').strip())
-        dec = float(data.get('dec', '').strip())
-    except Exception:
-        return jsonify({"error": "Invalid RA or DEC"}), 400
+        astrom = session.query(Astrometry).filter_by(IHUID=ihuid, FNUM=fnum).one_or_none()
+        wcs = astrom.wcs_transform if astrom is not None else None
+    finally:
+        session.close()
+    if wcs is None:
+        return "No astrometric solution for this frame", 404
+
+    if size_pix is None:
+        # bound in arcmin first: a huge size would overflow the conversion
+        max_arcmin = max_cutout_arcmin(wcs)
+        if size_arcmin > max_arcmin:
+            return f"size must be at most {max_arcmin:.1f} arcmin on this frame", 400
+        size_pix = size_to_pixels(wcs, size_arcmin)
+    if not 1 <= size_pix <= MAX_CUTOUT_PIX:
+        return f"Cutout size must be 1..{MAX_CUTOUT_PIX} pixels", 400
+
+    fullpath, fname, _ = find_frame_file(kind, ihuid, fnum)
+    if fullpath is None:
+        return fname
 
-    # Validate dates
-    dt_type = data.get('date_type', 'datetime').strip()
-    dmin_in = data.get('date_min', '').strip()
-    dmax_in = data.get('date_max', '').strip()
+    try:
+        with timed("fits_cutout", kind=kind.lower()):
+            hdu = read_cutout(fullpath, wcs, ra, dec, size_pix)
+    except Exception as exc:
+        current_app.logger.exception("[cutout] error reading %s", fullpath)
+        return f"Error reading FITS: {exc}", 500
+    if hdu is None:
+        return "Position is not on this frame", 404
+
+    buf = BytesIO()
+    hdu.writeto(buf)
+    out_name = f"{fname.split('.fits')[0]}_cutout_{ra:.5f}_{dec:+.5f}.fits"
+    return Response(
+        buf.getvalue(),
+        mimetype="application/fits",
+        headers={"Content-Disposition": f'inline; filename="{out_name}"'}
+    )
+
+
+
+# -----------------------------------------------------------------------------
+# Quick-look thumbnails
+# -----------------------------------------------------------------------------
+@app.route("/fits/<string:kind>/<int:ihuid>/<int:fnum>/thumb")
+def serve_fits_thumb(kind: str, ihuid: int, fnum: int):
+    """
+    ?size=<longest side, px> → zscale PNG of the frame, from the
+    thumbnail cache (rendered and stored on a miss).
+    """
+    size = request.args.get("size", THUMB_SIZE, type=int)
+    if not 16 <= size <= MAX_THUMB_SIZE:
+        return f"Thumbnail size must be 16..{MAX_THUMB_SIZE} pixels", 400
+
+    fullpath, fname, st = find_frame_file(kind, ihuid, fnum)
+    if fullpath is None:
+        return fname
+
+    try:
+        with timed("fits_thumb", kind=kind.lower()):
+            png = cached_thumbnail(fullpath, size, st)
+    except Exception as exc:
+        current_app.logger.exception("[thumb] error rendering %s", fullpath)
+        return f"Error reading FITS: {exc}", 500
+    # validators from the source frame: cache hits bump the PNG's own mtime
+    opts = dict(mimetype="image/png", conditional=True,
+                etag=f"{fits_etag(fullpath, st)}-{size}",
+                last_modified=datetime.fromtimestamp(st.st_mtime, timezone.utc),
+                download_name=f"{fname.split('.fits')[0]}.png")
+    try:
+        return send_file(png, **opts)
+    except FileNotFoundError:
+        pass                    # evicted since the lookup: render it again
+    try:
+        return send_file(BytesIO(render_thumbnail(fullpath, size)), **opts)
+    except Exception as exc:
+        current_app.logger.exception("[thumb] error rendering %s", fullpath)
+        return f"Error reading FITS: {exc}", 500
+
+
+# -----------------------------------------------------------------------------
+# Admin hooks (token-protected, per worker)
+# -----------------------------------------------------------------------------
+def _admin_authorized():
+    token = request.headers.get("X-Admin-Token", "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+@app.route("/admin/field-cache", methods=["GET", "POST"])
+def admin_field_cache():
+    """
+    GET  → cache status for this worker
+    POST → reload the star-catalog field centres now
+    """
+    if not _admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    if request.method == "POST":
+        n = field_cache.reload()
+        app.logger.info("[admin] field cache reloaded (%d fields)", n)
+    return jsonify(field_cache.info()), 200
+
+
+@app.route("/admin/wcs-cache", methods=["GET", "POST"])
+def admin_wcs_cache():
+    """
+    GET  → hit/miss counters of this worker's WCS cache
+    POST → drop every cached solution
+    """
+    if not _admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    if request.method == "POST":
+        wcs_cache.invalidate()
+        app.logger.info("[admin] WCS cache cleared")
+    return jsonify(wcs_cache.stats()), 200
+
+
+@app.route("/admin/lightcurve-paths", methods=["GET", "POST"])
+def admin_lightcurve_paths():
+    """
+    GET  → counters of this worker's Gaia ID → path cache
+    POST {"gaia_id": ...} → forget one ID;  POST {} → forget all
+    """
+    if not _admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    if request.method == "POST":
+        gaia_id = (request.get_json(silent=True) or {}).get("gaia_id")
+        lightcurve_paths.invalidate(gaia_id)
+        app.logger.info("[admin] lightcurve path cache cleared (%s)", gaia_id or "all")
+    return jsonify(lightcurve_paths.stats()), 200
+
+
+@app.route("/admin/fits-cache", methods=["GET", "POST"])
+def admin_fits_cache():
+    """
+    GET  → counters of the local served-frame cache
+    POST → delete every cached frame
+    """
+    if not _admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    if request.method == "POST":
+        fits_cache.clear()
+        app.logger.info("[admin] FITS cache cleared")
+    return jsonify(fits_cache.stats()), 200
+
+
+@app.route("/admin/frame-paths")
+def admin_frame_paths():
+    """GET → size of the resolved frame-path index (python framepaths.py updates it)"""
+    if not _admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        return jsonify(framepaths.index_stats()), 200
+    except Exception as exc:
+        return jsonify({"error": f"No frame-path index: {exc}"}), 404
+
+
+@app.route("/admin/thumb-cache", methods=["GET", "POST"])
+def admin_thumb_cache():
+    """
+    GET  → counters of the thumbnail cache
+    POST → delete every cached thumbnail
+    """
+    if not _admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    if request.method == "POST":
+        thumb_cache.clear()
+        app.logger.info("[admin] thumbnail cache cleared")
+    return jsonify(thumb_cache.stats()), 200
+
+
+@app.route("/admin/periodogram-cache", methods=["GET", "POST"])
+def admin_periodogram_cache():
+    """
+    GET  → counters of the on-disk periodogram cache
+    POST → delete every cached periodogram
+    """
+    if not _admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    if request.method == "POST":
+        periodogram_cache.clear()
+        app.logger.info("[admin] periodogram cache cleared")
+    return jsonify(periodogram_cache.stats()), 200
+
+
+@app.route("/admin/pyramid-cache", methods=["GET", "POST"])
+def admin_pyramid_cache():
+    """
+    GET  → counters of the on-disk lightcurve pyramid cache
+    POST → delete every cached level
+    """
+    if not _admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    if request.method == "POST":
+        pyramid_cache.clear()
+        app.logger.info("[admin] pyramid cache cleared")
+    return jsonify(pyramid_cache.stats()), 200
+
+
+@app.route("/admin/search-cache", methods=["GET", "POST"])
+def admin_search_cache():
+    """
+    GET  → search-cache counters
+    POST {"fields": [...]} → drop cached searches touching those fields
+    POST {"all": true}     → drop everything
+    """
+    if not _admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    cache = get_search_cache()
+    if request.method == "POST":
+        body = request.get_json(silent=True) or {}
+        if body.get("all"):
+            cache.clear()
+            with _search_pages_lock:
+                _search_pages.clear()
+            app.logger.info("[admin] search cache cleared")
+        else:
+            n = cache.invalidate_fields(body.get("fields") or [])
+            app.logger.info("[admin] search cache: %d entries invalidated", n)
+            return jsonify({"invalidated": n, **cache.stats()}), 200
+    return jsonify(cache.stats()), 200
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Stage-timing histograms of this worker, Prometheus text format."""
+    if not _admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    return Response(REGISTRY.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+# -----------------------------------------------------------------------------
+# Programmatic API endpoint (JSON / CSV / VOTable)
+# -----------------------------------------------------------------------------
+def _api_text(data, key):
+    """Stripped text of an API body field ('' if absent), None if not a string / number."""
+    value = data.get(key)
+    if value is None:
+        return ''
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        return None
+    return str(value).strip()
+
+
+def _parse_api_dates(data):
+    """(date_type, date_min, date_max, error) from an API request body."""
+    dt_type, dmin_in, dmax_in = (_api_text(data, k) for k in ('date_type', 'date_min', 'date_max'))
+    if None in (dt_type, dmin_in, dmax_in):
+        return None, None, None, "Invalid date_type, date_min or date_max"
+    dt_type = dt_type or 'datetime'
     dmin = dmax = None
     if dt_type == 'datetime':
         try:
@@ -760,7 +1380,7 @@ def data_api():
             if dmax_in:
                 dmax = datetime.strptime(dmax_in, '%Y-%m-%d')
         except ValueError:
-            return jsonify({"error": "Invalid date format"}), 400
+            return dt_type, None, None, "Invalid date format"
     else:
         try:
             if dmin_in:
@@ -768,60 +1388,349 @@ def data_api():
             if dmax_in:
                 dmax = float(dmax_in)
         except ValueError:
-            return jsonify({"error": "Invalid JD dates"}), 400
+            return dt_type, None, None, "Invalid JD dates"
+    return dt_type, dmin, dmax, None
+
+
+API_COLUMNS = [
+    "object", "ihuid", "fnum", "datetime_obs",
+    "exptime", "sky_background_adu",
+    "moon_distance", "sun_elevation",
+    "download_url",
+]
+
+
+def _api_row(f):
+    """Normalized public row for one matched frame dict."""
+    dt = f.get("datetime_obs")
+    if dt and not dt.endswith("Z"):
+        dt += "Z"
+    return {
+        "object":             f.get("OBJECT", "").lower(),
+        "ihuid":              f.get("IHUID"),
+        "fnum":               f.get("FNUM"),
+        "datetime_obs":       dt,
+        "exptime":            f.get("EXPTIME"),
+        "sky_background_adu": f.get("sky_bg"),
+        "moon_distance":      f.get("moondist"),
+        "sun_elevation":      f.get("sunelev"),
+        "download_url":       f"https://hatpi.org/data/{f.get('relpath')}",
+    }
+
+
+def _stream_csv(rows, columns, flush_every=500):
+    """CSV text in pieces of `flush_every` rows; header first."""
+    buf = StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    n = 0
+    for row in rows:
+        writer.writerow([row[c] for c in columns])
+        n += 1
+        if n % flush_every == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def _stream_ndjson(rows):
+    """One JSON object per line."""
+    for row in rows:
+        yield json.dumps(row) + "\n"
+
+
+@app.route('/api/data', methods=['POST'])
+def data_api():
+    """
+    Cone search for one position.
+      ?format=json (default) | votable  → built in memory
+      ?format=csv | ndjson              → streamed row by row
+    """
+    fmt = request.args.get('format', 'json').lower()
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+    data = request.get_json()
+
+    # Validate RA/DEC
+    try:
+        ra = float(data.get('ra', '').strip())
+        dec = float(data.get('dec', '').strip())
+    except Exception:
+        return jsonify({"error": "Invalid RA or DEC"}), 400
+
+    # Validate dates
+    dt_type, dmin, dmax, err = _parse_api_dates(data)
+    if err:
+        return jsonify({"error": err}), 400
+
+    # Streaming formats: rows go out as each chunk passes the on-CCD check
+    if fmt in ("csv", "ndjson"):
+        rows = (_api_row(f) for f in iter_search_results(
+            ra, dec, date_min=dmin, date_max=dmax, date_type=dt_type))
+        if fmt == "csv":
+            return Response(_stream_csv(rows, API_COLUMNS), mimetype="text/csv")
+        return Response(_stream_ndjson(rows), mimetype="application/x-ndjson")
 
     frames = query_frames_by_coordinate(
         ra, dec,
         date_min=dmin, date_max=dmax, date_type=dt_type
     )
 
-    # Build normalized result dicts
-    results = []
-    for f in frames:
-        dt = f.get("datetime_obs")
-        if dt and not dt.endswith("Z"):
-            dt += "Z"
-        results.append({
-            "object":             f.get("OBJECT", "").lower(),
-            "ihuid":              f.get("IHUID"),
-            "fnum":               f.get("FNUM"),
-            "datetime_obs":       dt,
-            "exptime":            f.get("EXPTIME"),
-            "sky_background_adu": f.get("sky_bg"),
-            "moon_distance":      f.get("moondist"),
-            "sun_elevation":      f.get("sunelev"),
-            "download_url":       f"https://hatpi.org/data/{f.get('relpath')}",
-        })
-
-    # CSV output
+    # label from a fixed set: ?format= is free text
+    with timed("render", view="api", format=fmt if fmt in ("json", "votable") else "other"):
+        return _render_api_results([_api_row(f) for f in frames], fmt)
+
+
+def _render_api_results(results, fmt):
+    """VOTable or JSON body for /api/data."""
+    # VOTable output
+    if fmt == "votable":
+        table = Table(rows=results, names=list(results[0].keys()) if results else [])
+        buf = BytesIO()
+        table.write(buf, format="votable")
+        return Response(buf.getvalue(), mimetype="application/x-votable+xml")
+
+    # Default JSON
+    return jsonify({"total_frames": len(results), "frames": results}), 200
+
+
+def _read_batch_targets():
+    """
+    Positions + request options for /api/data/batch.
+      • JSON body:  {"targets": [{"ra":..,"dec":..}, ...] | [[ra, dec], ...],
+                     "date_type":.., "date_min":.., "date_max":..}
+      • multipart:  file=<CSV or VOTable with ra/dec columns> + date fields
+    Returns (ra_array, dec_array, options_dict, error).
+    """
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get("targets") or [], list):
+            return None, None, None, 'JSON body must be {"targets": [...], ...}'
+        pairs = []
+        for t in data.get("targets") or []:
+            if isinstance(t, dict):
+                pairs.append((t.get("ra"), t.get("dec")))
+            elif isinstance(t, list) and len(t) >= 2:
+                pairs.append((t[0], t[1]))
+            else:
+                return None, None, None, "Each target must be {\"ra\":..,\"dec\":..} or [ra, dec]"
+    elif "file" in request.files:
+        data = request.form.to_dict()
+        upload = request.files["file"]
+        name = (upload.filename or "").lower()
+        try:
+            if name.endswith((".xml", ".vot", ".votable")):
+                tab = Table.read(BytesIO(upload.read()), format="votable")
+                cols = {c.lower(): c for c in tab.colnames}
+                pairs = list(zip(tab[cols["ra"]], tab[cols["dec"]]))
+            else:
+                reader = csv.DictReader(StringIO(upload.read().decode("utf-8-sig")))
+                cols = {c.strip().lower(): c for c in reader.fieldnames or []}
+                pairs = [(row[cols["ra"]], row[cols["dec"]]) for row in reader]
+        except Exception:
+            return None, None, None, "Could not read target file (need ra, dec columns)"
+    else:
+        return None, None, None, "Send JSON targets or upload a CSV/VOTable as 'file'"
+
+    if any(isinstance(v, bool) or not isinstance(v, (str, int, float, np.number))
+           for p in pairs for v in p):
+        return None, None, None, "Invalid RA or DEC in targets"
+    try:
+        ra  = np.array([float(p[0]) for p in pairs])
+        dec = np.array([float(p[1]) for p in pairs])
+    except (TypeError, ValueError, IndexError):
+        return None, None, None, "Invalid RA or DEC in targets"
+    if ra.size == 0:
+        return None, None, None, "No targets given"
+    if ra.size > BATCH_MAX_TARGETS:
+        return None, None, None, f"Too many targets (max {BATCH_MAX_TARGETS})"
+    if np.any(~np.isfinite(ra)) or np.any(~(np.abs(dec) <= 90)):
+        return None, None, None, "Invalid RA or DEC in targets"
+    return ra, dec, data, None
+
+
+@app.route('/api/data/batch', methods=['POST'])
+def data_batch_api():
+    """
+    Cone search for a list of positions; one table with a `target`
+    column (index into the submitted list).  ?format=json|csv|votable
+    """
+    fmt = request.args.get('format', 'json').lower()
+    ra, dec, data, err = _read_batch_targets()
+    if err:
+        return jsonify({"error": err}), 400
+
+    dt_type, dmin, dmax, err = _parse_api_dates(data)
+    if err:
+        return jsonify({"error": err}), 400
+
+    matches = query_frames_for_targets(ra, dec, date_min=dmin, date_max=dmax,
+                                       date_type=dt_type)
+    columns = ["target", "target_ra", "target_dec"] + API_COLUMNS
+    results = [{"target": t, "target_ra": float(ra[t]), "target_dec": float(dec[t]),
+                **_api_row(f)} for t, f in matches]
+
     if fmt == "csv":
         output = StringIO()
         writer = csv.writer(output)
-        writer.writerow([
-            "object","ihuid","fnum","datetime_obs",
-            "exptime","sky_background_adu",
-            "moon_distance","sun_elevation",
-            "download_url"
-        ])
+        writer.writerow(columns)
         for row in results:
-            writer.writerow([
-                row["object"], row["ihuid"], row["fnum"],
-                row["datetime_obs"], row["exptime"],
-                row["sky_background_adu"],
-                row["moon_distance"], row["sun_elevation"],
-                row["download_url"]
-            ])
+            writer.writerow([row[c] for c in columns])
         return Response(output.getvalue(), mimetype="text/csv")
 
-    # VOTable output
     if fmt == "votable":
-        table = Table(rows=results, names=list(results[0].keys()) if results else [])
+        table = Table(rows=results, names=columns if results else [])
         buf = BytesIO()
         table.write(buf, format="votable")
         return Response(buf.getvalue(), mimetype="application/x-votable+xml")
 
-    # Default JSON
-    return jsonify({"total_frames": len(results), "frames": results}), 200
+    return jsonify({"total_targets": int(ra.size),
+                    "total_frames": len(results),
+                    "frames": results}), 200
+
+@app.route('/api/data/stamps', methods=['POST'])
+def data_stamps_api():
+    """
+    Postage stamps of one position from every frame the cone search finds.
+      JSON body:  {"ra":.., "dec":.., "date_type":.., "date_min":.., "date_max":..,
+                   "size_pix": 32, "kind": "red"|"sub", "imagetyp": "object"|"all"}
+      ?format=fits (default: one NaN-padded cube + FRAMES table) | zip
+    Stamps are cut a few frames ahead by a bounded thread pool and streamed.
+    """
+    fmt = request.args.get('format', 'fits').lower()
+    if fmt not in ("fits", "zip"):
+        return jsonify({"error": "format must be 'fits' or 'zip'"}), 400
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "JSON body must be an object"}), 400
+
+    try:
+        ra = float(_api_text(data, 'ra'))
+        dec = float(_api_text(data, 'dec'))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid RA or DEC"}), 400
+    if not (math.isfinite(ra) and abs(dec) <= 90):
+        return jsonify({"error": "Invalid RA or DEC"}), 400
+    try:
+        size_pix = int(data.get('size_pix', STAMP_DEFAULT_PIX))
+    except (TypeError, ValueError, OverflowError):
+        size_pix = 0
+    if not 1 <= size_pix <= STAMP_MAX_PIX:
+        return jsonify({"error": f"size_pix must be 1..{STAMP_MAX_PIX}"}), 400
+    kind = str(data.get('kind', 'red')).lower().strip()
+    if kind not in ("red", "sub"):
+        return jsonify({"error": "kind must be 'red' or 'sub'"}), 400
+    imagetyp = str(data.get('imagetyp', 'object')).lower().strip()
+
+    dt_type, dmin, dmax, err = _parse_api_dates(data)
+    if err:
+        return jsonify({"error": err}), 400
+
+    matches = [f for f in iter_search_results(ra, dec, date_min=dmin, date_max=dmax,
+                                              date_type=dt_type)
+               if imagetyp == "all" or f.get("IMAGETYP") == imagetyp]
+    if len(matches) > STAMP_MAX_FRAMES:
+        return jsonify({"error": f"{len(matches)} frames match; at most {STAMP_MAX_FRAMES} "
+                                 "per request (narrow the dates)"}), 400
+
+    # Frame rows (name, date_dir, JD) and solutions for the matches, chunked
+    pairs = [(f["IHUID"], f["FNUM"]) for f in matches]
+    frames = {}
+    session = SessionLocal()
+    try:
+        for i in range(0, len(pairs), FOOTPRINT_CHUNK):
+            stmt = (select(Frame).options(joinedload(Frame.astrometry))
+                    .where(tuple_(Frame.IHUID, Frame.FNUM).in_(pairs[i:i + FOOTPRINT_CHUNK])))
+            frames.update(((fr.IHUID, fr.FNUM), fr) for fr in session.scalars(stmt))
+    finally:
+        session.close()
+
+    jobs = []
+    for pair in pairs:
+        fr = frames.get(pair)
+        if fr is None:
+            continue
+        jobs.append({"IHUID": fr.IHUID, "FNUM": fr.FNUM, "JD": fr.JD, "OBJECT": fr.OBJECT,
+                     "frame": fr,
+                     "wcs": fr.astrometry.wcs_transform if fr.astrometry else None})
+    app.logger.info("[stamps] ra=%s dec=%s: %d frames, %d px, %s", ra, dec, len(jobs), size_pix, fmt)
+
+    indexed = framepaths.lookup_many(kind, [(j["IHUID"], j["FNUM"]) for j in jobs])
+
+    def read(job):
+        if job["wcs"] is None:
+            return None
+        path = indexed.get((job["IHUID"], job["FNUM"]))
+        if path is not None:
+            try:
+                return read_cutout(path, job["wcs"], ra, dec, size_pix, pad=True)
+            except FileNotFoundError:             # stale index entry: probe below
+                pass
+        path, _ = frame_file(kind, job["frame"])
+        if path is None:
+            raise FileNotFoundError(f"no {kind} file for {job['IHUID']}/{job['FNUM']}")
+        return read_cutout(path, job["wcs"], ra, dec, size_pix, pad=True)
+
+    cards = [("RA_TARG", ra, "stamp centre RA [deg]"),
+             ("DEC_TARG", dec, "stamp centre Dec [deg]"),
+             ("FRAMEKND", kind, "source frames (red / sub)"),
+             ("COMMENT", "FRAMES.JD is JD - 2400000, as stored for the frames")]
+    name = f"hatpi_stamps_{ra:.5f}_{dec:+.5f}"
+    if fmt == "zip":
+        body = stream_zip(jobs, read, lambda j: f"{j['IHUID']:02d}-{j['FNUM']:07d}-{kind}.fits",
+                          cards, workers=STAMP_READ_THREADS, ahead=2 * STAMP_READ_THREADS)
+        mimetype = "application/zip"
+    else:
+        body = stream_cube(jobs, read, size_pix, cards,
+                           workers=STAMP_READ_THREADS, ahead=2 * STAMP_READ_THREADS)
+        mimetype = "application/fits"
+    return Response(body, mimetype=mimetype,
+                    headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'})
+
+
+@app.route('/api/lightcurves/export', methods=['POST'])
+def lightcurves_export_api():
+    """
+    Stitched lightcurve files for many stars as one streamed archive.
+      JSON body:  {"gaia_ids": [...]}   or  text/plain, one ID per line
+      ?format=tar (default) | zip
+    Paths come from one IN (...) query; files are read a few ahead by a
+    thread pool.  manifest.csv lists every ID as ok / missing / unreadable.
+    """
+    if not current_user.is_authenticated:
+        return jsonify({"error": "Login required"}), 401
+
+    fmt = request.args.get('format', 'tar').lower()
+    if fmt not in ("tar", "zip"):
+        return jsonify({"error": "format must be 'tar' or 'zip'"}), 400
+
+    if request.is_json:
+        data = request.get_json(silent=True)
+        ids = data.get("gaia_ids") if isinstance(data, dict) else None
+        if (not isinstance(ids, list)
+                or any(isinstance(g, bool) or not isinstance(g, (str, int)) for g in ids)):
+            return jsonify({"error": 'JSON body must be {"gaia_ids": [<string or integer>, ...]}'}), 400
+    else:
+        ids = request.get_data(as_text=True).split()
+    ids = list(dict.fromkeys(str(g).strip() for g in ids if str(g).strip()))
+    if not ids:
+        return jsonify({"error": "No Gaia IDs given"}), 400
+    if len(ids) > EXPORT_MAX_IDS:
+        return jsonify({"error": f"At most {EXPORT_MAX_IDS} Gaia IDs per request"}), 400
+
+    paths = lightcurve_paths.get_many(ids)
+    entries = [(gid, paths[gid]) for gid in ids if gid in paths]
+    missing = [gid for gid in ids if gid not in paths]
+    app.logger.info("[export] %d IDs, %d files, %d missing", len(ids), len(entries), len(missing))
+
+    mimetype = "application/zip" if fmt == "zip" else "application/x-tar"
+    return Response(stream_archive(entries, missing, fmt, workers=EXPORT_READ_THREADS),
+                    mimetype=mimetype,
+                    headers={"Content-Disposition":
+                             f'attachment; filename="hatpi_lightcurves.{fmt}"'})
 
 app.register_blueprint(auth_bp)
 
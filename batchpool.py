@@ -0,0 +1,65 @@
+# batchpool.py
+#
+# Process pool loop shared by the offline batch scripts
+# (precompute_periodograms.py, pregenerate_thumbnails.py).
+#
+# Jobs are pulled lazily from an iterator and at most 4 × workers are in
+# flight at once, so a catalogue-sized job list never sits in memory.
+# Each job returns a status string; statuses are counted by their part
+# before ":", progress is printed every `report_every` seconds, and a job
+# that raises is counted as an error instead of stopping the run.
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+
+def _guarded(process, job):
+    """Worker: process(job), with any exception turned into an error status."""
+    try:
+        return process(job)
+    except Exception as exc:                    # one bad job must not stop the run
+        return f"error: {exc}"
+
+
+def run_pool(process, jobs, name=str, workers=None, report_every=30.0, unit="jobs"):
+    """
+    Run process(job) -> status for every job in a process pool; returns
+    {status: count}.  `process` must be a module-level function; errors
+    are printed as "<name(job)>: <status>".
+    """
+    counts = {}
+    workers = workers or os.cpu_count()
+    t0 = last = time.monotonic()
+    n = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        exhausted = False
+        while pending or not exhausted:
+            # keep a bounded number of jobs in flight
+            while not exhausted and len(pending) < 4 * workers:
+                job = next(jobs, None)
+                if job is None:
+                    exhausted = True
+                else:
+                    pending[pool.submit(_guarded, process, job)] = job
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            for fut in done:
+                job = pending.pop(fut)
+                status = fut.result()
+                n += 1
+                kind = status.split(":", 1)[0]
+                counts[kind] = counts.get(kind, 0) + 1
+                if kind == "error":
+                    print(f"  {name(job)}: {status}")
+
+            now = time.monotonic()
+            if now - last >= report_every:
+                last = now
+                rate = n / (now - t0)
+                print(f"  {n} {unit} ({rate:.1f}/s) " +
+                      ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+    print(f"  {n} {unit} in {time.monotonic() - t0:.0f} s")
+    return counts
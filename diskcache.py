@@ -0,0 +1,197 @@
+# diskcache.py
+#
+# Sharded directory of cache files with a byte budget, shared by every
+# worker on the host.  Used for periodograms, lightcurve pyramids and
+# similar derived products.
+#
+#   <root>/<2 hex>/<sha1 of key><suffix>
+#
+# Writes go to a temp file in the same shard and are renamed into place,
+# so readers never see a partial file and concurrent writers of the same
+# key simply race to an identical result.  A hit bumps the file's mtime;
+# once the total passes max_bytes the least recently used files are deleted
+# down to 90 % of the budget.  max_bytes <= 0 means unbounded.
+#
+# Each process keeps a running estimate of the total (its last scan plus its
+# own writes).  Other workers write to the same directory, so the estimate
+# is re-stat'ed from disk every RESCAN_SECONDS, and whenever this process
+# has written RESCAN_FRACTION of the budget since its last scan; N workers
+# overshoot by at most about N × RESCAN_FRACTION of max_bytes.
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+RESCAN_SECONDS  = 60.0
+RESCAN_FRACTION = 0.02
+
+
+class DiskCache:
+
+    def __init__(self, root, max_bytes, suffix):
+        self.root      = root
+        self.max_bytes = int(max_bytes)
+        self.suffix    = suffix
+        self._lock     = threading.Lock()
+        self._bytes    = None          # running estimate, see _account
+        self._written  = 0             # bytes this process wrote since the last scan
+        self._scanned  = 0.0           # time.monotonic() of the last scan
+        self.hits = self.misses = self.evictions = 0
+
+    def path_for(self, key):
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.root, digest[:2], digest + self.suffix)
+
+    def contains(self, key):
+        return os.path.isfile(self.path_for(key))
+
+    def lookup(self, key):
+        """Path of the cached file (marked as recently used), or None."""
+        fname = self.path_for(key)
+        try:
+            os.utime(fname)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return fname
+
+    def store(self, key, write):
+        """
+        Create the entry for `key` by calling write(fileobj) on a temp file,
+        then move it into place; returns the final path.
+        """
+        writer = self.writer(key)
+        try:
+            write(writer.file)
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.commit()
+
+    def writer(self, key):
+        """Incremental writer for `key`: write() chunks, then commit() or abort()."""
+        return _EntryWriter(self, key)
+
+    def _account(self, size):
+        if self.max_bytes <= 0:
+            return
+        with self._lock:
+            self._written += size
+            if (self._bytes is None
+                    or self._written >= self.max_bytes * RESCAN_FRACTION
+                    or time.monotonic() - self._scanned >= RESCAN_SECONDS):
+                self._rescan()
+            else:
+                self._bytes += size
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _rescan(self):
+        """Replace the running estimate by the total on disk."""
+        self._bytes = sum(size for _, size, _ in self._entries())
+        self._written = 0
+        self._scanned = time.monotonic()
+
+    def _entries(self):
+        """[(last use, size, path)] of every entry on disk."""
+        out = []
+        if not os.path.isdir(self.root):
+            return out
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for ent in os.scandir(shard.path):
+                if ent.name.endswith(self.suffix):
+                    try:
+                        st = ent.stat()
+                    except OSError:
+                        continue
+                    out.append((st.st_mtime, st.st_size, ent.path))
+        return out
+
+    def _evict(self):
+        """Drop least recently used entries down to 90 % of the budget."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        for _, size, fname in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(fname)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+        self._bytes = total
+        self._written = 0
+        self._scanned = time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            for _, _, fname in self._entries():
+                try:
+                    os.unlink(fname)
+                except OSError:
+                    pass
+            self._bytes = 0
+            self._written = 0
+            self._scanned = time.monotonic()
+
+    def stats(self):
+        return {
+            "root":      self.root,
+            "max_bytes": self.max_bytes,
+            "bytes":     self._bytes,
+            "hits":      self.hits,
+            "misses":    self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class _EntryWriter:
+    """
+    Temp file in the entry's shard, renamed into place on commit().  The
+    file is only created by the first write, so a writer that is never
+    used leaves nothing behind.
+    """
+
+    def __init__(self, cache, key):
+        self._cache = cache
+        self.path = cache.path_for(key)
+        self._tmp = None
+        self._file = None
+
+    @property
+    def file(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd, self._tmp = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(self.path))
+            self._file = os.fdopen(fd, "wb")
+        return self._file
+
+    def write(self, data):
+        return self.file.write(data)
+
+    def commit(self):
+        self.file.close()
+        size = os.path.getsize(self._tmp)
+        os.replace(self._tmp, self.path)
+        self._file = self._tmp = None
+        self._cache._account(size)
+        return self.path
+
+    def abort(self):
+        if self._file is None:
+            return
+        try:
+            self._file.close()
+        except OSError:
+            pass
+        try:
+            os.unlink(self._tmp)
+        except OSError:
+            pass
+        self._file = self._tmp = None
@@ -0,0 +1,83 @@
+# fieldcache.py
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import select
+
+from models import SessionLocal, StarCatalog
+
+
+def load_field_centres():
+    """
+    One round trip to star_catalogs: returns (names, ra, dec) arrays,
+    one entry per field (OBJECT).
+    """
+    session = SessionLocal()
+    try:
+        stmt = (
+            select(StarCatalog.OBJECT, StarCatalog.RA, StarCatalog.DEC)
+            .group_by(StarCatalog.OBJECT)
+        )
+        rows = session.execute(stmt).all()
+    finally:
+        session.close()
+
+    names = np.array([r[0] for r in rows], dtype=object)
+    ra    = np.array([r[1] for r in rows], dtype=float)
+    dec   = np.array([r[2] for r in rows], dtype=float)
+    return names, ra, dec
+
+
+class FieldCentreCache:
+    """
+    Per-worker copy of the star-catalog field centres.
+
+    The table changes only when a new field is added, so the arrays are
+    loaded once and reused until `ttl` seconds have passed (ttl <= 0
+    disables caching) or until invalidate()/reload() is called.
+    """
+
+    def __init__(self, loader=load_field_centres, ttl=3600.0):
+        self._loader    = loader
+        self.ttl        = float(ttl)
+        self._lock      = threading.Lock()
+        self._arrays    = None
+        self._loaded_at = 0.0
+
+    def _expired(self):
+        return (self._arrays is None or self.ttl <= 0
+                or (time.monotonic() - self._loaded_at) > self.ttl)
+
+    def get(self):
+        """Return (names, ra, dec), reloading first if the copy is stale."""
+        if self._expired():
+            with self._lock:
+                if self._expired():          # another thread may have won
+                    self._store(self._loader())
+        return self._arrays
+
+    def reload(self):
+        """Force a fresh load now; returns the number of fields."""
+        arrays = self._loader()
+        with self._lock:
+            self._store(arrays)
+        return len(arrays[0])
+
+    def invalidate(self):
+        """Drop the cached arrays; the next get() goes to the database."""
+        with self._lock:
+            self._arrays = None
+
+    def _store(self, arrays):
+        self._arrays    = arrays
+        self._loaded_at = time.monotonic()
+
+    def info(self):
+        arrays = self._arrays
+        return {
+            "fields":      0 if arrays is None else len(arrays[0]),
+            "ttl":         self.ttl,
+            "age_seconds": (None if arrays is None
+                            else round(time.monotonic() - self._loaded_at, 1)),
+        }
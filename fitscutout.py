@@ -0,0 +1,131 @@
+# fitscutout.py
+#
+# Square cutouts of a frame around a sky position.
+#
+# The pixel box comes from the frame's Astrometry WCS (not the file
+# header), the pixels are read through HDU.section, so for a
+# tile-compressed .fz image only the tiles overlapping the box are
+# decompressed, and the cutout carries that WCS shifted to its own
+# origin (SIP included) plus the non-WCS cards of the source header.
+# Postage stamps for cubes use pad=True, so every stamp has the same
+# shape even at the frame edge.
+import numpy as np
+from astropy.io import fits
+from astropy.wcs import NoConvergence, Sip
+from astropy.wcs.utils import proj_plane_pixel_scales
+
+
+# Largest cutout side, in pixels
+MAX_CUTOUT_PIX = 1024
+
+# Cards that describe the source array / WCS rather than the observation
+_DROP_PREFIXES = ("CTYPE", "CRVAL", "CRPIX", "CDELT", "CUNIT", "CROTA", "CD1_", "CD2_",
+                  "PC1_", "PC2_", "A_", "B_", "AP_", "BP_", "WCSAXES", "LONPOLE",
+                  "LATPOLE", "RADESYS", "EQUINOX", "MJDREF")
+_DROP_KEYS = {"SIMPLE", "XTENSION", "BITPIX", "NAXIS", "NAXIS1", "NAXIS2", "EXTEND",
+              "PCOUNT", "GCOUNT", "BSCALE", "BZERO", "BLANK", "CHECKSUM", "DATASUM"}
+
+
+def image_hdu(hdul):
+    """First 2-D image HDU of an open file (the CompImageHDU for .fz)."""
+    for hdu in hdul:
+        if isinstance(hdu, (fits.PrimaryHDU, fits.ImageHDU, fits.CompImageHDU)) \
+                and len(hdu.shape) == 2:
+            return hdu
+    return None
+
+
+def _arcmin_per_pixel(wcs):
+    return float(np.mean(proj_plane_pixel_scales(wcs))) * 60.0
+
+
+def size_to_pixels(wcs, size_arcmin):
+    """Cutout side in pixels for a side of size_arcmin at the WCS's mean plate scale."""
+    return int(round(size_arcmin / _arcmin_per_pixel(wcs)))
+
+
+def max_cutout_arcmin(wcs):
+    """Largest cutout side in arcmin (MAX_CUTOUT_PIX at the WCS's mean plate scale)."""
+    return MAX_CUTOUT_PIX * _arcmin_per_pixel(wcs)
+
+
+def stamp_origin(wcs, ra, dec, size_pix):
+    """
+    (ys, xs) 0-based array index of the first pixel of the size_pix box
+    centred on (ra, dec), unclipped; None if (ra, dec) does not project.
+    """
+    try:
+        x, y = wcs.all_world2pix([[ra, dec]], 0)[0]
+    except NoConvergence:                 # far off the frame, SIP diverges
+        return None
+    if not (np.isfinite(x) and np.isfinite(y)):
+        return None
+    # nearest-pixel box
+    return (int(np.floor(y + 0.5 - size_pix / 2.0)),
+            int(np.floor(x + 0.5 - size_pix / 2.0)))
+
+
+def cutout_box(origin, size_pix, shape):
+    """
+    (y0, y1, x0, x1) array slice of the box at `origin` clipped to an
+    image of `shape`; None if the box misses the image.
+    """
+    ys, xs = origin
+    x0, x1 = max(xs, 0), min(xs + size_pix, shape[1])
+    y0, y1 = max(ys, 0), min(ys + size_pix, shape[0])
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return y0, y1, x0, x1
+
+
+def shifted_wcs(wcs, y0, x0):
+    """Copy of `wcs` for an array whose first pixel is source index (y0, x0)."""
+    sub = wcs.deepcopy()
+    sub.wcs.crpix = sub.wcs.crpix - [x0, y0]
+    if sub.sip is not None:
+        sub.sip = Sip(sub.sip.a, sub.sip.b, sub.sip.ap, sub.sip.bp, sub.wcs.crpix)
+        sub.wcs.ctype = ["RA---TAN-SIP", "DEC--TAN-SIP"]
+    return sub
+
+
+def _cutout_header(src_header, wcs, y0, x0):
+    header = fits.Header()
+    for card in src_header.cards:
+        key = card.keyword
+        if key in _DROP_KEYS or key.startswith(_DROP_PREFIXES):
+            continue
+        header.append(card, end=True)
+    header.update(shifted_wcs(wcs, y0, x0).to_header(relax=True))
+    header["CUTX0"] = (x0 + 1, "first source pixel of the cutout (x, 1-based)")
+    header["CUTY0"] = (y0 + 1, "first source pixel of the cutout (y, 1-based)")
+    return header
+
+
+def read_cutout(path, wcs, ra, dec, size_pix, pad=False):
+    """
+    PrimaryHDU with the size_pix x size_pix cutout of the frame at `path`
+    around (ra, dec), or None if the position is off-frame.  Boxes over the
+    frame edge are clipped, or with pad=True kept at full size and filled
+    with NaN.  `wcs` is the frame's solution; it is not modified.
+    """
+    origin = stamp_origin(wcs, ra, dec, size_pix)
+    if origin is None:
+        return None
+    with fits.open(path, ignore_missing_end=True, memmap=True) as hdul:
+        hdu = image_hdu(hdul)
+        if hdu is None:
+            raise ValueError(f"no 2-D image in {path}")
+        box = cutout_box(origin, size_pix, hdu.shape)
+        if box is None:
+            return None
+        y0, y1, x0, x1 = box
+        pixels = hdu.section[y0:y1, x0:x1]
+        if pad:
+            ys, xs = origin
+            data = np.full((size_pix, size_pix), np.nan, dtype=np.float32)
+            data[y0 - ys:y1 - ys, x0 - xs:x1 - xs] = pixels
+            header = _cutout_header(hdu.header, wcs, ys, xs)
+        else:
+            data = np.array(pixels)
+            header = _cutout_header(hdu.header, wcs, y0, x0)
+    return fits.PrimaryHDU(data=data, header=header)
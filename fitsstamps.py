@@ -0,0 +1,145 @@
+# fitsstamps.py
+#
+# Postage stamps of one sky position from many frames, streamed as a
+# single FITS cube or as a zip of per-frame stamp files.
+#
+# Stamps are cut by a small thread pool (the work is NFS reads, so a few
+# threads are enough and more only load the file server) at most `ahead`
+# frames in front of the writer, and go out in frame order as soon as
+# they are ready.  The cube is written by hand: the primary header
+# (NAXIS3 = number of frames) first, then one plane per frame, then a
+# FRAMES binary table with one row per plane.  A frame whose stamp could
+# not be cut stays in the cube as an all-NaN plane with its STATUS in the
+# table, so plane i always belongs to row i.
+import io
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from astropy.io import fits
+
+from lcexport import _Sink
+
+
+# FRAMES table layout: (column, FITS format)
+STAMP_COLUMNS = [
+    ("IHUID",  "J"),
+    ("FNUM",   "J"),
+    ("JD",     "D"),
+    ("OBJECT", "20A"),
+    ("CUTX0",  "J"),
+    ("CUTY0",  "J"),
+    ("STATUS", "10A"),
+]
+
+_BLOCK = 2880
+
+
+def read_stamps(jobs, read, workers=8, ahead=16):
+    """
+    Yield (job, hdu, status) for every job in order, where hdu = read(job)
+    runs in a thread pool; status is ok / offframe (read returned None) /
+    missing (FileNotFoundError) / error.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures, nxt = {}, 0
+        try:
+            for i in range(len(jobs)):
+                while nxt < len(jobs) and nxt < i + ahead:
+                    futures[nxt] = pool.submit(read, jobs[nxt])
+                    nxt += 1
+                try:
+                    hdu = futures.pop(i).result()
+                    yield jobs[i], hdu, "ok" if hdu is not None else "offframe"
+                except FileNotFoundError:
+                    yield jobs[i], None, "missing"
+                except Exception:
+                    yield jobs[i], None, "error"
+        finally:
+            for fut in futures.values():         # client gone: drop queued reads
+                fut.cancel()
+
+
+def _table_row(job, hdu, status):
+    row = {k: job.get(k) for k in ("IHUID", "FNUM", "JD", "OBJECT")}
+    row["CUTX0"] = hdu.header["CUTX0"] if hdu is not None else 0
+    row["CUTY0"] = hdu.header["CUTY0"] if hdu is not None else 0
+    row["STATUS"] = status
+    return row
+
+
+def frames_table(rows):
+    """FRAMES BinTableHDU for the per-stamp rows."""
+    cols = []
+    for name, fmt in STAMP_COLUMNS:
+        values = [r[name] for r in rows]
+        if name == "JD":
+            values = [np.nan if v is None else v for v in values]
+        elif name == "OBJECT":
+            values = [v or "" for v in values]
+        cols.append(fits.Column(name=name, format=fmt, array=np.array(values)))
+    return fits.BinTableHDU.from_columns(cols, name="FRAMES")
+
+
+def _extension_bytes(hdu):
+    """Bytes of `hdu` as an extension (the dummy primary HDU stripped)."""
+    buf = io.BytesIO()
+    fits.HDUList([fits.PrimaryHDU(), hdu]).writeto(buf)
+    skip = len(fits.PrimaryHDU().header.tostring())
+    return buf.getvalue()[skip:]
+
+
+def stream_cube(jobs, read, size_pix, cards=(), workers=8, ahead=16):
+    """
+    FITS bytes of a (len(jobs), size_pix, size_pix) float32 cube plus the
+    FRAMES table; read(job) must return a size_pix x size_pix PrimaryHDU.
+    `cards` are extra (key, value, comment) cards for the primary header.
+    """
+    header = fits.Header([
+        ("SIMPLE", True), ("BITPIX", -32), ("NAXIS", 3),
+        ("NAXIS1", size_pix), ("NAXIS2", size_pix), ("NAXIS3", len(jobs)),
+        ("EXTEND", True),
+    ])
+    header.extend(cards)
+    yield header.tostring().encode("ascii")
+
+    blank = np.full((size_pix, size_pix), np.nan, dtype=">f4").tobytes()
+    rows = []
+    for job, hdu, status in read_stamps(jobs, read, workers, ahead):
+        rows.append(_table_row(job, hdu, status))
+        yield hdu.data.astype(">f4").tobytes() if hdu is not None else blank
+
+    yield b"\0" * (-len(jobs) * len(blank) % _BLOCK)
+    yield _extension_bytes(frames_table(rows))
+
+
+def stream_zip(jobs, read, name, cards=(), workers=8, ahead=16):
+    """
+    Zip of one stamp FITS per readable frame (member name = name(job))
+    plus frames.fits holding the FRAMES table for every job.
+    """
+    sink = _Sink()
+    archive = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED)
+
+    rows = []
+    for job, hdu, status in read_stamps(jobs, read, workers, ahead):
+        rows.append(_table_row(job, hdu, status))
+        if hdu is None:
+            continue
+        hdu.header.extend(cards)
+        hdu.header["IHUID"] = job["IHUID"]
+        hdu.header["FNUM"] = job["FNUM"]
+        if job.get("JD") is not None:
+            hdu.header["JD"] = job["JD"]
+        buf = io.BytesIO()
+        hdu.writeto(buf)
+        archive.writestr(name(job), buf.getvalue())
+        yield sink.drain()
+
+    primary = fits.PrimaryHDU()
+    primary.header.extend(cards)
+    buf = io.BytesIO()
+    fits.HDUList([primary, frames_table(rows)]).writeto(buf)
+    archive.writestr("frames.fits", buf.getvalue())
+    archive.close()
+    yield sink.drain()
@@ -0,0 +1,131 @@
+# fitsstream.py
+#
+# Stream what astropy's HDUList.writeto() produces for a FITS file as a
+# sequence of byte chunks, without building the whole file in memory.
+#
+# writeto() runs in a helper thread against a write-only sink that cuts
+# everything into CHUNK_SIZE pieces and hands them over through a bounded
+# queue, so the response sees its first bytes as soon as the primary
+# header is written, peak memory is ~MAX_QUEUED chunks, and the bytes are
+# exactly those writeto() would have put into a BytesIO.
+import queue
+import threading
+
+from astropy.io import fits
+
+
+CHUNK_SIZE  = 1 << 20      # bytes per yielded chunk
+MAX_QUEUED  = 8            # chunks buffered ahead of the client
+
+_DONE = object()
+
+
+class _QueueSink:
+    """Write-only binary file object feeding a bounded queue."""
+
+    def __init__(self, q, chunk_size, cancelled):
+        self._q = q
+        self._chunk_size = chunk_size
+        self._cancelled = cancelled
+        self._pending = bytearray()
+        self._pos = 0
+        self.closed = False
+        self.mode = "wb"
+
+    def write(self, data):
+        if self._cancelled.is_set():
+            raise BrokenPipeError("FITS stream cancelled")
+        mv = memoryview(data).cast("B")
+        self._pending += mv
+        self._pos += len(mv)
+        while len(self._pending) >= self._chunk_size:
+            self._q.put(bytes(self._pending[:self._chunk_size]))
+            del self._pending[:self._chunk_size]
+        return len(mv)
+
+    def tell(self):                 # astropy records HDU offsets
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def finish(self):
+        if self._pending:
+            self._q.put(bytes(self._pending))
+            self._pending.clear()
+
+
+def stream_fits(hdul, chunk_size=CHUNK_SIZE, max_queued=MAX_QUEUED, on_close=None):
+    """
+    Generator of the bytes hdul.writeto() would write.  `hdul` is an open
+    HDUList; it is closed (and on_close() called) once streaming ends or
+    the client goes away.  A generator that is never started does not
+    close it – the caller must (e.g. Response.call_on_close(hdul.close)).
+    """
+    q = queue.Queue(maxsize=max_queued)
+    cancelled = threading.Event()
+
+    def produce():
+        sink = _QueueSink(q, chunk_size, cancelled)
+        try:
+            hdul.writeto(sink)
+            sink.finish()
+            q.put(_DONE)
+        except BaseException as exc:     # hand the error to the consumer
+            if not cancelled.is_set():
+                q.put(exc)
+
+    worker = threading.Thread(target=produce, name="fits-stream", daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        cancelled.set()
+        # unblock a producer stuck on a full queue, then let it finish
+        while worker.is_alive():
+            try:
+                q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        hdul.close()
+        if on_close is not None:
+            on_close()
+
+
+def open_for_stream(path):
+    """Open a FITS file the way serve_fits always has, but memory-mapped."""
+    return fits.open(path, ignore_missing_end=True, memmap=True)
+
+
+def tee(chunks, writer):
+    """
+    Pass `chunks` through while copying them into a DiskCache writer; the
+    entry is committed only if the stream ran to the end.  A failing cache
+    write (e.g. a full disk) drops the copy and the stream carries on.
+    """
+    try:
+        for chunk in chunks:
+            if writer is not None:
+                try:
+                    writer.write(chunk)
+                except Exception:
+                    writer.abort()
+                    writer = None
+            yield chunk
+        if writer is not None:
+            try:
+                writer.commit()
+            except Exception:
+                pass            # abort() below drops the temp file
+            else:
+                writer = None
+    finally:
+        if writer is not None:
+            writer.abort()
+        chunks.close()
@@ -0,0 +1,105 @@
+# fitsthumbs.py
+#
+# Quick-look PNG thumbnails of RED / SUB frames.
+#
+# The image is block-averaged down to at most `max_side` pixels a side
+# while it is read: HDU.section is pulled in bands of whole rows, so a
+# .fz frame is decompressed one band of tiles at a time (every tile once)
+# and never sits in memory as a full float image.  The result is
+# zscale-stretched (astropy's ZScaleInterval, as JS9 / ds9 default to)
+# into 8-bit grey and written as a PNG with zlib alone.
+#
+# Thumbnails live in a DiskCache keyed on source path + mtime/size and
+# side, so a re-reduced frame gets a fresh one; pregenerate_thumbnails.py
+# fills the cache for new nights ahead of the first viewer.
+import json
+import math
+import os
+import struct
+import zlib
+
+import numpy as np
+from astropy.io import fits
+from astropy.visualization import ZScaleInterval
+
+from diskcache import DiskCache
+from fitscutout import image_hdu
+
+
+THUMB_SIZE     = 512           # default longest side, pixels
+MAX_THUMB_SIZE = 2048
+BAND_ROWS      = 256           # source rows decompressed per section read
+
+THUMB_CACHE_DIR = os.environ.get(
+    "HATPI_THUMB_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "thumbs"),
+)
+THUMB_CACHE_BYTES = int(os.environ.get("HATPI_THUMB_CACHE_BYTES", str(2 * 1024**3)))
+
+thumb_cache = DiskCache(THUMB_CACHE_DIR, THUMB_CACHE_BYTES, ".png")
+
+
+def downsample(hdu, max_side):
+    """Block mean of a 2-D image HDU to <= max_side a side (edge remainder dropped)."""
+    ny, nx = hdu.shape
+    step = max(1, math.ceil(max(ny, nx) / max_side))
+    oy, ox = ny // step, nx // step
+    band = step * max(1, BAND_ROWS // step)
+    out = np.empty((oy, ox), dtype=np.float32)
+    for y0 in range(0, oy * step, band):
+        y1 = min(y0 + band, oy * step)
+        block = np.asarray(hdu.section[y0:y1, 0:ox * step], dtype=np.float32)
+        out[y0 // step:y1 // step] = block.reshape(
+            (y1 - y0) // step, step, ox, step).mean(axis=(1, 3))
+    return out
+
+
+def zscale_u8(img):
+    """8-bit zscale stretch; non-finite pixels become black."""
+    finite = np.isfinite(img)
+    if not finite.any():
+        return np.zeros(img.shape, dtype=np.uint8)
+    lo, hi = ZScaleInterval().get_limits(img[finite])
+    scaled = (img - lo) / (hi - lo) if hi > lo else np.zeros_like(img)
+    scaled = np.clip(np.where(finite, scaled, 0.0), 0.0, 1.0)
+    return (scaled * 255.0 + 0.5).astype(np.uint8)
+
+
+def _png_chunk(tag, data):
+    return (struct.pack(">I", len(data)) + tag + data
+            + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF))
+
+
+def encode_png(gray):
+    """8-bit greyscale PNG of a 2-D uint8 array (first row = top)."""
+    h, w = gray.shape
+    raw = np.zeros((h, w + 1), dtype=np.uint8)      # filter byte 0 per row
+    raw[:, 1:] = gray
+    return (b"\x89PNG\r\n\x1a\n"
+            + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 0, 0, 0, 0))
+            + _png_chunk(b"IDAT", zlib.compress(raw.tobytes(), 6))
+            + _png_chunk(b"IEND", b""))
+
+
+def render_thumbnail(path, max_side=THUMB_SIZE):
+    """PNG bytes of the frame at `path`, FITS row 1 at the bottom as JS9 shows it."""
+    with fits.open(path, ignore_missing_end=True, memmap=True) as hdul:
+        hdu = image_hdu(hdul)
+        if hdu is None:
+            raise ValueError(f"no 2-D image in {path}")
+        img = downsample(hdu, max_side)
+    return encode_png(zscale_u8(img)[::-1])
+
+
+def thumb_key(path, st, max_side):
+    return json.dumps(["thumb", path, st.st_mtime_ns, st.st_size, max_side])
+
+
+def cached_thumbnail(path, max_side=THUMB_SIZE, st=None):
+    """Path of the cached PNG for `path`, rendering and storing it on a miss."""
+    key = thumb_key(path, st or os.stat(path), max_side)
+    fname = thumb_cache.lookup(key)
+    if fname is None:
+        png = render_thumbnail(path, max_side)
+        fname = thumb_cache.store(key, lambda fh: fh.write(png))
+    return fname
@@ -0,0 +1,454 @@
+# footprints.py
+#
+# Precomputed sky footprints of astrometrically solved frames.
+#
+# Every solved frame gets a bounding cap (centre + radius, from its full
+# TAN+SIP solution) and is registered in each sky cell that cap touches.
+# A coordinate search then reads one cell instead of pulling every frame of
+# the candidate fields out of HPCALIB.
+#
+# Cells are declination bands of CELL_DEG height, each split into RA cells
+# of roughly CELL_DEG width (fewer towards the poles) – an equal-area-ish
+# pixelization in the spirit of HEALPix that needs nothing beyond NumPy.
+#
+# HPCALIB is read-only for us, so the index lives in its own database
+# (HATPI_FOOTPRINT_DB_URL, default: a local SQLite file).
+#
+# The index is kept per field (OBJECT).  For every field it records the
+# state of its solved frames in HPCALIB (count, FNUM sum, CRVAL sum – see
+# field_states) as of the last update.  An update only revisits fields
+# whose state changed, and there compares each solved frame with the
+# solution hash it was indexed from, so late (out-of-order) solves are
+# added, re-solved frames re-indexed and frames that lost their solution
+# dropped.  Searches use the same comparison (coverage): a candidate field
+# whose state moved on since the update is searched in full, the others
+# through the cells.  Frames whose solution gives no usable cap are kept
+# without one, and searches check them directly.
+#
+# Build / update:   python footprints.py            (incremental)
+#                   python footprints.py --rebuild
+import argparse
+import hashlib
+import json
+import math
+import os
+
+import numpy as np
+from sqlalchemy import (
+    create_engine,
+    Column,
+    Integer,
+    BigInteger,
+    Float,
+    String,
+    Index,
+    select,
+    func,
+    delete,
+    inspect,
+    or_,
+    tuple_,
+)
+from sqlalchemy.orm import sessionmaker, declarative_base
+
+from models import SessionLocal, Frame, Astrometry
+from mywcs import stack_wcs_pars, batch_pix2world
+from searchcache import get_search_cache
+
+
+FOOTPRINT_DB_URL = os.environ.get(
+    "HATPI_FOOTPRINT_DB_URL",
+    "sqlite:///" + os.path.join(os.path.dirname(os.path.abspath(__file__)), "footprints.sqlite"),
+)
+
+CELL_DEG = 4.0          # band height / nominal cell width (deg)
+CAP_PAD  = 1.01         # safety factor on the cap radius
+CCD_EXTENT = (0, 2048, 0, 2048)
+
+
+FootprintBase = declarative_base()
+
+
+class FrameFootprint(FootprintBase):
+    __tablename__ = 'frame_footprints'
+
+    IHUID  = Column(Integer, primary_key=True)
+    FNUM   = Column(Integer, primary_key=True)
+    OBJECT = Column(String(20))
+    RA     = Column(Float)      # cap centre (deg)
+    DEC    = Column(Float)
+    RADIUS = Column(Float)      # cap radius (deg); NULL: no usable cap
+    WCSHASH = Column(String(40))   # solution the cap was built from (wcs_hash)
+
+    def __repr__(self):
+        return (f"<FrameFootprint IHUID={self.IHUID}, FNUM={self.FNUM}, "
+                f"RA={self.RA}, DEC={self.DEC}, R={self.RADIUS}>")
+
+
+class FootprintCell(FootprintBase):
+    __tablename__ = 'frame_footprint_cells'
+    __table_args__ = (Index("ix_footprint_cell", "cell"), )
+
+    cell  = Column(Integer, primary_key=True)
+    IHUID = Column(Integer, primary_key=True)
+    FNUM  = Column(Integer, primary_key=True)
+
+
+class IndexedField(FootprintBase):
+    __tablename__ = 'frame_footprint_fields'
+
+    OBJECT    = Column(String(20), primary_key=True)    # '' for frames without one
+    n_solved  = Column(Integer)                         # field_states() at the last update
+    fnum_sum  = Column(BigInteger)
+    crval_sum = Column(Float)
+
+
+footprint_engine = create_engine(FOOTPRINT_DB_URL, echo=False, pool_pre_ping=True)
+FootprintSession = sessionmaker(bind=footprint_engine)
+
+
+# -----------------------------------------------------------------------------
+# Sky cells
+# -----------------------------------------------------------------------------
+def _n_bands():
+    return int(round(180.0 / CELL_DEG))
+
+
+def _n_ra(band):
+    """Number of RA cells in a dec band (sized at the band's widest edge)."""
+    h = 180.0 / _n_bands()
+    lo = -90.0 + band * h
+    widest = min(abs(lo), abs(lo + h)) if lo * (lo + h) > 0 else 0.0
+    return max(1, int(math.ceil(360.0 * math.cos(math.radians(widest)) / h)))
+
+
+def sky_cell(ra_deg, dec_deg):
+    """Cell id containing (ra_deg, dec_deg)."""
+    nb = _n_bands()
+    band = min(nb - 1, max(0, int((dec_deg + 90.0) * nb / 180.0)))
+    nra = _n_ra(band)
+    return band * 1000 + min(nra - 1, int((ra_deg % 360.0) * nra / 360.0))
+
+
+def cells_for_cap(ra_deg, dec_deg, radius_deg):
+    """All cell ids touched by the cap (conservative)."""
+    nb = _n_bands()
+    h = 180.0 / nb
+    b_lo = max(0, int((dec_deg - radius_deg + 90.0) / h))
+    b_hi = min(nb - 1, int((dec_deg + radius_deg + 90.0) / h))
+
+    if abs(dec_deg) + radius_deg >= 90.0:
+        half_width = 180.0                       # cap contains / touches a pole
+    else:
+        half_width = math.degrees(math.asin(min(1.0,
+                     math.sin(math.radians(radius_deg)) / math.cos(math.radians(dec_deg)))))
+
+    cells = []
+    for band in range(b_lo, b_hi + 1):
+        nra = _n_ra(band)
+        if half_width >= 180.0:
+            cells.extend(band * 1000 + i for i in range(nra))
+            continue
+        i_lo = int(math.floor((ra_deg - half_width) * nra / 360.0))
+        i_hi = int(math.floor((ra_deg + half_width) * nra / 360.0))
+        idx = {i % nra for i in range(i_lo, i_hi + 1)}
+        cells.extend(band * 1000 + i for i in sorted(idx))
+    return cells
+
+
+def _unit(ra_deg, dec_deg):
+    ra, dec = np.radians(ra_deg), np.radians(dec_deg)
+    return np.stack([np.cos(dec) * np.cos(ra),
+                     np.cos(dec) * np.sin(ra),
+                     np.sin(dec)], axis=-1)
+
+
+# -----------------------------------------------------------------------------
+# Footprint geometry
+# -----------------------------------------------------------------------------
+def footprint_caps(pars, extent=CCD_EXTENT, samples_per_side=5):
+    """
+    Bounding caps for a batch of solutions (Astrometry.wcs_pars tuples).
+    Returns (ra, dec, radius) arrays; the radius covers the CCD outline
+    sampled along every edge, padded by CAP_PAD.
+    """
+    stacked = stack_wcs_pars(pars)
+    t = np.linspace(0.0, 1.0, samples_per_side)
+    x0, x1, y0, y1 = extent
+    edge_x = np.concatenate([x0 + (x1 - x0) * t, np.full_like(t, x1),
+                             x1 - (x1 - x0) * t, np.full_like(t, x0)])
+    edge_y = np.concatenate([np.full_like(t, y0), y0 + (y1 - y0) * t,
+                             np.full_like(t, y1), y1 - (y1 - y0) * t])
+
+    ra_c, dec_c = batch_pix2world((x0 + x1) / 2.0, (y0 + y1) / 2.0, stacked)
+    ra_e, dec_e = batch_pix2world(edge_x[None, :], edge_y[None, :], stacked)
+
+    cosd = np.einsum("nk,nmk->nm", _unit(ra_c, dec_c), _unit(ra_e, dec_e))
+    radius = np.degrees(np.arccos(np.clip(cosd.min(axis=1), -1.0, 1.0))) * CAP_PAD
+    return ra_c, dec_c, radius
+
+
+# -----------------------------------------------------------------------------
+# Query side
+# -----------------------------------------------------------------------------
+def index_available():
+    """True once the footprint tables exist and hold at least one frame."""
+    try:
+        session = FootprintSession()
+        try:
+            return session.execute(select(FrameFootprint.IHUID).limit(1)).first() is not None
+        finally:
+            session.close()
+    except Exception:
+        return False
+
+
+def _field_clause(col, field):
+    return or_(col.is_(None), col == "") if field == "" else col == field
+
+
+def field_states(fields=None):
+    """
+    {OBJECT: (solved frames, sum of their FNUM, sum of CRVAL1 + CRVAL2)}
+    from HPCALIB, for `fields` or every field; frames without an OBJECT
+    count under ''.  Changes whenever a frame of the field is solved,
+    re-solved or loses its solution.
+    """
+    stmt = (
+        select(Frame.OBJECT, func.count(), func.sum(Astrometry.FNUM),
+               func.sum(Astrometry.CRVAL1 + Astrometry.CRVAL2))
+        .select_from(Astrometry)
+        .join(Frame, (Frame.IHUID == Astrometry.IHUID) & (Frame.FNUM == Astrometry.FNUM))
+        .where(Astrometry.exit_code == 0)
+        .where(Astrometry.CRVAL1.isnot(None))
+        .group_by(Frame.OBJECT)
+    )
+    if fields is not None:
+        stmt = stmt.where(Frame.OBJECT.in_(sorted(fields)))
+    session = SessionLocal()
+    try:
+        rows = session.execute(stmt).all()
+    finally:
+        session.close()
+    states = {}
+    for obj, n, fsum, csum in rows:
+        old = states.get(obj or "", (0, 0, 0.0))
+        states[obj or ""] = (old[0] + int(n), old[1] + int(fsum or 0), old[2] + float(csum or 0.0))
+    return states
+
+
+def _indexed_states(fp_session, fields=None):
+    """{OBJECT: state} the index was last brought up to date with."""
+    stmt = select(IndexedField.OBJECT, IndexedField.n_solved,
+                  IndexedField.fnum_sum, IndexedField.crval_sum)
+    if fields is not None:
+        stmt = stmt.where(IndexedField.OBJECT.in_(sorted(fields)))
+    return {obj: (n, fsum, csum) for obj, n, fsum, csum in fp_session.execute(stmt)}
+
+
+def _same_state(a, b):
+    # the CRVAL sums come from different summation orders: compare loosely
+    return (a is not None and b is not None and tuple(a[:2]) == tuple(b[:2])
+            and math.isclose(a[2], b[2], rel_tol=1e-12, abs_tol=1e-9))
+
+
+def coverage(fields):
+    """
+    (stale, uncapped) for a search over the candidate `fields`: the fields
+    whose solved frames changed since the last update, which the search
+    has to cover in full, and the (IHUID, FNUM) of indexed frames of the
+    other fields that have no cap, which it has to check directly.
+    """
+    fields = sorted(set(fields))
+    if not fields:
+        return [], []
+    current = field_states(fields)
+    session = FootprintSession()
+    try:
+        indexed = _indexed_states(session, fields)
+        stale = [f for f in fields if f in current and not _same_state(current[f], indexed.get(f))]
+        fresh = [f for f in fields if f not in stale]
+        uncapped = session.execute(
+            select(FrameFootprint.IHUID, FrameFootprint.FNUM)
+            .where(FrameFootprint.OBJECT.in_(fresh))
+            .where(FrameFootprint.RADIUS.is_(None))
+        ).all() if fresh else []
+    finally:
+        session.close()
+    return stale, [(ihu, fnum) for ihu, fnum in uncapped]
+
+
+def lookup_frames(ra_deg, dec_deg, skip_fields=()):
+    """
+    (IHUID, FNUM) pairs of indexed frames whose footprint cap contains
+    (ra_deg, dec_deg), leaving out frames of `skip_fields`.  A superset of
+    the frames that pass the exact on-CCD check.
+    """
+    stmt = (
+        select(FrameFootprint.IHUID, FrameFootprint.FNUM,
+               FrameFootprint.RA, FrameFootprint.DEC, FrameFootprint.RADIUS)
+        .join(FootprintCell, (FootprintCell.IHUID == FrameFootprint.IHUID)
+                             & (FootprintCell.FNUM == FrameFootprint.FNUM))
+        .where(FootprintCell.cell == sky_cell(ra_deg, dec_deg))
+    )
+    if skip_fields:
+        stmt = stmt.where(or_(FrameFootprint.OBJECT.is_(None),
+                              FrameFootprint.OBJECT.notin_(list(skip_fields))))
+    session = FootprintSession()
+    try:
+        rows = session.execute(stmt).all()
+    finally:
+        session.close()
+
+    if not rows:
+        return []
+    arr = np.array([r[2:] for r in rows], dtype=float)
+    cosd = _unit(arr[:, 0], arr[:, 1]) @ _unit(ra_deg, dec_deg)
+    inside = cosd >= np.cos(np.radians(arr[:, 2]))
+    return [(r[0], r[1]) for r, hit in zip(rows, inside) if hit]
+
+
+# -----------------------------------------------------------------------------
+# Builder
+# -----------------------------------------------------------------------------
+def wcs_hash(ast):
+    """Fingerprint of an Astrometry row's solution (changes when it is re-solved)."""
+    return hashlib.sha1(json.dumps(ast._wcs_fingerprint, default=str).encode()).hexdigest()
+
+
+def _ensure_schema():
+    """Create the tables; an index from before WCSHASH existed is rebuilt."""
+    cols = {c["name"] for c in inspect(footprint_engine).get_columns("frame_footprints")} \
+        if inspect(footprint_engine).has_table("frame_footprints") else None
+    if cols is not None and "WCSHASH" not in cols:
+        print("  footprint index predates solution hashes – rebuilding")
+        FootprintBase.metadata.drop_all(footprint_engine)
+    FootprintBase.metadata.create_all(footprint_engine)
+
+
+def _drop_frames(fp_session, pairs):
+    for i in range(0, len(pairs), 500):
+        chunk = pairs[i:i + 500]
+        fp_session.execute(delete(FootprintCell).where(
+            tuple_(FootprintCell.IHUID, FootprintCell.FNUM).in_(chunk)))
+        fp_session.execute(delete(FrameFootprint).where(
+            tuple_(FrameFootprint.IHUID, FrameFootprint.FNUM).in_(chunk)))
+
+
+def _index_chunk(fp_session, chunk, indexed):
+    """
+    (Re)index the (Astrometry, OBJECT) rows of `chunk` whose solution hash
+    differs from `indexed` (popping every key seen); returns their count.
+    """
+    todo = []
+    for ast, obj in chunk:
+        h = wcs_hash(ast)
+        if indexed.pop((ast.IHUID, ast.FNUM), None) != h:
+            todo.append((ast, obj, h))
+    if not todo:
+        return 0
+
+    # also clears rows a frame left under another OBJECT
+    _drop_frames(fp_session, [(ast.IHUID, ast.FNUM) for ast, _, _ in todo])
+    pars = [ast._parse_wcs_pars() for ast, _, _ in todo]   # bypass wcs_cache
+    ok = [i for i, p in enumerate(pars) if p is not None]
+    caps = np.full((len(todo), 3), np.nan)
+    if ok:
+        caps[ok] = np.column_stack(footprint_caps([pars[i] for i in ok]))
+    for (ast, obj, h), (ra, dec, rad) in zip(todo, caps):
+        if not np.isfinite(rad):
+            # no usable cap: kept so coverage() hands it to searches directly
+            fp_session.add(FrameFootprint(IHUID=ast.IHUID, FNUM=ast.FNUM, OBJECT=obj,
+                                          WCSHASH=h))
+            continue
+        fp_session.add(FrameFootprint(IHUID=ast.IHUID, FNUM=ast.FNUM, OBJECT=obj,
+                                      RA=float(ra), DEC=float(dec),
+                                      RADIUS=float(rad), WCSHASH=h))
+        fp_session.add_all(FootprintCell(cell=c, IHUID=ast.IHUID, FNUM=ast.FNUM)
+                           for c in cells_for_cap(ra, dec, rad))
+    return len(todo)
+
+
+def build_footprint_index(rebuild=False, batch_size=5000):
+    """
+    Bring the index in line with the solved frames in HPCALIB.
+
+    Only fields whose state (field_states) differs from the one recorded
+    at the last update are revisited; in those, frames are (re)indexed
+    where their solution hash changed and dropped where they lost their
+    solution.  Use rebuild=True to start from scratch.
+    Cached searches over the revisited fields are invalidated.
+    Returns the number of frames (re)indexed.
+    """
+    _ensure_schema()
+
+    fp_session = FootprintSession()
+    if rebuild:
+        fp_session.execute(delete(FootprintCell))
+        fp_session.execute(delete(FrameFootprint))
+        fp_session.execute(delete(IndexedField))
+        fp_session.commit()
+
+    current = field_states()
+    recorded = _indexed_states(fp_session)
+    todo = sorted(f for f in set(current) | set(recorded)
+                  if not _same_state(current.get(f), recorded.get(f)))
+    print(f"  {len(todo)} of {len(set(current) | set(recorded))} fields changed")
+
+    added = 0
+    session = SessionLocal()
+    try:
+        for i, field in enumerate(todo, 1):
+            indexed = {(ihu, fnum): h for ihu, fnum, h in fp_session.execute(
+                select(FrameFootprint.IHUID, FrameFootprint.FNUM, FrameFootprint.WCSHASH)
+                .where(_field_clause(FrameFootprint.OBJECT, field)))}
+            stmt = (
+                select(Astrometry, Frame.OBJECT)
+                .join(Frame, (Frame.IHUID == Astrometry.IHUID) & (Frame.FNUM == Astrometry.FNUM))
+                .where(Astrometry.exit_code == 0)
+                .where(Astrometry.CRVAL1.isnot(None))
+                .where(_field_clause(Frame.OBJECT, field))
+                .order_by(Astrometry.IHUID, Astrometry.FNUM)
+                .execution_options(yield_per=batch_size)
+            )
+            n = 0
+            for chunk in session.execute(stmt).partitions(batch_size):
+                n += _index_chunk(fp_session, chunk, indexed)
+                fp_session.commit()
+
+            # left over: indexed frames without a usable solution any more
+            _drop_frames(fp_session, list(indexed))
+            fp_session.execute(delete(IndexedField).where(IndexedField.OBJECT == field))
+            if field in current:
+                n_solved, fnum_sum, crval_sum = current[field]
+                fp_session.add(IndexedField(OBJECT=field, n_solved=n_solved,
+                                            fnum_sum=fnum_sum, crval_sum=crval_sum))
+            fp_session.commit()
+            added += n
+            print(f"  [{i}/{len(todo)}] {field or '(no OBJECT)'}: {n} frames indexed, "
+                  f"{len(indexed)} dropped")
+    finally:
+        session.close()
+        fp_session.close()
+
+    # cached searches over these fields may now be missing frames
+    changed_fields = set(todo) - {""}
+    if changed_fields:
+        cache = get_search_cache()
+        n = cache.invalidate_fields(changed_fields)
+        print(f"  invalidated {n} cached searches over {len(changed_fields)} fields")
+        if not cache.shared:
+            print("  note: the search cache is per-process (memory); web workers only "
+                  f"see these frames once their entries expire ({cache.ttl:.0f} s)")
+    return added
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build / update the frame footprint index.")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="drop the index and rebuild it from scratch")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    n = build_footprint_index(rebuild=args.rebuild, batch_size=args.batch_size)
+    print(f"Footprint index updated: {n} frames added.")
@@ -0,0 +1,89 @@
+# framefiles.py
+#
+# Where the reduced frames live on disk:
+#
+#   <FITS_ROOT | SUB_ROOT>/<date_dir>/ihuNN/<base>-red|-sub.fits[.fz]
+#
+# Shared by the web app and the batch tools that walk nights directly.
+import os
+import time
+
+
+# Base directory where  RED FITS sub-folders live
+FITS_ROOT = "/nfs/php2/ar3/P/HP1/REDUCTION/RED"
+SUB_ROOT = "/nfs/php2/ar3/P/HP1/REDUCTION/SUB"
+
+KINDS = ("red", "sub")
+
+
+def kind_root(kind):
+    return FITS_ROOT if kind == "red" else SUB_ROOT
+
+
+def frame_base(frame_name):
+    """Frame.frame_name without .fits / .fz and any -red / -sub suffix."""
+    base = (frame_name or "").strip()
+    # strip compression + .fits
+    for ext in (".fits", ".fz"):
+        if base.lower().endswith(ext):
+            base = base[:-len(ext)]
+    # strip any existing "-red" or "-sub"
+    if base.lower().endswith("-red"):
+        base = base[:-4]
+    if base.lower().endswith("-sub"):
+        base = base[:-4]
+    return base
+
+
+def frame_candidates(kind, frame_name):
+    """File names a <kind> frame may have, in the order /fits prefers them."""
+    base = frame_base(frame_name)
+    return [f"{base}-{kind}.fits.fz", f"{base}-{kind}.fits"]
+
+
+def frame_dir(root, date_dir, ihuid):
+    return os.path.join(root, (date_dir or "").strip(), f"ihu{ihuid:02d}")
+
+
+def recent_nights(root, days):
+    """
+    date_dir names under root with files added in the last `days` days,
+    oldest first.  New frames land in <date_dir>/ihuNN, which only bumps
+    the mtime of that ihuNN directory, so those are what is checked.
+    """
+    cutoff = time.time() - days * 86400.0
+    nights = []
+    for ent in os.scandir(root):
+        try:
+            if not ent.is_dir():
+                continue
+            if ent.stat().st_mtime >= cutoff or any(
+                    sub.is_dir() and sub.name.startswith("ihu") and sub.stat().st_mtime >= cutoff
+                    for sub in os.scandir(ent.path)):
+                nights.append(ent.name)
+        except OSError:
+            continue
+    return sorted(nights)
+
+
+def iter_night_files(root, night, kind):
+    """
+    Paths of every <kind> frame of one night, one per frame: the .fits.fz
+    when both it and a plain .fits exist (the copy /fits would serve).
+    """
+    night_dir = os.path.join(root, night)
+    try:
+        ihu_dirs = sorted(e.path for e in os.scandir(night_dir)
+                          if e.is_dir() and e.name.startswith("ihu"))
+    except OSError:
+        return
+    for ihu_dir in ihu_dirs:
+        try:
+            names = set(os.listdir(ihu_dir))
+        except OSError:
+            continue
+        for name in sorted(names):
+            if name.endswith(f"-{kind}.fits.fz"):
+                yield os.path.join(ihu_dir, name)
+            elif name.endswith(f"-{kind}.fits") and name + ".fz" not in names:
+                yield os.path.join(ihu_dir, name)
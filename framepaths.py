@@ -0,0 +1,272 @@
+# framepaths.py
+#
+# Resolved-path index: (kind, IHUID, FNUM) → the RED / SUB file /fits
+# serves and its compression, so a request does not stat candidate names
+# on NFS.
+#
+# The scanner lists each <root>/<date_dir>/ihuNN directory once (nights
+# run in a thread pool – the work is NFS round trips, not CPU) and matches
+# that night's Frame rows against the listings with the same naming rule
+# serve_fits uses (framefiles.frame_candidates).  Each scanned night keeps
+# a signature – the mtimes of its ihuNN directories plus its Frame count –
+# and is only rescanned when that changes, so nightly runs touch only new
+# or re-reduced nights.
+#
+# HPCALIB is read-only for us, so the index lives in its own database like
+# the footprint index (HATPI_FRAMEPATH_DB_URL, default: a local SQLite
+# file).  Frames the index does not know yet fall back to probing.
+#
+# Build / update:   python framepaths.py                  (changed nights)
+#                   python framepaths.py --recent-days 3 --workers 16
+#                   python framepaths.py --nights 1-20240101 --kind red
+#                   python framepaths.py --rebuild
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import (
+    create_engine,
+    Column,
+    Integer,
+    Float,
+    String,
+    Text,
+    Index,
+    select,
+    func,
+    delete,
+    tuple_,
+)
+from sqlalchemy.orm import sessionmaker, declarative_base
+
+from framefiles import KINDS, frame_candidates, frame_dir, kind_root, recent_nights
+from models import SessionLocal, Frame
+
+
+FRAMEPATH_DB_URL = os.environ.get(
+    "HATPI_FRAMEPATH_DB_URL",
+    "sqlite:///" + os.path.join(os.path.dirname(os.path.abspath(__file__)), "framepaths.sqlite"),
+)
+
+# (IHUID, FNUM) pairs per IN (...) in lookup_many
+LOOKUP_CHUNK = 500
+
+
+FramePathBase = declarative_base()
+
+
+class FramePath(FramePathBase):
+    __tablename__ = 'frame_paths'
+    __table_args__ = (Index("ix_frame_paths_night", "kind", "night"), )
+
+    kind        = Column(String(3), primary_key=True)     # 'red' / 'sub'
+    IHUID       = Column(Integer, primary_key=True)
+    FNUM        = Column(Integer, primary_key=True)
+    night       = Column(String(20))                      # Frame.date_dir
+    path        = Column(String(512))
+    compression = Column(String(5))                       # '.fz' or ''
+
+    def __repr__(self):
+        return f"<FramePath {self.kind} IHUID={self.IHUID}, FNUM={self.FNUM}, {self.path}>"
+
+
+class ScannedNight(FramePathBase):
+    __tablename__ = 'frame_path_nights'
+
+    kind       = Column(String(3), primary_key=True)
+    night      = Column(String(20), primary_key=True)
+    signature  = Column(Text)
+    n_files    = Column(Integer)
+    scanned_at = Column(Float)
+
+
+framepath_engine = create_engine(FRAMEPATH_DB_URL, echo=False, pool_pre_ping=True)
+FramePathSession = sessionmaker(bind=framepath_engine)
+
+
+# -----------------------------------------------------------------------------
+# Query side
+# -----------------------------------------------------------------------------
+def lookup(kind, ihuid, fnum):
+    """Indexed path of one frame, or None (not indexed / no index yet)."""
+    try:
+        session = FramePathSession()
+        try:
+            return session.execute(
+                select(FramePath.path)
+                .where(FramePath.kind == kind, FramePath.IHUID == ihuid, FramePath.FNUM == fnum)
+            ).scalar()
+        finally:
+            session.close()
+    except Exception:
+        return None
+
+
+def lookup_many(kind, pairs):
+    """{(IHUID, FNUM): path} for the indexed frames among `pairs`."""
+    found = {}
+    try:
+        session = FramePathSession()
+        try:
+            for i in range(0, len(pairs), LOOKUP_CHUNK):
+                rows = session.execute(
+                    select(FramePath.IHUID, FramePath.FNUM, FramePath.path)
+                    .where(FramePath.kind == kind)
+                    .where(tuple_(FramePath.IHUID, FramePath.FNUM).in_(pairs[i:i + LOOKUP_CHUNK]))
+                ).all()
+                found.update(((ihu, fnum), path) for ihu, fnum, path in rows)
+        finally:
+            session.close()
+    except Exception:
+        return {}
+    return found
+
+
+# -----------------------------------------------------------------------------
+# Scanner
+# -----------------------------------------------------------------------------
+def _night_frames(night):
+    """[(IHUID, FNUM, frame_name)] of one night from HPCALIB."""
+    session = SessionLocal()
+    try:
+        return session.execute(
+            select(Frame.IHUID, Frame.FNUM, Frame.frame_name).where(Frame.date_dir == night)
+        ).all()
+    finally:
+        session.close()
+
+
+def _signature(root, night, n_frames):
+    """Directory mtimes of the night's ihuNN folders + its Frame count."""
+    mtimes = {}
+    try:
+        for ent in os.scandir(os.path.join(root, night)):
+            if ent.is_dir() and ent.name.startswith("ihu"):
+                mtimes[ent.name] = ent.stat().st_mtime_ns
+    except OSError:
+        pass
+    return json.dumps({"frames": n_frames, "dirs": mtimes}, sort_keys=True)
+
+
+def scan_night(kind, night, previous=None):
+    """
+    Worker: (status, signature, rows) for one night, status being
+    "unchanged" (signature == previous, rows None) or "scanned" with rows
+    = [(IHUID, FNUM, path, compression)].
+    """
+    root = kind_root(kind)
+    frames = _night_frames(night)
+    signature = _signature(root, night, len(frames))
+    if signature == previous:
+        return "unchanged", signature, None
+
+    listings = {}
+    rows = []
+    for ihuid, fnum, frame_name in frames:
+        dirpath = frame_dir(root, night, ihuid)
+        if dirpath not in listings:
+            try:
+                listings[dirpath] = set(os.listdir(dirpath))
+            except OSError:
+                listings[dirpath] = set()
+        for fname in frame_candidates(kind, frame_name):
+            if fname in listings[dirpath]:
+                rows.append((ihuid, fnum, os.path.join(dirpath, fname),
+                             ".fz" if fname.endswith(".fz") else ""))
+                break
+    return "scanned", signature, rows
+
+
+def _all_nights():
+    session = SessionLocal()
+    try:
+        return sorted(n for (n,) in session.execute(
+            select(Frame.date_dir).where(Frame.date_dir.isnot(None)).distinct()) if n)
+    finally:
+        session.close()
+
+
+def build_path_index(kinds=KINDS, nights=None, recent_days=None, workers=8, rebuild=False):
+    """
+    Scan the given nights (default: every Frame.date_dir, or those touched
+    in the last `recent_days`) and replace their index rows where the
+    night's signature changed.  Returns {status: nights}.
+    """
+    FramePathBase.metadata.create_all(framepath_engine)
+
+    fp_session = FramePathSession()
+    if rebuild:
+        fp_session.execute(delete(FramePath))
+        fp_session.execute(delete(ScannedNight))
+        fp_session.commit()
+    previous = {(k, n): sig for k, n, sig in fp_session.execute(
+        select(ScannedNight.kind, ScannedNight.night, ScannedNight.signature))}
+
+    jobs = []
+    for kind in kinds:
+        if nights:
+            todo = nights
+        elif recent_days is not None:
+            todo = recent_nights(kind_root(kind), recent_days)
+        else:
+            todo = _all_nights()
+        jobs.extend((kind, night) for night in todo)
+
+    counts, n_paths = {}, 0
+    t0 = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(lambda job: (job, scan_night(*job, previous.get(job))), jobs)
+            for i, ((kind, night), (status, signature, rows)) in enumerate(results, 1):
+                counts[status] = counts.get(status, 0) + 1
+                if status == "scanned":
+                    fp_session.execute(delete(FramePath).where(FramePath.kind == kind,
+                                                               FramePath.night == night))
+                    fp_session.add_all(FramePath(kind=kind, IHUID=ihu, FNUM=fnum, night=night,
+                                                 path=path, compression=comp)
+                                       for ihu, fnum, path, comp in rows)
+                    fp_session.merge(ScannedNight(kind=kind, night=night, signature=signature,
+                                                  n_files=len(rows), scanned_at=time.time()))
+                    fp_session.commit()
+                    n_paths += len(rows)
+                    print(f"  {kind} {night}: {len(rows)} files")
+                if i % 100 == 0:
+                    print(f"  {i}/{len(jobs)} nights ({time.monotonic() - t0:.0f} s) " +
+                          ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+    finally:
+        fp_session.close()
+    print(f"  {len(jobs)} nights, {n_paths} paths written in {time.monotonic() - t0:.0f} s")
+    return counts
+
+
+def index_stats():
+    """{kind: indexed frames} plus the number of scanned nights."""
+    session = FramePathSession()
+    try:
+        rows = session.execute(select(FramePath.kind, func.count()).group_by(FramePath.kind)).all()
+        nights = session.execute(select(func.count()).select_from(ScannedNight)).scalar()
+    finally:
+        session.close()
+    return {"frames": {k: n for k, n in rows}, "nights": nights}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build / update the resolved frame-path index.")
+    parser.add_argument("--nights", nargs="+", default=None,
+                        help="only these date_dir names")
+    parser.add_argument("--recent-days", type=float, default=None,
+                        help="only nights whose ihuNN directories changed in the last N days")
+    parser.add_argument("--kind", choices=KINDS + ("both",), default="both")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="concurrent night scans (NFS-bound threads)")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="drop the index and rebuild it from scratch")
+    args = parser.parse_args()
+
+    kinds = KINDS if args.kind == "both" else (args.kind,)
+    counts = build_path_index(kinds=kinds, nights=args.nights, recent_days=args.recent_days,
+                              workers=args.workers, rebuild=args.rebuild)
+    print("Frame path index updated: " +
+          ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
@@ -0,0 +1,278 @@
+# lcbin.py
+#
+# Stitched-lightcurve columns as NumPy arrays, and vectorized median/mean
+# binning of them.
+#
+# Bins are consecutive runs of `step` points (the last one may be short),
+# exactly like the original list-slicing loop in load_lightcurve_arrays:
+# the full bins are reshaped to (nbins, step) and reduced along axis 1 in
+# one pass, the short tail bin is reduced on its own.  Values match the
+# loop bit for bit (same NumPy reductions, same NaN propagation).
+#
+# Windows of a file are found by bisecting its time column when that is
+# sorted and NaN-free – checked once per file version and remembered –
+# and by a mask over the column otherwise.
+import bisect
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Points kept in the binned ("fast") copy of a lightcurve
+MAX_POINTS_FAST = 5000
+
+TIME_COLUMNS = ("TIME", "BTJD", "JD")
+
+# (path, mtime_ns, size) -> time column sorted and NaN-free (LRU)
+SORTED_CACHE_SIZE = 4096
+_time_sorted = OrderedDict()
+_time_sorted_lock = threading.Lock()
+
+
+def bin_step(n_points, max_points):
+    """Points per bin so that at most `max_points` bins remain."""
+    return int(np.ceil(n_points / max_points))
+
+
+def _reduce_bins(arr, step, reducer):
+    arr = np.asarray(arr)
+    n_full = (arr.size // step) * step
+    parts = []
+    if n_full:
+        parts.append(reducer(arr[:n_full].reshape(-1, step), axis=1))
+    if n_full < arr.size:
+        parts.append(np.atleast_1d(reducer(arr[n_full:])))
+    if not parts:
+        return np.empty(0)
+    return np.concatenate(parts).astype(float, copy=False)
+
+
+def median_bin(arr, step):
+    """Median of each run of `step` points."""
+    return _reduce_bins(arr, step, np.median)
+
+
+def mean_bin(arr, step):
+    """Mean of each run of `step` points."""
+    return _reduce_bins(arr, step, np.mean)
+
+
+def native_column(col):
+    """
+    FITS column → native-endian array with the dtype a Python-list round
+    trip would give (float64 / int64 / bool), so binning matches the old
+    list-based code.  Non-numeric columns come back unchanged.
+    """
+    arr = np.asarray(col)
+    kind = arr.dtype.kind
+    if kind == "f":
+        return arr.astype(np.float64)
+    if kind == "i" or (kind == "u" and arr.dtype.itemsize < 8):
+        return arr.astype(np.int64)
+    if kind in "ub":
+        return arr.astype(arr.dtype.newbyteorder("="))
+    return col          # e.g. FITS chararray: keep its own tolist()
+
+
+def is_numeric(arr):
+    return arr is not None and np.asarray(arr).dtype.kind in "biuf"
+
+
+def bin_lightcurve(time, series, meta, max_points):
+    """
+    Binned ("fast") copies of a lightcurve held as arrays.
+
+      time   : 1-D array
+      series : {name: 1-D array}
+      meta   : {name: 1-D array or None}
+
+    Returns (time_fast, series_fast, meta_fast).  Nothing is binned when
+    len(time) <= max_points; non-numeric meta columns are passed through
+    unbinned, as before.
+    """
+    if len(time) <= max_points:
+        return time, dict(series), dict(meta)
+
+    step = bin_step(len(time), max_points)
+    time_fast   = mean_bin(time, step)
+    series_fast = {k: median_bin(v, step) for k, v in series.items()}
+    meta_fast   = {}
+    for k, arr in meta.items():
+        if arr is None:
+            meta_fast[k] = None
+        elif is_numeric(arr) and len(arr):
+            meta_fast[k] = median_bin(arr, step)
+        else:
+            meta_fast[k] = arr
+    return time_fast, series_fast, meta_fast
+
+
+def _extract_columns(tab, names, rows=slice(None), series_keys=None):
+    """
+    (time, series, meta) for `rows` of an open stitched table; every array
+    is a fresh copy, so nothing refers back into a memory map.
+    """
+    time_col = next((c for c in TIME_COLUMNS if c in names), None)
+    if time_col is None:
+        return None
+    time = np.array(tab[time_col][rows], dtype=float)
+
+    series, meta = {}, {}
+    for base in ("FITMAG", "EPD", "TFA"):
+        for i in range(3):
+            mag_key = f"{base}{i}"
+            if mag_key in names and (series_keys is None or mag_key in series_keys):
+                series[mag_key] = np.array(tab[mag_key][rows], dtype=float)
+
+                err_key  = f"ERR{i}"
+                flag_key = f"FLAG{i}"
+                meta[err_key]  = (np.array(tab[err_key ][rows], dtype=float)
+                                  if err_key  in names else None)
+                meta[flag_key] = (np.asarray(tab[flag_key][rows]).astype(int)
+                                  if flag_key in names else None)
+
+    for col in ("HA", "Z", "FRAMEKEY"):
+        if col in names:
+            values = native_column(tab[col][rows])
+            meta[col] = values.copy() if values.dtype.kind not in "biuf" else values
+
+    return time, series, meta
+
+
+def read_lightcurve_columns(path, memmap=False):
+    """
+    Columns of a stitched lightcurve FITS file as arrays:
+    (time, series, meta) with series = {FITMAG0: ..., EPD0: ..., TFA0: ...}
+    and meta = {ERRi, FLAGi (None if missing), HA, Z, FRAMEKEY}.
+    Returns None if the table has no time column.
+    """
+    from astropy.io import fits
+
+    with fits.open(path, memmap=memmap) as hdul:
+        tab = hdul[1].data
+        return _extract_columns(tab, [n.upper() for n in tab.names])
+
+
+def time_is_sorted(path, t=None):
+    """
+    Whether the time column of `path` is non-decreasing and NaN-free, so a
+    window can be bisected.  Checked once per file version; `t` is the
+    column if the caller has it open already.
+    """
+    st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size)
+    with _time_sorted_lock:
+        if key in _time_sorted:
+            _time_sorted.move_to_end(key)
+            return _time_sorted[key]
+
+    if t is None:
+        from astropy.io import fits
+
+        with fits.open(path, memmap=True) as hdul:
+            tab   = hdul[1].data
+            names = [n.upper() for n in tab.names]
+            time_col = next((c for c in TIME_COLUMNS if c in names), None)
+            t = (np.array(tab.view(np.ndarray)[tab.names[names.index(time_col)]], dtype=float)
+                 if time_col is not None else np.empty(0))
+    t = np.asarray(t, dtype=float)
+    ok = bool(not np.isnan(t).any() and (np.diff(t) >= 0).all())
+
+    with _time_sorted_lock:
+        _time_sorted[key] = ok
+        while len(_time_sorted) > SORTED_CACHE_SIZE:
+            _time_sorted.popitem(last=False)
+    return ok
+
+
+def window_rows(t, tmin, tmax, is_sorted=True):
+    """
+    Rows of `t` with tmin <= time <= tmax: a slice found by bisection when
+    `t` is sorted (~log2(n) element reads), else the matching row indices.
+    """
+    if not is_sorted:
+        t = np.asarray(t, dtype=float)
+        keep = np.ones(len(t), dtype=bool)
+        if tmin is not None:
+            keep &= t >= tmin
+        if tmax is not None:
+            keep &= t <= tmax
+        return np.flatnonzero(keep)
+    lo = 0 if tmin is None else bisect.bisect_left(t, tmin)
+    hi = len(t) if tmax is None else bisect.bisect_right(t, tmax)
+    return slice(lo, max(lo, hi))
+
+
+def n_rows(rows, n):
+    """Number of rows a window_rows() result selects out of n."""
+    return len(range(n)[rows]) if isinstance(rows, slice) else len(rows)
+
+
+def _window_rows(path, tab, names, time_col, tmin, tmax):
+    """
+    Rows with tmin <= time <= tmax, from the raw (unconverted, big-endian,
+    strided) column view: where the file's time column is sorted this is a
+    bisection, where tab[col] or np.searchsorted would first convert/copy
+    the column.
+    """
+    t = tab.view(np.ndarray)[tab.names[names.index(time_col)]]
+    if tmin is None and tmax is None:
+        return slice(0, len(t))
+    return window_rows(t, tmin, tmax, time_is_sorted(path, t))
+
+
+def count_window_rows(path, tmin=None, tmax=None):
+    """Number of full-resolution rows in [tmin, tmax] (0 without a time column)."""
+    from astropy.io import fits
+
+    with fits.open(path, memmap=True) as hdul:
+        tab   = hdul[1].data
+        names = [n.upper() for n in tab.names]
+        time_col = next((c for c in TIME_COLUMNS if c in names), None)
+        if time_col is None:
+            return 0
+        return n_rows(_window_rows(path, tab, names, time_col, tmin, tmax), len(tab))
+
+
+def read_lightcurve_window(path, tmin=None, tmax=None, series_keys=None):
+    """
+    Full-resolution rows with tmin <= time <= tmax, as read_lightcurve_columns()
+    returns them, optionally for a subset of series (their ERR/FLAG follow).
+
+    The file is memory-mapped and the window located by binary search on
+    the time column (stitched lightcurves are time-ordered; see
+    time_is_sorted for those that are not), so only the pages holding the
+    rows in view are read.
+    """
+    from astropy.io import fits
+
+    with fits.open(path, memmap=True) as hdul:
+        tab   = hdul[1].data
+        names = [n.upper() for n in tab.names]
+        time_col = next((c for c in TIME_COLUMNS if c in names), None)
+        if time_col is None:
+            return None
+
+        # slice rows first so column conversions only touch the window
+        rows = _window_rows(path, tab, names, time_col, tmin, tmax)
+        return _extract_columns(tab[rows], names, slice(None), series_keys)
+
+
+def lightcurve_series_names(path):
+    """Series (FITMAG/EPD/TFA 0-2) in a stitched file, from the header only; [] without a time column."""
+    from astropy.io import fits
+
+    with fits.open(path, memmap=True) as hdul:
+        names = [n.upper() for n in hdul[1].columns.names]
+    if not any(c in names for c in TIME_COLUMNS):
+        return []
+    return [f"{base}{i}" for base in ("FITMAG", "EPD", "TFA") for i in range(3)
+            if f"{base}{i}" in names]
+
+
+def to_lists(columns):
+    """{name: array|None|other} → JSON-ready {name: list|None|other}."""
+    return {k: (v.tolist() if isinstance(v, np.ndarray) else v)
+            for k, v in columns.items()}
@@ -0,0 +1,104 @@
+# lcexport.py
+#
+# Streaming tar / zip archives of many stitched lightcurve files.
+#
+# Files are read by a small thread pool a few files ahead of the archive
+# writer (NFS latency overlaps with sending), and the archive is produced
+# chunk by chunk, so memory stays at roughly `read_ahead` files no matter
+# how many stars are requested.
+import csv
+import io
+import os
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+
+class _Sink:
+    """Write-only file object whose contents are drained after each member."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        out = b"".join(self._chunks)
+        self._chunks.clear()
+        return out
+
+
+def _read(path):
+    with open(path, "rb") as fh:
+        data = fh.read()
+    return data, os.path.getmtime(path)
+
+
+def read_ahead(entries, workers=4, read_ahead=8):
+    """
+    Yield (arcname, data, mtime, error) for (arcname, path) entries, in
+    order, with at most `read_ahead` files held in memory.
+    """
+    entries = list(entries)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures, nxt = {}, 0
+        for i in range(len(entries)):
+            while nxt < len(entries) and nxt < i + read_ahead:
+                futures[nxt] = pool.submit(_read, entries[nxt][1])
+                nxt += 1
+            arcname = entries[i][0]
+            try:
+                data, mtime = futures.pop(i).result()
+                yield arcname, data, mtime, None
+            except OSError as exc:
+                yield arcname, None, None, exc
+
+
+def _manifest(rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(["gaia_id", "status", "file"])
+    writer.writerows(rows)
+    return buf.getvalue().encode()
+
+
+def stream_archive(entries, missing=(), fmt="tar", workers=4, read_ahead_files=8):
+    """
+    Archive chunks for `entries` = [(gaia_id, path)], plus a manifest.csv
+    listing every requested ID (ok / missing / unreadable).
+    """
+    sink = _Sink()
+    if fmt == "zip":
+        archive = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED)
+
+        def add(name, data, mtime):
+            info = zipfile.ZipInfo(name, time.localtime(mtime)[:6])
+            archive.writestr(info, data)
+    else:
+        archive = tarfile.open(fileobj=sink, mode="w|")
+
+        def add(name, data, mtime):
+            info = tarfile.TarInfo(name)
+            info.size, info.mtime = len(data), int(mtime)
+            archive.addfile(info, io.BytesIO(data))
+
+    manifest = [(gid, "missing", "") for gid in missing]
+    named = [(gid, os.path.basename(path), path) for gid, path in entries]
+    for (gid, name, _), (_, data, mtime, err) in zip(
+            named, read_ahead([(n, p) for _, n, p in named], workers, read_ahead_files)):
+        if err is not None:
+            manifest.append((gid, "unreadable", name))
+            continue
+        add(name, data, mtime)
+        manifest.append((gid, "ok", name))
+        yield sink.drain()
+
+    add("manifest.csv", _manifest(manifest), time.time())
+    archive.close()
+    yield sink.drain()
@@ -0,0 +1,112 @@
+# lcpack.py
+#
+# Small binary container for shipping lightcurve columns to the browser as
+# typed arrays instead of JSON text.
+#
+#   "HLC1" | uint32 LE header length | header JSON (space-padded to 8 bytes)
+#   | column bytes, each little-endian and 8-byte aligned
+#
+# header = {"columns": [{"name", "dtype", "offset", "length"}, ...],
+#           "attrs":   {...}}          # scalars + non-numeric columns
+#
+# Offsets are relative to the first column byte.  dtype is one of the names
+# in JS_TYPES so the page can wrap each column in the matching TypedArray
+# without copying (see decodeLightcurve() in lightcurves.html).
+import json
+import struct
+
+import numpy as np
+
+
+MAGIC = b"HLC1"
+MIMETYPE = "application/vnd.hatpi.lightcurve"
+
+# numpy dtype → JS TypedArray
+JS_TYPES = {
+    "float64": "Float64Array",
+    "float32": "Float32Array",
+    "int32":   "Int32Array",
+    "int16":   "Int16Array",
+    "uint8":   "Uint8Array",
+}
+
+
+def wire_dtype(arr, name=""):
+    """
+    On-the-wire dtype for a numeric column: time axes stay float64 (JD
+    needs the digits), other floats go to float32, ints to int32 and
+    booleans to uint8.
+    """
+    kind = arr.dtype.kind
+    if kind == "f":
+        return np.float64 if name.lower().endswith("time") else np.float32
+    if kind in "iu":
+        return np.int32
+    if kind == "b":
+        return np.uint8
+    return None
+
+
+def _pad8(n):
+    return (-n) % 8
+
+
+def pack_columns(columns, attrs=None):
+    """
+    {name: array} → bytes.  Numeric arrays become typed columns; anything
+    else (e.g. FRAMEKEY strings) goes into attrs as JSON, and None is dropped.
+    """
+    attrs = dict(attrs or {})
+    header_cols, blobs, offset = [], [], 0
+    for name, arr in columns.items():
+        if arr is None:
+            continue
+        arr = np.asarray(arr)
+        dt = wire_dtype(arr, name)
+        if dt is None:
+            attrs[name] = arr.tolist()
+            continue
+        blob = np.ascontiguousarray(arr, dtype=np.dtype(dt).newbyteorder("<")).tobytes()
+        header_cols.append({"name": name, "dtype": np.dtype(dt).name,
+                            "offset": offset, "length": int(arr.size)})
+        blobs.append(blob)
+        blobs.append(b"\0" * _pad8(len(blob)))
+        offset += len(blob) + _pad8(len(blob))
+
+    header = json.dumps({"columns": header_cols, "attrs": attrs},
+                        separators=(",", ":")).encode()
+    # magic (4) + length (4) + header must end on an 8-byte boundary
+    header += b" " * _pad8(len(header))
+    return b"".join([MAGIC, struct.pack("<I", len(header)), header, *blobs])
+
+
+def unpack_columns(buf):
+    """Inverse of pack_columns (for tools and checks): ({name: array}, attrs)."""
+    if buf[:4] != MAGIC:
+        raise ValueError("not a lightcurve container")
+    (hlen,) = struct.unpack("<I", buf[4:8])
+    header = json.loads(buf[8:8 + hlen])
+    base = 8 + hlen
+    cols = {}
+    for c in header["columns"]:
+        dt = np.dtype(c["dtype"]).newbyteorder("<")
+        cols[c["name"]] = np.frombuffer(buf, dtype=dt, count=c["length"],
+                                        offset=base + c["offset"])
+    return cols, header["attrs"]
+
+
+def lightcurve_columns(time, series, meta, periodogram=None):
+    """
+    Flatten one resolution of a lightcurve (+ optional periodogram) into
+    pack_columns() names: time, series/<KEY>, meta/<KEY>, periodogram/freq|power.
+    """
+    cols = {"time": time}
+    cols.update((f"series/{k}", v) for k, v in series.items())
+    cols.update((f"meta/{k}", v) for k, v in meta.items())
+    attrs = {}
+    if periodogram is not None:
+        freq, power, best_period = periodogram
+        cols["periodogram/freq"]  = freq
+        cols["periodogram/power"] = power
+        attrs["DEFAULT_PERIOD"]   = best_period
+    return cols, attrs
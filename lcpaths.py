@@ -0,0 +1,154 @@
+# lcpaths.py
+#
+# Gaia DR2 ID → stitched lightcurve path, cached per worker.
+#
+# Used by the web routes and by batch tools alike.  Found paths are kept
+# for `ttl` seconds and unknown IDs for `negative_ttl` (shorter, so a star
+# ingested later shows up soon); get_many()/prefetch() resolve every
+# missing ID with one IN (...) query.  IDs are cached and queried in their
+# canonical integer form ("+0123" → "123"), the form the loader reports,
+# and handed back under the spelling the caller used.
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import bindparam, text
+
+from models import SessionLocal
+
+
+_PATHS_SQL = text("""
+    SELECT Gaia_DR2_ID, path_to_file
+    FROM   HPLC.stitched_lightcurve_files
+    WHERE  Gaia_DR2_ID IN :gids
+""").bindparams(bindparam("gids", expanding=True))
+
+# IDs per IN (...) list
+QUERY_CHUNK = 1000
+
+
+def canonical_gaia_id(gaia_id):
+    """Gaia ID as the string HPLC's integer column turns into ("+0123 " → "123")."""
+    gid = str(gaia_id).strip()
+    digits = gid[1:] if gid.startswith("+") else gid
+    return str(int(digits)) if digits.isascii() and digits.isdigit() else gid
+
+
+def load_lightcurve_paths(gaia_ids):
+    """{Gaia_DR2_ID: path_to_file} straight from HPLC (one session, chunked IN lists)."""
+    paths = {}
+    session = SessionLocal()
+    try:
+        for i in range(0, len(gaia_ids), QUERY_CHUNK):
+            chunk = gaia_ids[i:i + QUERY_CHUNK]
+            for gid, path in session.execute(_PATHS_SQL, {"gids": chunk}):
+                paths.setdefault(str(gid), path)
+    finally:
+        session.close()
+    return paths
+
+
+class LightcurvePathResolver:
+    """
+    LRU of Gaia ID → path (None for IDs not in HPLC), with separate TTLs
+    for found and unknown IDs.  ttl <= 0 disables caching.
+    """
+
+    def __init__(self, loader=load_lightcurve_paths, maxsize=100000,
+                 ttl=3600.0, negative_ttl=300.0):
+        self._loader      = loader
+        self.maxsize      = int(maxsize)
+        self.ttl          = float(ttl)
+        self.negative_ttl = float(negative_ttl)
+        self._lock    = threading.Lock()
+        self._entries = OrderedDict()     # gaia_id -> (expires, path | None)
+        self.hits = self.misses = self.negative_hits = self.evictions = 0
+
+    def _cached(self, gaia_id, now):
+        """(True, path) on a live entry, else (False, None).  Caller holds the lock."""
+        entry = self._entries.get(gaia_id)
+        if entry is None:
+            return False, None
+        if entry[0] < now:
+            del self._entries[gaia_id]
+            return False, None
+        self._entries.move_to_end(gaia_id)
+        return True, entry[1]
+
+    def get(self, gaia_id):
+        """Path for one Gaia ID, or None if HPLC has no lightcurve for it."""
+        gaia_id = str(gaia_id).strip()
+        return self.get_many([gaia_id]).get(gaia_id)
+
+    def get_many(self, gaia_ids):
+        """
+        {gaia_id: path} for the IDs that have a lightcurve, keyed as given
+        (stripped); misses in one query.
+        """
+        asked = {str(g).strip(): canonical_gaia_id(g) for g in gaia_ids}
+        found = self._get_canonical(list(dict.fromkeys(asked.values())))
+        return {g: found[c] for g, c in asked.items() if c in found}
+
+    def _get_canonical(self, ids):
+        found, todo = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for gid in ids:
+                ok, path = self._cached(gid, now)
+                if not ok:
+                    todo.append(gid)
+                    self.misses += 1
+                elif path is None:
+                    self.negative_hits += 1
+                else:
+                    found[gid] = path
+                    self.hits += 1
+
+        if todo:
+            loaded = self._loader(todo)
+            found.update((gid, loaded[gid]) for gid in todo if gid in loaded)
+            if self.ttl > 0 and self.maxsize > 0:
+                now = time.monotonic()
+                with self._lock:
+                    for gid in todo:
+                        path = loaded.get(gid)
+                        life = self.ttl if path is not None else self.negative_ttl
+                        self._entries[gid] = (now + life, path)
+                        self._entries.move_to_end(gid)
+                    while len(self._entries) > self.maxsize:
+                        self._entries.popitem(last=False)
+                        self.evictions += 1
+        return found
+
+    def prefetch(self, gaia_ids):
+        """Warm the cache for many IDs (one query for the ones not cached); returns the hit count."""
+        return len(self.get_many(gaia_ids))
+
+    def invalidate(self, gaia_id=None):
+        """Forget one ID, or everything when gaia_id is None."""
+        with self._lock:
+            if gaia_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(canonical_gaia_id(gaia_id), None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size":          len(self._entries),
+                "maxsize":       self.maxsize,
+                "ttl":           self.ttl,
+                "negative_ttl":  self.negative_ttl,
+                "hits":          self.hits,
+                "negative_hits": self.negative_hits,
+                "misses":        self.misses,
+                "evictions":     self.evictions,
+            }
+
+
+lightcurve_paths = LightcurvePathResolver(
+    maxsize=int(os.environ.get("HATPI_LC_PATH_CACHE_SIZE", "100000")),
+    ttl=float(os.environ.get("HATPI_LC_PATH_TTL", "3600")),
+    negative_ttl=float(os.environ.get("HATPI_LC_PATH_NEGATIVE_TTL", "300")),
+)
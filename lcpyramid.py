@@ -0,0 +1,155 @@
+# lcpyramid.py
+#
+# Multi-resolution ("pyramid") copies of a stitched lightcurve, so a zoomed
+# view always moves a bounded number of points however long the curve is.
+#
+# Level 0 is the FITS file itself.  Level k bins runs of PYRAMID_FACTOR**k
+# consecutive points with the same reductions as the fast copy (time mean,
+# series / numeric meta median); string columns keep the first value of
+# each bin.  Levels stop once a level holds <= PYRAMID_MIN_POINTS points.
+#
+# Each level is one structured .npy file in a DiskCache next to the
+# periodogram cache (HATPI_PYRAMID_CACHE_DIR), keyed on path + mtime/size,
+# and is read back memory-mapped, so a window costs only its own rows.
+import json
+import math
+import os
+
+import numpy as np
+
+from diskcache import DiskCache
+from lcbin import (
+    MAX_POINTS_FAST,
+    count_window_rows,
+    is_numeric,
+    mean_bin,
+    median_bin,
+    read_lightcurve_columns,
+    read_lightcurve_window,
+    time_is_sorted,
+    window_rows,
+)
+
+
+PYRAMID_FACTOR     = 4
+PYRAMID_MIN_POINTS = 256
+
+PYRAMID_CACHE_DIR = os.environ.get(
+    "HATPI_PYRAMID_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "pyramids"),
+)
+PYRAMID_CACHE_BYTES = int(os.environ.get("HATPI_PYRAMID_CACHE_BYTES", str(4 * 1024**3)))
+
+pyramid_cache = DiskCache(PYRAMID_CACHE_DIR, PYRAMID_CACHE_BYTES, ".npy")
+
+
+def pyramid_depth(n_points):
+    """Highest level for a curve of n_points (0: the file alone is small enough)."""
+    depth = 0
+    while math.ceil(n_points / PYRAMID_FACTOR**depth) > PYRAMID_MIN_POINTS:
+        depth += 1
+    return depth
+
+
+def level_for(n_rows, max_points, depth):
+    """Coarsest level needed to show n_rows full-resolution rows in <= max_points."""
+    if n_rows <= max_points:
+        return 0
+    return min(depth, math.ceil(math.log(n_rows / max_points, PYRAMID_FACTOR)))
+
+
+def build_level(time, series, meta, level):
+    """One pyramid level of full-resolution arrays, as a structured array."""
+    step = PYRAMID_FACTOR**level
+    fields = {"time": mean_bin(time, step)}
+    fields.update((f"series/{k}", median_bin(v, step)) for k, v in series.items())
+    for k, arr in meta.items():
+        if arr is None or not len(arr):
+            continue
+        fields[f"meta/{k}"] = (median_bin(arr, step) if is_numeric(arr)
+                               else np.asarray(arr)[::step])
+
+    out = np.empty(len(fields["time"]), dtype=[(k, v.dtype) for k, v in fields.items()])
+    for k, v in fields.items():
+        out[k] = v
+    return out
+
+
+def _level_key(path, st, level):
+    return json.dumps(["pyramid", path, st.st_mtime_ns, st.st_size, PYRAMID_FACTOR, level])
+
+
+def load_level(path, level, depth=None):
+    """
+    Structured array of one level (level >= 1): memory-mapped from the
+    cache, or built – with every missing level of the file – and cached.
+    """
+    st = os.stat(path)
+    fname = pyramid_cache.lookup(_level_key(path, st, level))
+    if fname is not None:
+        try:
+            return np.load(fname, mmap_mode="r")
+        except FileNotFoundError:
+            pass                # evicted since the lookup: rebuild below
+
+    columns = read_lightcurve_columns(path)
+    if columns is None:
+        return None
+    if depth is None:
+        depth = pyramid_depth(len(columns[0]))
+    rows = None
+    for k in range(1, depth + 1):
+        key = _level_key(path, st, k)
+        if k == level or not pyramid_cache.contains(key):
+            arr = build_level(*columns, k)
+            pyramid_cache.store(key, lambda fh, arr=arr: np.save(fh, arr))
+            if k == level:
+                rows = arr      # served from memory, whatever eviction does next
+    return rows
+
+
+def _unpack_level(rows, series_keys=None):
+    """Structured rows → (time, series, meta) dicts of fresh arrays."""
+    time = np.array(rows["time"])
+    series, meta = {}, {}
+    for name in rows.dtype.names:
+        group, _, key = name.partition("/")
+        if group == "series" and (series_keys is None or key in series_keys):
+            series[key] = np.array(rows[name])
+
+    wanted = {k[-1] for k in series}                 # index digits of kept series
+    for name in rows.dtype.names:
+        group, _, key = name.partition("/")
+        if group != "meta":
+            continue
+        if key[:-1] in ("ERR", "FLAG") and key[-1] not in wanted:
+            continue
+        meta[key] = np.array(rows[name])
+    for i in sorted(wanted):
+        meta.setdefault(f"ERR{i}", None)
+        meta.setdefault(f"FLAG{i}", None)
+    return time, series, meta
+
+
+def read_pyramid_window(path, tmin=None, tmax=None, series_keys=None,
+                        max_points=MAX_POINTS_FAST):
+    """
+    Rows of [tmin, tmax] at the finest level that fits in max_points:
+    returns (level, (time, series, meta)), level 0 being full resolution.
+    """
+    from astropy.io import fits
+
+    n_rows = count_window_rows(path, tmin, tmax)
+    n_all  = fits.getheader(path, 1)["NAXIS2"]
+    depth  = pyramid_depth(n_all)
+    level  = level_for(n_rows, max_points, depth)
+    if level == 0:
+        return 0, read_lightcurve_window(path, tmin, tmax, series_keys)
+
+    arr = load_level(path, level, depth)
+    if arr is None:
+        return 0, None
+    # strided memmap view: bisect, don't copy – bins of a sorted, NaN-free
+    # time column are sorted and NaN-free too
+    rows = window_rows(arr["time"], tmin, tmax, time_is_sorted(path))
+    return level, _unpack_level(arr[rows], series_keys)
@@ -0,0 +1,140 @@
+# metrics.py
+#
+# Lightweight per-worker instrumentation: stage timers, histograms and a
+# Prometheus text rendering for the /metrics endpoint.  Each finished
+# search also emits one structured (JSON) log record on "hatpi.timing".
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 10, 100, 1000, 10000, 100000, 1000000)
+
+timing_log = logging.getLogger("hatpi.timing")
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics)."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts  = [0] * len(self.buckets)
+        self.total   = 0
+        self.sum     = 0.0
+
+    def observe(self, value):
+        for i, edge in enumerate(self.buckets):
+            if value <= edge:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum   += value
+
+
+def _label_value(v):
+    """Label value escaped for the text exposition format."""
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Registry:
+    """Histograms by (name, labels)."""
+
+    def __init__(self):
+        self._lock  = threading.Lock()
+        self._hists = {}     # (name, labels tuple) -> Histogram
+        self._help  = {}
+
+    def observe(self, name, value, help="", buckets=DEFAULT_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._hists.get(key)
+            if hist is None:
+                hist = self._hists[key] = Histogram(buckets)
+                self._help.setdefault(name, help)
+            hist.observe(value)
+
+    def render_prometheus(self):
+        """Text exposition format, one block per metric name."""
+        lines = []
+        with self._lock:
+            for name in sorted({k[0] for k in self._hists}):
+                lines.append(f"# HELP {name} {self._help.get(name, '')}")
+                lines.append(f"# TYPE {name} histogram")
+                for (n, labels), hist in sorted(self._hists.items()):
+                    if n != name:
+                        continue
+                    base = ",".join(f'{k}="{_label_value(v)}"' for k, v in labels)
+                    sep = "," if base else ""
+                    for edge, count in zip(hist.buckets, hist.counts):
+                        lines.append(f'{name}_bucket{{{base}{sep}le="{edge:g}"}} {count}')
+                    lines.append(f'{name}_bucket{{{base}{sep}le="+Inf"}} {hist.total}')
+                    plain = f"{{{base}}}" if base else ""
+                    lines.append(f"{name}_sum{plain} {hist.sum:.6f}")
+                    lines.append(f"{name}_count{plain} {hist.total}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_METRIC = "hatpi_stage_seconds"
+STAGE_HELP   = "Wall time per request stage"
+
+
+@contextmanager
+def timed(stage, **labels):
+    """Time a block straight into the stage histogram."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe(STAGE_METRIC, time.perf_counter() - t0,
+                         help=STAGE_HELP, stage=stage, **labels)
+
+
+class StageTimer:
+    """
+    Collects per-stage wall time and counters for one operation (e.g. one
+    coordinate search, possibly spread over many chunks) and reports them
+    once in finish(): histograms + one structured log record.
+    """
+
+    def __init__(self, event, **context):
+        self.event   = event
+        self.context = context
+        self.stages  = {}
+        self.counts  = {}
+        self._t0     = time.perf_counter()
+        self._done   = False
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - t0)
+
+    def count(self, name, n):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def finish(self):
+        if self._done:
+            return
+        self._done = True
+        total = time.perf_counter() - self._t0
+        for name, secs in self.stages.items():
+            REGISTRY.observe(STAGE_METRIC, secs, help=STAGE_HELP, stage=name)
+        REGISTRY.observe(f"hatpi_{self.event}_seconds", total,
+                         help=f"Total wall time per {self.event}")
+        for name, n in self.counts.items():
+            REGISTRY.observe(f"hatpi_{self.event}_{name}", n, buckets=COUNT_BUCKETS,
+                             help=f"{name.replace('_', ' ')} per {self.event}")
+
+        record = {"event": self.event, **self.context,
+                  "total_ms": round(total * 1000, 2),
+                  "stages_ms": {k: round(v * 1000, 2) for k, v in self.stages.items()},
+                  **self.counts}
+        timing_log.info(json.dumps(record, default=str))
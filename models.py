@@ -2,7 +2,6 @@
 import os
 from datetime import datetime
 
-import json
 import numpy as np
 
 from sqlalchemy import (
@@ -20,6 +19,12 @@ from sqlalchemy import (
 from sqlalchemy.orm import relationship, sessionmaker, declarative_base
 from sqlalchemy import ForeignKeyConstraint
 
+from mywcs import WcsCache
+
+
+# Parsed WCS/SIP solutions, LRU by (IHUID, FNUM)
+wcs_cache = WcsCache(maxsize=int(os.environ.get("HATPI_WCS_CACHE_SIZE", "50000")))
+
 
 # 1) Base class for your tables
 Base = declarative_base()
@@ -98,12 +103,12 @@ class Astrometry(Base):
                 f"exit_code={self.exit_code}>")
 
     @property
-    def wcs_transform(self):
-        """
-        Rebuild the WCS using the pipeline approach. 
-        We rely on a function in mywcs.py, or inline code here.
-        """
-        from mywcs import create_wcs  # or relative import if your structure differs
+    def _wcs_fingerprint(self):
+        return (self.exit_code, self.CRVAL1, self.CRVAL2, self.CRPIX1, self.CRPIX2,
+                self.CD1_1, self.CD1_2, self.CD2_1, self.CD2_2, self.A, self.B)
+
+    def _parse_wcs_pars(self):
+        from mywcs import parse_sip_pars
 
         if (self.CRVAL1 is None) or (self.exit_code != 0):
             return None
@@ -112,22 +117,26 @@ class Astrometry(Base):
         crpix = [self.CRPIX1, self.CRPIX2]
         cdmat = np.array([[self.CD1_1, self.CD1_2],
                           [self.CD2_1, self.CD2_2]])
+        return crval, crpix, cdmat, parse_sip_pars(self.A, self.B)
 
-        # Create the base WCS
-        w = create_wcs(crval, crpix, cdmat)
-
-        # If we have A, B for SIP
-        if self.A and self.B:
-            try:
-                import json
-                from astropy.wcs import Sip
-                a_arr = np.array(json.loads(self.A))
-                b_arr = np.array(json.loads(self.B))
-                w.sip = Sip(a_arr, b_arr, None, None, crpix)
-            except:
-                pass
-
-        return w
+    @property
+    def wcs_pars(self):
+        """
+        (crval, crpix, cdmat, sip_pars) for this solution, or None if the
+        frame has no usable astrometry.  sip_pars is None without SIP.
+        Memoized in wcs_cache by (IHUID, FNUM).
+        """
+        return wcs_cache.get_pars((self.IHUID, self.FNUM), self._wcs_fingerprint,
+                                  self._parse_wcs_pars)
+
+    @property
+    def wcs_transform(self):
+        """
+        Rebuild the WCS using the pipeline approach. 
+        The WCS object is memoized in wcs_cache – do not modify it.
+        """
+        return wcs_cache.get_wcs((self.IHUID, self.FNUM), self._wcs_fingerprint,
+                                 self._parse_wcs_pars)
 
 
 class CalFrameQuality(Base):
@@ -1,4 +1,8 @@
 # mywcs.py
+import json
+import threading
+from collections import OrderedDict
+
 import numpy as np
 from astropy.wcs import WCS, Sip
 
@@ -31,3 +35,344 @@ def create_simple_wcs(crval, crpix=(1024, 1024), pixsize=19.62):
     w.wcs.cdelt = [-deg_per_pix, deg_per_pix]
     w.wcs.ctype = ["RA---TAN", "DEC--TAN"]
     return w
+
+
+def simple_tan_world2pix(ra_deg, dec_deg, crval_ra, crval_dec,
+                         crpix=(1024, 1024), pixsize=19.62):
+    """
+    Vectorized counterpart of create_simple_wcs(...).all_world2pix(ra, dec, 1).
+
+    Projects (ra_deg, dec_deg) onto the gnomonic (TAN) plane of every
+    tangent point in (crval_ra, crval_dec) at once; all inputs broadcast.
+    Returns 1-based (x, y) pixel arrays, NaN where the coordinate lies on
+    the far side of the tangent plane.
+    """
+    deg_per_pix = pixsize / 3600.0
+    ra0 = np.radians(crval_ra)
+    dec0 = np.radians(crval_dec)
+    ra = np.radians(ra_deg)
+    dec = np.radians(dec_deg)
+
+    dra = ra - ra0
+    cos_dec = np.cos(dec)
+    cos_dra = np.cos(dra)
+    sin_dec0 = np.sin(dec0)
+    cos_dec0 = np.cos(dec0)
+
+    cos_c = sin_dec0 * np.sin(dec) + cos_dec0 * cos_dec * cos_dra
+    with np.errstate(divide="ignore", invalid="ignore"):
+        xi = np.degrees(cos_dec * np.sin(dra) / cos_c)
+        eta = np.degrees((cos_dec0 * np.sin(dec) - sin_dec0 * cos_dec * cos_dra) / cos_c)
+
+    behind = ~(cos_c > 0)
+    xi = np.where(behind, np.nan, xi)
+    eta = np.where(behind, np.nan, eta)
+
+    # CDELT = (-deg_per_pix, +deg_per_pix), PC = identity
+    xpix = crpix[0] - xi / deg_per_pix
+    ypix = crpix[1] + eta / deg_per_pix
+    return xpix, ypix
+
+
+def simple_tan_on_ccd(ra_deg, dec_deg, crval_ra, crval_dec, margin=0,
+                      extent=(0, 2048, 0, 2048), crpix=(1024, 1024), pixsize=19.62):
+    """
+    Boolean mask: which simplified field WCSs put (ra_deg, dec_deg) on the
+    CCD.  Same bounds test as batch_on_ccd, one entry per field.
+    """
+    xpix, ypix = simple_tan_world2pix(ra_deg, dec_deg, crval_ra, crval_dec,
+                                      crpix=crpix, pixsize=pixsize)
+    # NaN compares False, so far-side coordinates drop out here
+    return (
+        ((extent[0] - margin) < xpix) & (xpix < (extent[1] + margin))
+        & ((extent[2] - margin) < ypix) & (ypix < (extent[3] + margin))
+    )
+
+
+def parse_sip_pars(a_json, b_json):
+    """
+    Decode the SIP A/B JSON strings stored in the astrometry table.
+    Returns (a_arr, b_arr), or None when either is missing or unusable
+    (Astrometry.wcs_transform then falls back to a plain TAN WCS).
+    """
+    if not a_json or not b_json:
+        return None
+    try:
+        a_arr = np.array(json.loads(a_json), dtype=float)
+        b_arr = np.array(json.loads(b_json), dtype=float)
+    except (TypeError, ValueError):
+        return None
+    for arr in (a_arr, b_arr):
+        if arr.ndim != 2 or arr.shape[0] != arr.shape[1] or arr.shape[0] == 0:
+            return None
+    return a_arr, b_arr
+
+
+def stack_wcs_pars(pars):
+    """
+    Stack per-frame WCS parameters for batch_world2pix.
+
+    `pars` is a sequence of (crval, crpix, cdmat, sip_pars) tuples, with
+    sip_pars as returned by parse_sip_pars (or None).  SIP matrices are
+    zero-padded to the largest order; terms above a frame's own order are
+    dropped, as astropy's SIP evaluator ignores them.
+    """
+    n = len(pars)
+    crval = np.empty((n, 2))
+    crpix = np.empty((n, 2))
+    cd    = np.empty((n, 2, 2))
+    orders = [m.shape[0] for p in pars if p[3] is not None for m in p[3]]
+    k = max(orders) if orders else 0
+    sip_a = np.zeros((n, k, k))
+    sip_b = np.zeros((n, k, k))
+
+    for i, (cv, cp, cdmat, sip) in enumerate(pars):
+        crval[i] = cv
+        crpix[i] = cp
+        cd[i]    = cdmat
+        if sip is not None:
+            for out, coeffs in ((sip_a, sip[0]), (sip_b, sip[1])):
+                m = coeffs.shape[0]
+                keep = np.add.outer(np.arange(m), np.arange(m)) <= (m - 1)
+                out[i, :m, :m] = np.where(keep, coeffs, 0.0)
+
+    return {"crval": crval, "crpix": crpix, "cd": cd,
+            "sip_a": sip_a if k else None, "sip_b": sip_b if k else None}
+
+
+def _sip_offsets(u, v, sip_a, sip_b):
+    """Evaluate the SIP polynomials for every frame: sum A[p,q] u^p v^q."""
+    k = sip_a.shape[1]
+    powers = np.arange(k)
+    upow = u[:, None] ** powers
+    vpow = v[:, None] ** powers
+    du = np.einsum("np,npq,nq->n", upow, sip_a, vpow)
+    dv = np.einsum("np,npq,nq->n", upow, sip_b, vpow)
+    return du, dv
+
+
+def batch_world2pix(ra_deg, dec_deg, stacked, tolerance=1e-4, maxiter=20):
+    """
+    Batched counterpart of create_wcs(...).all_world2pix(ra, dec, 1) for N
+    frames at once (`stacked` from stack_wcs_pars; ra/dec scalar or (N,)).
+
+    Uses the same fixed-point inversion of the forward SIP as astropy;
+    points that diverge or do not converge within `maxiter` come back as
+    NaN, where astropy would raise NoConvergence.
+    """
+    crval, crpix, cd = stacked["crval"], stacked["crpix"], stacked["cd"]
+    n = crval.shape[0]
+    ra  = np.broadcast_to(np.asarray(ra_deg, dtype=float), (n,))
+    dec = np.broadcast_to(np.asarray(dec_deg, dtype=float), (n,))
+
+    # world → intermediate (deg) via the TAN projection, then CD⁻¹ → pixels
+    ra0, dec0 = np.radians(crval[:, 0]), np.radians(crval[:, 1])
+    ra_r, dec_r = np.radians(ra), np.radians(dec)
+    dra = ra_r - ra0
+    cos_c = (np.sin(dec0) * np.sin(dec_r)
+             + np.cos(dec0) * np.cos(dec_r) * np.cos(dra))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        xi  = np.degrees(np.cos(dec_r) * np.sin(dra) / cos_c)
+        eta = np.degrees((np.cos(dec0) * np.sin(dec_r)
+                          - np.sin(dec0) * np.cos(dec_r) * np.cos(dra)) / cos_c)
+    behind = ~(cos_c > 0)
+
+    det = cd[:, 0, 0] * cd[:, 1, 1] - cd[:, 0, 1] * cd[:, 1, 0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        du0 = ( cd[:, 1, 1] * xi - cd[:, 0, 1] * eta) / det
+        dv0 = (-cd[:, 1, 0] * xi + cd[:, 0, 0] * eta) / det
+    x0 = crpix[:, 0] + du0
+    y0 = crpix[:, 1] + dv0
+
+    sip_a, sip_b = stacked["sip_a"], stacked["sip_b"]
+    if sip_a is None:
+        x, y = x0, y0
+    else:
+        # x_{i+1} = x' - f(x_i), starting from x_0 = x'
+        x, y = x0.copy(), y0.copy()
+        dnprev = np.full(n, np.inf)
+        active = np.ones(n, dtype=bool)
+        failed = np.zeros(n, dtype=bool)
+        tol2 = tolerance ** 2
+        with np.errstate(invalid="ignore", over="ignore"):
+            for _ in range(maxiter):
+                idx = np.flatnonzero(active)
+                if idx.size == 0:
+                    break
+                fu, fv = _sip_offsets(x[idx] - crpix[idx, 0], y[idx] - crpix[idx, 1],
+                                      sip_a[idx], sip_b[idx])
+                dx = (x[idx] + fu) - x0[idx]
+                dy = (y[idx] + fv) - y0[idx]
+                dn = dx * dx + dy * dy
+                x[idx] -= dx
+                y[idx] -= dy
+
+                diverged = (dn >= dnprev[idx]) & (dn >= tol2)
+                failed[idx[diverged]] = True
+                done = (dn < tol2) | diverged | np.isnan(dn)
+                active[idx[done]] = False
+                dnprev[idx] = dn
+            failed |= active            # still moving after maxiter
+        x = np.where(failed, np.nan, x)
+        y = np.where(failed, np.nan, y)
+
+    x = np.where(behind, np.nan, x)
+    y = np.where(behind, np.nan, y)
+    return x, y
+
+
+def batch_on_ccd(ra_deg, dec_deg, stacked, margin=0, extent=(0, 2048, 0, 2048)):
+    """
+    Boolean mask over the stacked frames: does (ra_deg, dec_deg) land on
+    the CCD?  Same open-interval bounds test as a per-frame
+    WCS.all_world2pix check (see tests/test_batch_on_ccd.py).
+    """
+    xpix, ypix = batch_world2pix(ra_deg, dec_deg, stacked)
+    return (
+        ((extent[0] - margin) < xpix) & (xpix < (extent[1] + margin))
+        & ((extent[2] - margin) < ypix) & (ypix < (extent[3] + margin))
+    )
+
+
+def batch_on_ccd_grid(ra_deg, dec_deg, stacked, margin=0, extent=(0, 2048, 0, 2048),
+                      max_pairs=500000):
+    """
+    (T, N) boolean matrix: target t of (ra_deg, dec_deg) on stacked frame n.
+    Every target × frame pair goes through batch_on_ccd in one pass (in
+    blocks of at most `max_pairs` pairs to bound memory).
+    """
+    ra  = np.atleast_1d(np.asarray(ra_deg, dtype=float))
+    dec = np.atleast_1d(np.asarray(dec_deg, dtype=float))
+    n_t, n_f = ra.size, stacked["crval"].shape[0]
+    out = np.zeros((n_t, n_f), dtype=bool)
+    if n_t == 0 or n_f == 0:
+        return out
+
+    step = max(1, max_pairs // n_f)
+    for t0 in range(0, n_t, step):
+        nt = min(step, n_t - t0)
+        tiled = {k: (None if v is None else np.tile(v, (nt,) + (1,) * (v.ndim - 1)))
+                 for k, v in stacked.items()}
+        hit = batch_on_ccd(np.repeat(ra[t0:t0 + nt], n_f), np.repeat(dec[t0:t0 + nt], n_f),
+                           tiled, margin=margin, extent=extent)
+        out[t0:t0 + nt] = hit.reshape(nt, n_f)
+    return out
+
+
+def batch_pix2world(xpix, ypix, stacked):
+    """
+    Batched counterpart of create_wcs(...).all_pix2world(x, y, 1): 1-based
+    pixels (scalar, (N,) or (N, M)) → (ra, dec) in degrees, with the
+    forward SIP applied.
+    """
+    crval, crpix, cd = stacked["crval"], stacked["crpix"], stacked["cd"]
+    n = crval.shape[0]
+    x = np.asarray(xpix, dtype=float)
+    y = np.asarray(ypix, dtype=float)
+    shape = np.broadcast_shapes(x.shape, y.shape, (n,) if x.ndim < 2 else (n, 1))
+    x = np.broadcast_to(x, shape)
+    y = np.broadcast_to(y, shape)
+    col = (slice(None),) + (None,) * (len(shape) - 1)   # per-frame → broadcast
+
+    u = x - crpix[:, 0][col]
+    v = y - crpix[:, 1][col]
+    sip_a, sip_b = stacked["sip_a"], stacked["sip_b"]
+    if sip_a is not None:
+        flat_u = u.reshape(n, -1)
+        flat_v = v.reshape(n, -1)
+        k = sip_a.shape[1]
+        upow = flat_u[..., None] ** np.arange(k)
+        vpow = flat_v[..., None] ** np.arange(k)
+        du = np.einsum("nmp,npq,nmq->nm", upow, sip_a, vpow).reshape(shape)
+        dv = np.einsum("nmp,npq,nmq->nm", upow, sip_b, vpow).reshape(shape)
+        u = u + du
+        v = v + dv
+
+    xi  = np.radians(cd[:, 0, 0][col] * u + cd[:, 0, 1][col] * v)
+    eta = np.radians(cd[:, 1, 0][col] * u + cd[:, 1, 1][col] * v)
+
+    # inverse gnomonic projection about (CRVAL1, CRVAL2)
+    ra0  = np.radians(crval[:, 0])[col]
+    dec0 = np.radians(crval[:, 1])[col]
+    rho = np.hypot(xi, eta)
+    c = np.arctan(rho)
+    sin_c, cos_c = np.sin(c), np.cos(c)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(rho > 0, eta * sin_c / rho, 0.0)
+    dec = np.arcsin(np.clip(cos_c * np.sin(dec0) + ratio * np.cos(dec0), -1.0, 1.0))
+    ra = ra0 + np.arctan2(xi * sin_c,
+                          rho * np.cos(dec0) * cos_c - eta * np.sin(dec0) * sin_c)
+    return np.degrees(ra) % 360.0, np.degrees(dec)
+
+
+class WcsCache:
+    """
+    Bounded LRU of parsed astrometric solutions keyed by (IHUID, FNUM).
+
+    Each entry remembers a fingerprint of the astrometry row it came from
+    (exit_code, CRVAL/CRPIX/CD, SIP strings); a lookup with a different
+    fingerprint counts as stale and is rebuilt, so re-solved frames never
+    see an old solution.  Values are shared between callers – treat the
+    returned arrays and WCS objects as read-only.
+    """
+
+    def __init__(self, maxsize=50000):
+        self.maxsize = int(maxsize)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()     # key -> [fingerprint, pars, wcs]
+        self.hits = self.misses = self.stale = self.evictions = 0
+
+    def _entry(self, key, fingerprint, build_pars):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == fingerprint:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                self.stale += 1
+            self.misses += 1
+
+        entry = [fingerprint, build_pars(), None]
+        if self.maxsize <= 0:
+            return entry
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def get_pars(self, key, fingerprint, build_pars):
+        """Parsed (crval, crpix, cdmat, sip_pars) or None, via build_pars()."""
+        return self._entry(key, fingerprint, build_pars)[1]
+
+    def get_wcs(self, key, fingerprint, build_pars):
+        """astropy WCS for the solution (built once per entry), or None."""
+        entry = self._entry(key, fingerprint, build_pars)
+        if entry[2] is None and entry[1] is not None:
+            crval, crpix, cdmat, sip_pars = entry[1]
+            entry[2] = create_wcs(crval, crpix, cdmat, sip_pars)
+        return entry[2]
+
+    def invalidate(self, key=None):
+        """Forget one (IHUID, FNUM), or everything when key is None."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size":      len(self._entries),
+                "maxsize":   self.maxsize,
+                "hits":      self.hits,
+                "misses":    self.misses,
+                "stale":     self.stale,
+                "evictions": self.evictions,
+                "hit_rate":  round(self.hits / lookups, 4) if lookups else None,
+            }
@@ -0,0 +1,122 @@
+# periodograms.py
+#
+# Lomb-Scargle periodograms of stitched lightcurves, and an on-disk cache
+# for them so repeat views of a star skip the LS entirely.
+#
+# Entries are small .npz files (freq, power, best period) under
+# HATPI_PERIODOGRAM_CACHE_DIR, sharded by the first two hex digits of the
+# key hash.  The key covers everything the result depends on: Gaia ID,
+# file path, file mtime/size, the binning level and the LS parameters, so
+# a rewritten lightcurve simply misses.  Storage, atomic writes and LRU
+# eviction past HATPI_PERIODOGRAM_CACHE_BYTES come from diskcache.DiskCache.
+#
+# precompute_periodograms.py fills a second tree of the same layout,
+# HATPI_PERIODOGRAM_STORE_DIR, which is never evicted; the web path reads
+# that store first, then the cache, and only then runs the LS.
+import json
+import os
+
+import numpy as np
+
+from diskcache import DiskCache
+
+
+PERIODOGRAM_CACHE_DIR = os.environ.get(
+    "HATPI_PERIODOGRAM_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "periodograms"),
+)
+PERIODOGRAM_CACHE_BYTES = int(os.environ.get("HATPI_PERIODOGRAM_CACHE_BYTES",
+                                             str(2 * 1024**3)))
+PERIODOGRAM_STORE_DIR = os.environ.get(
+    "HATPI_PERIODOGRAM_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "periodogram_store"),
+)
+
+# LS defaults of app.load_lightcurve_columns
+MIN_PERIOD       = 0.1      # d
+MAX_PERIOD       = 20.0     # d
+SAMPLES_PER_PEAK = 5
+
+
+def preferred_series(series):
+    """Series the periodogram is run on: trend-filtered if present, else the first."""
+    return "TFA0" if "TFA0" in series else next(iter(series))
+
+
+def compute_periodogram(time, mag, min_period=MIN_PERIOD, max_period=MAX_PERIOD,
+                        samples_per_peak=SAMPLES_PER_PEAK):
+    """LS power over [min_period, max_period]; returns (freq, power, best_period)."""
+    from astropy.timeseries import LombScargle
+
+    ls = LombScargle(np.asarray(time), np.asarray(mag), nterms=1, fit_mean=True)
+    freq, power = ls.autopower(method="fast",
+                               minimum_frequency=1/max_period,
+                               maximum_frequency=1/min_period,
+                               samples_per_peak=samples_per_peak)
+    return freq, power, float(1 / freq[np.argmax(power)])
+
+
+def periodogram_key(gaia_id, path, max_points_fast, min_period=MIN_PERIOD,
+                    max_period=MAX_PERIOD, samples_per_peak=SAMPLES_PER_PEAK, st=None):
+    """Cache key for one lightcurve file + LS setup (stats `path` unless `st` is given)."""
+    st = st or os.stat(path)
+    return json.dumps([str(gaia_id), path, st.st_mtime_ns, st.st_size, int(max_points_fast),
+                       float(min_period), float(max_period), int(samples_per_peak)])
+
+
+class PeriodogramCache(DiskCache):
+    """DiskCache of .npz periodograms (freq, power, best_period + the full key)."""
+
+    def __init__(self, root=PERIODOGRAM_CACHE_DIR, max_bytes=PERIODOGRAM_CACHE_BYTES):
+        super().__init__(root, max_bytes, ".npz")
+
+    def get(self, key):
+        """(freq, power, best_period) or None."""
+        fname = self.lookup(key)
+        if fname is None:
+            return None
+        try:
+            with np.load(fname, allow_pickle=False) as npz:
+                if str(npz["key"]) != key:           # hash collision
+                    raise KeyError(key)
+                return npz["freq"], npz["power"], float(npz["best_period"])
+        except (OSError, KeyError, ValueError):
+            self.hits -= 1
+            self.misses += 1
+            return None
+
+    def set(self, key, freq, power, best_period):
+        self.store(key, lambda fh: np.savez_compressed(
+            fh, key=np.array(key), freq=np.asarray(freq), power=np.asarray(power),
+            best_period=np.float64(best_period)))
+
+
+periodogram_cache = PeriodogramCache()
+periodogram_store = PeriodogramCache(root=PERIODOGRAM_STORE_DIR, max_bytes=0)
+
+
+def cached_periodogram(gaia_id, path, time, mag, max_points_fast,
+                       min_period=MIN_PERIOD, max_period=MAX_PERIOD,
+                       samples_per_peak=SAMPLES_PER_PEAK, cache=None, store=None):
+    """compute_periodogram() through the precomputed store and the on-disk cache."""
+    cache = cache or periodogram_cache
+    store = store or periodogram_store
+    try:
+        key = periodogram_key(gaia_id, path, max_points_fast,
+                              min_period, max_period, samples_per_peak)
+    except OSError:
+        key = None
+
+    if key is not None:
+        for source in (store, cache):
+            hit = source.get(key)
+            if hit is not None:
+                return hit
+
+    result = compute_periodogram(time, mag, min_period, max_period, samples_per_peak)
+    if key is not None:
+        try:
+            cache.set(key, *result)
+        except OSError:
+            pass                              # a full/readonly disk must not break the page
+    return result
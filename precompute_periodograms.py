@@ -0,0 +1,123 @@
+# precompute_periodograms.py
+#
+# Offline Lomb-Scargle for every stitched lightcurve in
+# HPLC.stitched_lightcurve_files, so no viewer waits for the LS.
+#
+# Each file is read, binned and searched exactly as load_lightcurve_columns
+# does it, in a process pool, and the result is written to the periodogram
+# store (periodograms.PERIODOGRAM_STORE_DIR) that the web path reads first.
+#
+# Resumable: entries are keyed on path + mtime/size + LS setup, so a rerun
+# (or a run after an interruption) skips every file already done and
+# recomputes only new or rewritten lightcurves.
+#
+#   python precompute_periodograms.py                 (all cores)
+#   python precompute_periodograms.py --workers 8 --limit 1000
+#   python precompute_periodograms.py --gaia-ids popular_stars.txt
+import argparse
+import os
+
+from sqlalchemy import text
+
+from batchpool import run_pool
+from lcbin import MAX_POINTS_FAST, bin_lightcurve, read_lightcurve_columns
+from periodograms import (
+    MIN_PERIOD,
+    MAX_PERIOD,
+    SAMPLES_PER_PEAK,
+    compute_periodogram,
+    periodogram_key,
+    periodogram_store,
+    preferred_series,
+)
+
+
+def iter_lightcurve_files(batch_size=10000, limit=None):
+    """(Gaia_DR2_ID, path_to_file) rows, streamed from HPLC."""
+    from models import SessionLocal
+
+    session = SessionLocal()
+    try:
+        sql = "SELECT Gaia_DR2_ID, path_to_file FROM HPLC.stitched_lightcurve_files"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        result = session.execute(text(sql).execution_options(yield_per=batch_size))
+        for gaia_id, path in result:
+            yield str(gaia_id), path
+    finally:
+        session.close()
+
+
+def iter_listed_files(gaia_ids):
+    """
+    (Gaia_DR2_ID, path_to_file) for an explicit list of stars (unknown IDs
+    skipped), IDs in the canonical form the web path keys periodograms on.
+    """
+    from lcpaths import canonical_gaia_id, lightcurve_paths
+
+    gaia_ids = list(dict.fromkeys(canonical_gaia_id(g) for g in gaia_ids))
+    paths = lightcurve_paths.get_many(gaia_ids)
+    for gid in gaia_ids:
+        if gid in paths:
+            yield gid, paths[gid]
+
+
+def process_one(job):
+    """
+    Worker: one lightcurve → store.  Returns the status: "done",
+    "skipped", "missing" or "empty".
+    """
+    gaia_id, path, max_points_fast, min_period, max_period, samples_per_peak = job
+    try:
+        key = periodogram_key(gaia_id, path, max_points_fast,
+                              min_period, max_period, samples_per_peak)
+    except OSError:
+        return "missing"
+    if periodogram_store.contains(key):
+        return "skipped"
+
+    columns = read_lightcurve_columns(path)
+    if columns is None or not columns[1]:
+        return "empty"
+    time_full, series_full, _ = columns
+    time_fast, series_fast, _ = bin_lightcurve(time_full, series_full, {},
+                                               max_points_fast)
+    result = compute_periodogram(time_fast, series_fast[preferred_series(series_fast)],
+                                 min_period, max_period, samples_per_peak)
+    periodogram_store.set(key, *result)
+    return "done"
+
+
+def precompute(workers=None, limit=None, max_points_fast=MAX_POINTS_FAST,
+               min_period=MIN_PERIOD, max_period=MAX_PERIOD,
+               samples_per_peak=SAMPLES_PER_PEAK, report_every=30.0, gaia_ids=None):
+    """Run the pool over every lightcurve file (or just `gaia_ids`); returns the status counts."""
+    files = (iter_listed_files(gaia_ids) if gaia_ids is not None
+             else iter_lightcurve_files(limit=limit))
+    jobs = ((gid, path, max_points_fast, min_period, max_period, samples_per_peak)
+            for gid, path in files)
+    return run_pool(process_one, jobs, name=lambda job: f"Gaia DR2 {job[0]}",
+                    workers=workers, report_every=report_every, unit="files")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute Lomb-Scargle periodograms.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="worker processes (default: all cores)")
+    parser.add_argument("--limit", type=int, default=None,
+                        help="only the first N catalogue rows")
+    parser.add_argument("--gaia-ids", type=argparse.FileType("r"), default=None,
+                        help="file with Gaia DR2 IDs (one per line) instead of the whole table")
+    parser.add_argument("--max-points-fast", type=int, default=MAX_POINTS_FAST)
+    parser.add_argument("--min-period", type=float, default=MIN_PERIOD)
+    parser.add_argument("--max-period", type=float, default=MAX_PERIOD)
+    parser.add_argument("--samples-per-peak", type=int, default=SAMPLES_PER_PEAK)
+    args = parser.parse_args()
+
+    gaia_ids = args.gaia_ids.read().split() if args.gaia_ids else None
+    counts = precompute(workers=args.workers, limit=args.limit, gaia_ids=gaia_ids,
+                        max_points_fast=args.max_points_fast,
+                        min_period=args.min_period, max_period=args.max_period,
+                        samples_per_peak=args.samples_per_peak)
+    print("Periodogram store updated: " +
+          ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
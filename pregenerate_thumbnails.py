@@ -0,0 +1,69 @@
+# pregenerate_thumbnails.py
+#
+# Fill the thumbnail cache (fitsthumbs.THUMB_CACHE_DIR) for newly reduced
+# nights, so the first look at a frame is a cache hit.
+#
+# Frames are found by walking <root>/<date_dir>/ihuNN directly (no DB),
+# rendered in a process pool with the same settings as the
+# /fits/<kind>/<ihuid>/<fnum>/thumb route, and stored under the same
+# keys.  Frames whose thumbnail is already cached are skipped, so reruns
+# are cheap and an interrupted run just picks up where it stopped.
+#
+#   python pregenerate_thumbnails.py                    (nights touched in the last 2 days)
+#   python pregenerate_thumbnails.py 1-20240101 1-20240102 --kind both
+#   python pregenerate_thumbnails.py --recent-days 7 --workers 8 --size 256
+import argparse
+import os
+
+from batchpool import run_pool
+from fitsthumbs import THUMB_SIZE, render_thumbnail, thumb_cache, thumb_key
+from framefiles import KINDS, iter_night_files, kind_root, recent_nights
+
+
+def process_one(job):
+    """Worker: one frame → cached PNG.  Returns "done", "skipped" or "missing"."""
+    path, max_side = job
+    try:
+        key = thumb_key(path, os.stat(path), max_side)
+    except OSError:
+        return "missing"
+    if thumb_cache.contains(key):
+        return "skipped"
+    png = render_thumbnail(path, max_side)
+    thumb_cache.store(key, lambda fh: fh.write(png))
+    return "done"
+
+
+def iter_frames(kinds, nights=None, recent_days=2.0):
+    for kind in kinds:
+        root = kind_root(kind)
+        for night in (nights or recent_nights(root, recent_days)):
+            yield from iter_night_files(root, night, kind)
+
+
+def pregenerate(kinds=("red",), nights=None, recent_days=2.0, max_side=THUMB_SIZE,
+                workers=None, report_every=30.0):
+    """Run the pool over every frame of the chosen nights; returns the status counts."""
+    jobs = ((path, max_side) for path in iter_frames(kinds, nights, recent_days))
+    return run_pool(process_one, jobs, name=lambda job: job[0],
+                    workers=workers, report_every=report_every, unit="frames")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-render frame thumbnails for new nights.")
+    parser.add_argument("nights", nargs="*",
+                        help="date_dir names (default: nights with new frames in the last --recent-days)")
+    parser.add_argument("--recent-days", type=float, default=2.0)
+    parser.add_argument("--kind", choices=KINDS + ("both",), default="red")
+    parser.add_argument("--size", type=int, default=THUMB_SIZE,
+                        help="longest thumbnail side in pixels (must match the viewers' ?size=)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    kinds = KINDS if args.kind == "both" else (args.kind,)
+    counts = pregenerate(kinds=kinds, nights=args.nights or None,
+                         recent_days=args.recent_days, max_side=args.size,
+                         workers=args.workers)
+    print("Thumbnail cache updated: " +
+          ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# bench_lightcurve_binning.py
+#
+# Compares the old list-based "fast" binning of load_lightcurve_arrays with
+# the vectorized lcbin engine on synthetic stitched-lightcurve tables, and
+# checks that both produce identical fast/full dicts.
+#
+#   python scripts/bench_lightcurve_binning.py [--sizes 20000 200000 1000000]
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from astropy.io import fits
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lcbin import bin_lightcurve, native_column, to_lists   # noqa: E402
+
+
+def make_table(n, seed=0):
+    """Stitched-lightcurve-like FITS table with n rows (big-endian, like on disk)."""
+    rng = np.random.default_rng(seed)
+    cols = [fits.Column(name="TIME", format="D", array=np.sort(rng.uniform(0, 400, n)))]
+    for base in ("FITMAG", "EPD", "TFA"):
+        for i in range(3):
+            cols.append(fits.Column(name=f"{base}{i}", format="D",
+                                    array=12 + rng.normal(0, 0.01, n)))
+    for i in range(3):
+        cols.append(fits.Column(name=f"ERR{i}", format="E", array=rng.uniform(0.001, 0.02, n)))
+        cols.append(fits.Column(name=f"FLAG{i}", format="J", array=rng.integers(0, 4, n)))
+    cols.append(fits.Column(name="HA", format="E", array=rng.uniform(-4, 4, n)))
+    cols.append(fits.Column(name="Z", format="E", array=rng.uniform(0, 60, n)))
+    cols.append(fits.Column(name="FRAMEKEY", format="20A",
+                            array=np.array([f"1-{k:07d}_5" for k in range(n)])))
+    return fits.BinTableHDU.from_columns(cols).data
+
+
+def legacy(tab, max_points_fast):
+    """The pre-vectorization code path, verbatim in substance."""
+    names = [n.upper() for n in tab.names]
+    time_full = tab["TIME"].astype(float).tolist()
+    series_full, meta_full = {}, {}
+    for base in ("FITMAG", "EPD", "TFA"):
+        for i in range(3):
+            mag_key = f"{base}{i}"
+            if mag_key in names:
+                series_full[mag_key] = tab[mag_key].astype(float).tolist()
+                err_key, flag_key = f"ERR{i}", f"FLAG{i}"
+                meta_full[err_key] = (tab[err_key].astype(float).tolist()
+                                      if err_key in names else None)
+                meta_full[flag_key] = (tab[flag_key].astype(int).tolist()
+                                       if flag_key in names else None)
+    for col in ("HA", "Z", "FRAMEKEY"):
+        if col in names:
+            meta_full[col] = tab[col].tolist()
+
+    def median_bin(arr, step):
+        return [float(np.median(arr[i:i+step])) for i in range(0, len(arr), step)]
+
+    if len(time_full) > max_points_fast:
+        step = int(np.ceil(len(time_full) / max_points_fast))
+        time_fast = [float(np.mean(time_full[i:i+step])) for i in range(0, len(time_full), step)]
+        series_fast = {k: median_bin(v, step) for k, v in series_full.items()}
+        meta_fast = {}
+        for k, arr in meta_full.items():
+            if arr is None:
+                meta_fast[k] = None
+                continue
+            try:
+                float(arr[0])
+                meta_fast[k] = median_bin(arr, step)
+            except Exception:
+                meta_fast[k] = arr
+    else:
+        time_fast, series_fast, meta_fast = time_full, series_full, meta_full
+    return ({"fast": {"time": time_fast, "series": series_fast},
+             "full": {"time": time_full, "series": series_full}},
+            {"fast": meta_fast, "full": meta_full})
+
+
+def vectorized(tab, max_points_fast):
+    """Same steps as load_lightcurve_columns takes, packaged as lists."""
+    names = [n.upper() for n in tab.names]
+    time_full = np.asarray(tab["TIME"], dtype=float)
+    series_full, meta_full = {}, {}
+    for base in ("FITMAG", "EPD", "TFA"):
+        for i in range(3):
+            mag_key = f"{base}{i}"
+            if mag_key in names:
+                series_full[mag_key] = np.asarray(tab[mag_key], dtype=float)
+                err_key, flag_key = f"ERR{i}", f"FLAG{i}"
+                meta_full[err_key] = (np.asarray(tab[err_key], dtype=float)
+                                      if err_key in names else None)
+                meta_full[flag_key] = (np.asarray(tab[flag_key]).astype(int)
+                                       if flag_key in names else None)
+    for col in ("HA", "Z", "FRAMEKEY"):
+        if col in names:
+            meta_full[col] = native_column(tab[col])
+
+    time_fast, series_fast, meta_fast = bin_lightcurve(
+        time_full, series_full, meta_full, max_points_fast)
+    return ({"fast": {"time": time_fast.tolist(), "series": to_lists(series_fast)},
+             "full": {"time": time_full.tolist(), "series": to_lists(series_full)}},
+            {"fast": to_lists(meta_fast), "full": to_lists(meta_full)})
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20000, 200000, 1000000])
+    parser.add_argument("--max-points-fast", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} {'legacy [s]':>11} {'vectorized [s]':>15} {'speed-up':>9}  identical")
+    for n in args.sizes:
+        tab = make_table(n)
+        t_old, out_old = best_of(lambda: legacy(tab, args.max_points_fast), args.repeat)
+        t_new, out_new = best_of(lambda: vectorized(tab, args.max_points_fast), args.repeat)
+        same = out_old == out_new
+        print(f"{n:>9} {t_old:>11.3f} {t_new:>15.3f} {t_old / t_new:>8.1f}x  {same}")
+        if not same:
+            sys.exit(f"output mismatch at {n} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+# searchcache.py
+#
+# Cache of coordinate-search results (the list returned by
+# query_frames_by_coordinate), keyed on rounded RA/DEC + date filter.
+#
+# Backends (HATPI_SEARCH_CACHE):
+#   sqlite:////path/cache.db   one file shared by every worker on the host
+#                              (default: cache/search.sqlite next to this file)
+#   memory                     per-worker dict
+#   redis://host:6379/0        Redis or any Redis-compatible server
+#   off                        disabled
+#
+# Every entry is tagged with the star-catalog fields it covers, so an
+# ingest job can drop exactly the searches that new frames could change:
+#     searchcache.get_search_cache().invalidate_fields(["G1234", ...])
+# That only works for a backend the ingest job shares with the web workers;
+# a `memory` cache never sees it, so its entries expire after
+# MEMORY_TTL seconds instead (unless HATPI_SEARCH_CACHE_TTL says otherwise).
+# On top of that the web app keys each search on the ingest state of its
+# candidate fields (frame / solved counts, highest FNUM), so frames
+# ingested without any invalidation still turn older entries into misses.
+#
+# Backend errors (a locked SQLite file, a full disk, Redis down) count as
+# a miss or a skipped store, never as a failed search.
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+
+DEFAULT_BACKEND = "sqlite:///" + os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "cache", "search.sqlite")
+DEFAULT_TTL = 86400.0
+MEMORY_TTL  = 300.0            # memory backend: invalidation cannot reach it
+
+log = logging.getLogger("hatpi.search")
+
+
+def search_key(ra_deg, dec_deg, date_type, date_min, date_max, decimals=5, extra=()):
+    """
+    Cache key for one search; RA/DEC rounded to `decimals` places.
+    `extra` carries any other parameter the result depends on.
+    """
+    def _bound(v):
+        return v.isoformat() if hasattr(v, "isoformat") else v
+    return json.dumps([round(float(ra_deg) % 360.0, decimals), round(float(dec_deg), decimals),
+                       date_type, _bound(date_min), _bound(date_max), list(extra)])
+
+
+def _pack(frames):
+    return zlib.compress(json.dumps(frames, separators=(",", ":")).encode(), 1)
+
+
+def _unpack(blob):
+    return json.loads(zlib.decompress(blob))
+
+
+class MemoryBackend:
+    """Per-process LRU; invalidation only reaches this worker."""
+
+    shared = False
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()      # key -> (expires, fields, blob)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def set(self, key, blob, fields, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, frozenset(fields), blob)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_fields(self, fields):
+        fields = set(fields)
+        with self._lock:
+            stale = [k for k, (_, f, _) in self._entries.items() if f & fields]
+            for k in stale:
+                del self._entries[k]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SqliteBackend:
+    """Single SQLite file (WAL mode) shared by all workers on one host."""
+
+    shared = True
+
+    def __init__(self, path, max_entries=5000):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_entries = max_entries
+        with self._connect() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("""CREATE TABLE IF NOT EXISTS search_results (
+                               key     TEXT PRIMARY KEY,
+                               expires REAL NOT NULL,
+                               value   BLOB NOT NULL)""")
+            con.execute("""CREATE TABLE IF NOT EXISTS search_result_fields (
+                               key   TEXT NOT NULL,
+                               field TEXT NOT NULL)""")
+            con.execute("CREATE INDEX IF NOT EXISTS ix_srf_field ON search_result_fields(field)")
+            con.execute("CREATE INDEX IF NOT EXISTS ix_srf_key ON search_result_fields(key)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key):
+        with self._connect() as con:
+            row = con.execute("SELECT value FROM search_results WHERE key = ? AND expires >= ?",
+                              (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, blob, fields, ttl):
+        now = time.time()
+        with self._connect() as con:
+            con.execute("INSERT OR REPLACE INTO search_results VALUES (?, ?, ?)",
+                        (key, now + ttl, blob))
+            con.execute("DELETE FROM search_result_fields WHERE key = ?", (key,))
+            con.executemany("INSERT INTO search_result_fields VALUES (?, ?)",
+                            [(key, f) for f in set(fields)])
+            # keep the file bounded: expired first, then the oldest expiries
+            con.execute("DELETE FROM search_results WHERE expires < ?", (now,))
+            con.execute("""DELETE FROM search_results WHERE key IN (
+                               SELECT key FROM search_results ORDER BY expires DESC
+                               LIMIT -1 OFFSET ?)""", (self.max_entries,))
+            con.execute("""DELETE FROM search_result_fields
+                           WHERE key NOT IN (SELECT key FROM search_results)""")
+
+    def invalidate_fields(self, fields):
+        fields = list(set(fields))
+        if not fields:
+            return 0
+        marks = ",".join("?" * len(fields))
+        with self._connect() as con:
+            keys = [r[0] for r in con.execute(
+                f"SELECT DISTINCT key FROM search_result_fields WHERE field IN ({marks})", fields)]
+            con.executemany("DELETE FROM search_results WHERE key = ?", [(k,) for k in keys])
+            con.executemany("DELETE FROM search_result_fields WHERE key = ?", [(k,) for k in keys])
+        return len(keys)
+
+    def clear(self):
+        with self._connect() as con:
+            con.execute("DELETE FROM search_results")
+            con.execute("DELETE FROM search_result_fields")
+
+
+class RedisBackend:
+    """Redis-compatible server; needs the optional `redis` package."""
+
+    PREFIX = "hatpi:search:"
+    shared = True
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError("HATPI_SEARCH_CACHE=redis://... needs the 'redis' package") from exc
+        self._r = redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self._r.get(self.PREFIX + "v:" + key)
+
+    def set(self, key, blob, fields, ttl):
+        pipe = self._r.pipeline()
+        pipe.set(self.PREFIX + "v:" + key, blob, ex=int(ttl))
+        for f in set(fields):
+            pipe.sadd(self.PREFIX + "f:" + f, key)
+            pipe.expire(self.PREFIX + "f:" + f, int(ttl))
+        pipe.execute()
+
+    def invalidate_fields(self, fields):
+        n = 0
+        for f in set(fields):
+            fkey = self.PREFIX + "f:" + f
+            keys = [k.decode() for k in self._r.smembers(fkey)]
+            if keys:
+                n += self._r.delete(*[self.PREFIX + "v:" + k for k in keys])
+            self._r.delete(fkey)
+        return n
+
+    def clear(self):
+        keys = list(self._r.scan_iter(self.PREFIX + "*"))
+        if keys:
+            self._r.delete(*keys)
+
+
+class SearchCache:
+    """Backend-agnostic front: JSON+zlib values, hit/miss counters."""
+
+    def __init__(self, backend, ttl=DEFAULT_TTL, decimals=5):
+        self.backend  = backend
+        self.ttl      = ttl
+        self.decimals = decimals
+        self.hits = self.misses = self.errors = 0
+
+    def key(self, ra_deg, dec_deg, date_type, date_min, date_max, extra=()):
+        return search_key(ra_deg, dec_deg, date_type, date_min, date_max,
+                          self.decimals, extra)
+
+    def get(self, key):
+        """Cached frame list, or None."""
+        if self.backend is None:
+            return None
+        try:
+            blob = self.backend.get(key)
+        except Exception as exc:       # locked / unreachable backend: a miss
+            self.errors += 1
+            log.warning("search cache get failed: %s", exc)
+            blob = None
+        if blob is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return _unpack(blob)
+
+    def set(self, key, frames, fields):
+        if self.backend is None:
+            return
+        try:
+            self.backend.set(key, _pack(frames), fields, self.ttl)
+        except Exception as exc:       # locked backend, full disk: skip the store
+            self.errors += 1
+            log.warning("search cache set failed: %s", exc)
+
+    @property
+    def shared(self):
+        """True when invalidate_fields reaches every worker's cache."""
+        return self.backend is None or self.backend.shared
+
+    def invalidate_fields(self, fields):
+        """Drop every cached search touching any of `fields`; returns the count."""
+        return 0 if self.backend is None else self.backend.invalidate_fields(fields)
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self):
+        return {
+            "backend": type(self.backend).__name__ if self.backend else None,
+            "ttl":     self.ttl,
+            "hits":    self.hits,
+            "misses":  self.misses,
+            "errors":  self.errors,
+        }
+
+
+def make_backend(spec):
+    """Backend from a HATPI_SEARCH_CACHE value (see module header)."""
+    spec = (spec or DEFAULT_BACKEND).strip()
+    if spec in ("off", "none", ""):
+        return None
+    if spec == "memory":
+        return MemoryBackend(int(os.environ.get("HATPI_SEARCH_CACHE_SIZE", "256")))
+    if spec.startswith("sqlite:///"):
+        return SqliteBackend(spec[len("sqlite:///"):])
+    if spec.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(spec)
+    raise ValueError(f"Unknown HATPI_SEARCH_CACHE backend: {spec!r}")
+
+
+_search_cache = None
+_search_cache_lock = threading.Lock()
+
+
+def get_search_cache():
+    """Process-wide SearchCache configured from the environment."""
+    global _search_cache
+    with _search_cache_lock:
+        if _search_cache is None:
+            backend = make_backend(os.environ.get("HATPI_SEARCH_CACHE", DEFAULT_BACKEND))
+            ttl = os.environ.get("HATPI_SEARCH_CACHE_TTL")
+            if backend is not None and not backend.shared:
+                log.warning("HATPI_SEARCH_CACHE=memory: footprint / ingest invalidation "
+                            "cannot reach this worker, cached searches live %s s",
+                            ttl or MEMORY_TTL)
+                ttl = ttl or MEMORY_TTL
+            _search_cache = SearchCache(backend, ttl=float(ttl or DEFAULT_TTL))
+        return _search_cache
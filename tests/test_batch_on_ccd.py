@@ -0,0 +1,86 @@
+# Batched frame test (mywcs.batch_on_ccd, used by the frame search)
+# against the per-frame astropy check it replaced, on SIP WCSs: positions
+# on a pixel grid that straddles the CCD edges for every frame, plus sky
+# positions far from (and behind) the frames, at several margins.
+import numpy as np
+import pytest
+from astropy.wcs import NoConvergence
+
+from mywcs import batch_on_ccd, create_wcs, stack_wcs_pars
+
+EXTENT = (0, 2048, 0, 2048)
+MARGINS = [0, 30, 100, -50]
+SCALE = 10.0 / 3600.0           # deg / pixel
+
+
+def check_coordinate_on_ccd(ra_deg, dec_deg, wcs, margin=0, extent=EXTENT):
+    """The per-frame reference: one astropy all_world2pix per frame."""
+    try:
+        xpix, ypix = wcs.all_world2pix(ra_deg, dec_deg, 1)
+    except NoConvergence:
+        return False
+
+    if np.isnan(xpix) or np.isnan(ypix):
+        return False
+
+    return (
+        (extent[0] - margin) < xpix < (extent[1] + margin)
+        and (extent[2] - margin) < ypix < (extent[3] + margin)
+    )
+
+
+def _frames():
+    """(crval, crpix, cd, sip) of SIP frames: rotated, near a pole, across RA = 0."""
+    out = []
+    for (ra, dec), angle, order in [((120.0, 30.0), 0.0, 2),
+                                    ((359.8, -10.0), 25.0, 3),
+                                    ((45.0, 88.5), -60.0, 3),
+                                    ((250.0, -65.0), 90.0, 4)]:
+        c, s = np.cos(np.radians(angle)), np.sin(np.radians(angle))
+        cd = SCALE * np.array([[-c, s], [s, c]])
+        sip_a = np.zeros((order + 1, order + 1))
+        sip_b = np.zeros((order + 1, order + 1))
+        sip_a[2, 0], sip_a[0, 2], sip_b[1, 1] = 2e-6, -1.5e-6, 3e-6
+        if order >= 3:
+            sip_a[1, 2], sip_b[3, 0] = 4e-10, -6e-10
+        if order >= 4:
+            sip_a[2, 2], sip_b[0, 4] = 1e-13, 2e-13
+        out.append(((ra, dec), (1024.0, 1024.0), cd, (sip_a, sip_b)))
+    return out
+
+
+def _positions(wcs):
+    """
+    Sky positions of a coarse pixel grid around the CCD, plus lines just
+    inside and just outside every bound tested.
+    """
+    coarse = np.arange(-237.3, 2300.0, 211.1)
+    bounds = [b for m in MARGINS for b in (EXTENT[0] - m, EXTENT[1] + m)]
+    edges = np.concatenate([np.array(bounds) - 0.5, np.array(bounds) + 0.5])
+    xy = [np.meshgrid(coarse, coarse), np.meshgrid(edges, coarse[::3]),
+          np.meshgrid(coarse[::3], edges)]
+    x = np.concatenate([xx.ravel() for xx, _ in xy])
+    y = np.concatenate([yy.ravel() for _, yy in xy])
+    ra, dec = wcs.all_pix2world(x, y, 1)
+    crval_ra, crval_dec = wcs.wcs.crval
+    far_ra = [crval_ra + 180.0, crval_ra + 15.0, crval_ra]
+    far_dec = [-crval_dec, crval_dec, np.clip(crval_dec - 12.0, -90.0, 90.0)]
+    return np.concatenate([ra, far_ra]) % 360.0, np.concatenate([dec, far_dec])
+
+
+@pytest.mark.filterwarnings("ignore:All-NaN slice")
+@pytest.mark.parametrize("margin", MARGINS)
+def test_batch_on_ccd_matches_per_frame_astropy(margin):
+    pars = _frames()
+    stacked = stack_wcs_pars(pars)
+    wcss = [create_wcs(*p) for p in pars]
+
+    hits = 0
+    for wcs in wcss:
+        for ra, dec in zip(*_positions(wcs)):
+            expected = [bool(check_coordinate_on_ccd(ra, dec, w, margin=margin))
+                        for w in wcss]
+            got = batch_on_ccd(ra, dec, stacked, margin=margin, extent=EXTENT)
+            assert got.tolist() == expected, (ra, dec)
+            hits += sum(expected)
+    assert hits                                  # the grid does land on frames
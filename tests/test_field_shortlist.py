@@ -0,0 +1,65 @@
+# Batched field shortlist (mywcs.simple_tan_on_ccd, used by
+# query_fields_by_coordinate) against the original per-field loop over
+# create_simple_wcs, on a grid of sky positions that includes the poles
+# and the RA = 0/360 wrap.
+import numpy as np
+import pytest
+from astropy.wcs import NoConvergence
+
+from mywcs import create_simple_wcs, simple_tan_on_ccd
+
+MARGIN = 100
+EXTENT = (0, 2048, 0, 2048)
+
+
+def _field_grid():
+    ra = np.concatenate([np.arange(0.0, 360.0, 15.0), [359.7, 0.2]])
+    dec = np.concatenate([np.arange(-80.0, 81.0, 20.0), [-90.0, -89.6, 89.6, 90.0]])
+    rr, dd = np.meshgrid(ra, dec)
+    return rr.ravel(), dd.ravel()
+
+
+def _position_grid():
+    ra = np.concatenate([np.arange(0.0, 360.0, 2.5), [359.95, 0.05]])
+    dec = np.concatenate([np.arange(-88.0, 89.0, 4.0), [-90.0, -89.9, 89.9, 90.0]])
+    rr, dd = np.meshgrid(ra, dec)
+    return rr.ravel(), dd.ravel()
+
+
+def _loop_on_ccd(ra, dec, field_ra, field_dec):
+    """The pre-vectorization shortlist: one astropy WCS per field."""
+    out = np.zeros((len(ra), len(field_ra)), dtype=bool)
+    for j, (fra, fdec) in enumerate(zip(field_ra, field_dec)):
+        wcs = create_simple_wcs((fra, fdec))
+        try:
+            xpix, ypix = wcs.all_world2pix(ra, dec, 1)
+        except NoConvergence:
+            continue
+        with np.errstate(invalid="ignore"):
+            out[:, j] = (((EXTENT[0] - MARGIN) < xpix) & (xpix < (EXTENT[1] + MARGIN))
+                         & ((EXTENT[2] - MARGIN) < ypix) & (ypix < (EXTENT[3] + MARGIN)))
+    return out
+
+
+def test_batched_shortlist_matches_per_field_loop():
+    field_ra, field_dec = _field_grid()
+    ra, dec = _position_grid()
+
+    expected = _loop_on_ccd(ra, dec, field_ra, field_dec)
+    got = np.array([simple_tan_on_ccd(r, d, field_ra, field_dec, margin=MARGIN, extent=EXTENT)
+                    for r, d in zip(ra, dec)])
+
+    assert expected.any()                        # the grid does hit fields
+    np.testing.assert_array_equal(got, expected)
+
+
+@pytest.mark.parametrize("ra, dec, field_ra, field_dec", [
+    (359.9, 10.0, 0.1, 10.0),        # across the RA wrap
+    (0.1, -30.0, 359.8, -30.0),
+    (123.0, 89.95, 300.0, 89.9),     # around the north pole
+    (10.0, -90.0, 200.0, -89.8),     # on the south pole
+])
+def test_wrap_and_pole_fields_are_found(ra, dec, field_ra, field_dec):
+    fra, fdec = np.array([field_ra]), np.array([field_dec])
+    assert simple_tan_on_ccd(ra, dec, fra, fdec, margin=MARGIN, extent=EXTENT)[0]
+    assert _loop_on_ccd(np.array([ra]), np.array([dec]), fra, fdec)[0, 0]
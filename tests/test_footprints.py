@@ -0,0 +1,124 @@
+# Incremental footprint indexing (footprints.build_footprint_index) and
+# the search side of it (coverage / lookup_frames) on SQLite stand-ins for
+# HPCALIB and the index: frames solved out of FNUM order, re-solved
+# frames, frames that lose their solution and frames without a cap.
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import footprints
+import models
+
+SCALE = 10.0 / 3600.0           # deg / pixel
+
+
+class _NoCache:
+    shared = True
+
+    def invalidate_fields(self, fields):
+        self.fields = set(fields)
+        return 0
+
+
+@pytest.fixture
+def dbs(tmp_path, monkeypatch):
+    hp_engine = create_engine(f"sqlite:///{tmp_path / 'hpcalib.sqlite'}")
+    models.Base.metadata.create_all(hp_engine)
+    fp_engine = create_engine(f"sqlite:///{tmp_path / 'footprints.sqlite'}")
+
+    cache = _NoCache()
+    monkeypatch.setattr(footprints, "SessionLocal", sessionmaker(bind=hp_engine))
+    monkeypatch.setattr(footprints, "footprint_engine", fp_engine)
+    monkeypatch.setattr(footprints, "FootprintSession", sessionmaker(bind=fp_engine))
+    monkeypatch.setattr(footprints, "get_search_cache", lambda: cache)
+    return sessionmaker(bind=hp_engine), cache
+
+
+def _solve(session, fnum, ra, dec, ihuid=1, field="F001"):
+    ast = session.get(models.Astrometry, (ihuid, fnum))
+    if ast is None:
+        ast = models.Astrometry(IHUID=ihuid, FNUM=fnum)
+        session.add(ast)
+        session.add(models.Frame(IHUID=ihuid, FNUM=fnum, OBJECT=field, IMAGETYP="object"))
+    ast.exit_code = 0
+    ast.CRVAL1, ast.CRVAL2 = ra, dec
+    ast.CRPIX1 = ast.CRPIX2 = 1024.0
+    ast.CD1_1, ast.CD1_2, ast.CD2_1, ast.CD2_2 = -SCALE, 0.0, 0.0, SCALE
+    ast.A = ast.B = "[[0, 0], [0, 0]]"
+    session.commit()
+
+
+def test_out_of_order_solve_is_indexed(dbs):
+    Session, _ = dbs
+    with Session() as s:
+        _solve(s, 10, 120.0, 30.0)
+    assert footprints.build_footprint_index() == 1
+
+    # FNUM 5 is solved after FNUM 10 was already indexed
+    with Session() as s:
+        _solve(s, 5, 200.0, -20.0)
+    assert footprints.build_footprint_index() == 1
+    assert footprints.lookup_frames(200.0, -20.0) == [(1, 5)]
+
+    # nothing changed: nothing to do
+    assert footprints.build_footprint_index() == 0
+
+
+def test_resolved_and_unsolved_frames(dbs):
+    Session, cache = dbs
+    with Session() as s:
+        _solve(s, 1, 120.0, 30.0)
+        _solve(s, 2, 60.0, 10.0, field="F002")
+    assert footprints.build_footprint_index() == 2
+
+    with Session() as s:
+        _solve(s, 1, 125.0, 35.0)                          # re-solved elsewhere
+        s.get(models.Astrometry, (1, 2)).exit_code = 1     # solution withdrawn
+        s.commit()
+    assert footprints.build_footprint_index() == 1
+    assert footprints.lookup_frames(125.0, 35.0) == [(1, 1)]
+    assert footprints.lookup_frames(120.0 - 5.0 / np.cos(np.radians(30.0)), 30.0) == []
+    assert footprints.lookup_frames(60.0, 10.0) == []
+    assert cache.fields == {"F001", "F002"}
+
+
+def test_search_covers_solves_since_the_last_update(dbs):
+    Session, _ = dbs
+    with Session() as s:
+        _solve(s, 10, 120.0, 30.0)
+        _solve(s, 20, 60.0, 10.0, field="F002")
+    footprints.build_footprint_index()
+    assert footprints.coverage(["F001", "F002"]) == ([], [])
+
+    # solved below the IHU's highest indexed FNUM, index not updated yet:
+    # the field has to be searched in full, and only that field
+    with Session() as s:
+        _solve(s, 5, 121.0, 31.0)
+    assert footprints.coverage(["F001", "F002"]) == (["F001"], [])
+    assert footprints.lookup_frames(120.0, 30.0, skip_fields=["F001"]) == []
+    assert footprints.lookup_frames(60.0, 10.0, skip_fields=["F001"]) == [(1, 20)]
+
+    footprints.build_footprint_index()
+    assert footprints.coverage(["F001", "F002"]) == ([], [])
+    assert sorted(footprints.lookup_frames(120.5, 30.5)) == [(1, 5), (1, 10)]
+
+
+def test_frames_without_a_cap_reach_the_search(dbs, monkeypatch):
+    Session, _ = dbs
+    with Session() as s:
+        _solve(s, 1, 120.0, 30.0)
+        _solve(s, 2, 120.0, 30.0)
+
+    caps = footprints.footprint_caps
+
+    def no_cap_for_second(pars):
+        ra, dec, radius = caps(pars)
+        radius[1:] = np.nan
+        return ra, dec, radius
+
+    monkeypatch.setattr(footprints, "footprint_caps", no_cap_for_second)
+    assert footprints.build_footprint_index() == 2
+    assert footprints.lookup_frames(120.0, 30.0) == [(1, 1)]
+    assert footprints.coverage(["F001"]) == ([], [(1, 2)])
+    assert footprints.build_footprint_index() == 0
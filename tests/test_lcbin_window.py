@@ -0,0 +1,43 @@
+# Time windows of stitched lightcurves (lcbin.read_lightcurve_window /
+# count_window_rows): bisection on a sorted time column, mask on one that
+# is out of order or holds NaN.
+import numpy as np
+import pytest
+from astropy.io import fits
+
+import lcbin
+
+
+def _write_lc(path, time):
+    mag = np.arange(len(time), dtype=float)
+    fits.BinTableHDU.from_columns([
+        fits.Column(name="TIME", format="D", array=np.asarray(time, dtype=float)),
+        fits.Column(name="TFA0", format="D", array=mag),
+    ]).writeto(path)
+    return str(path)
+
+
+@pytest.mark.parametrize("time", [
+    np.arange(100.0),                                           # sorted
+    np.concatenate([np.arange(50.0, 100.0), np.arange(50.0)]),  # two unsorted runs
+    np.where(np.arange(100) == 30, np.nan, np.arange(100.0)),   # NaN
+])
+def test_window_matches_mask(tmp_path, time):
+    path = _write_lc(tmp_path / "lc.fits", time)
+    for tmin, tmax in [(20.0, 40.0), (None, 10.5), (95.5, None), (200.0, 300.0)]:
+        keep = np.ones(len(time), dtype=bool)
+        if tmin is not None:
+            keep &= time >= tmin
+        if tmax is not None:
+            keep &= time <= tmax
+
+        t, series, _ = lcbin.read_lightcurve_window(path, tmin, tmax)
+        assert np.array_equal(t, time[keep])
+        assert np.array_equal(series["TFA0"], np.flatnonzero(keep))
+        assert lcbin.count_window_rows(path, tmin, tmax) == keep.sum()
+
+
+def test_time_is_sorted(tmp_path):
+    assert lcbin.time_is_sorted(_write_lc(tmp_path / "up.fits", np.arange(10.0)))
+    assert lcbin.time_is_sorted(_write_lc(tmp_path / "flat.fits", np.zeros(10)))
+    assert not lcbin.time_is_sorted(_write_lc(tmp_path / "down.fits", np.arange(10.0)[::-1]))